@@ -0,0 +1,139 @@
+"""Create STAC Collections and Items files."""
+
+import itertools
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+import click
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from crawler import discover, fetch, jsonio, metrics, options, pipeline, tiff, transform  # noqa: E402
+from crawler.checkpoint import Checkpoint  # noqa: E402
+from crawler.collection import CollectionSummary  # noqa: E402
+from crawler.index import IdIndex  # noqa: E402
+from crawler.output import open_output  # noqa: E402
+
+COG_MEDIA_TYPE = "image/tiff; application=geotiff; profile=cloud-optimized"
+PROJECTION_EXTENSION = "https://stac-extensions.github.io/projection/v1.1.0/schema.json"
+# every tile has its own prefix (~26k), so the bucket is listed by
+# latitude band instead: ~180 single page listings, in parallel
+LATITUDE_PREFIXES = [f"Copernicus_DSM_COG_10_{hemisphere}{lat:02d}_" for hemisphere in "NS" for lat in range(91)]
+
+
+def _item_id(url: str) -> str:
+    # Copernicus_DSM_COG_10_N00_00_E009_00_DEM.tif -> 10_N00_00_E009_00
+    name = url.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    return re.sub(r"^Copernicus_DSM_COG_|_DEM$", "", name)
+
+
+def create_item(url: str, header: tiff.Header, collection_id: str, datetime: str) -> Dict:
+    """Copernicus DEM Item, as `rio stac` creates it (without proj:geometry/proj:bbox)."""
+    if header.epsg != 4326:
+        raise ValueError(f"{url}: unsupported CRS EPSG:{header.epsg}")
+
+    minx, miny, maxx, maxy = header.bbox
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "id": _item_id(url),
+        "properties": {
+            "proj:epsg": header.epsg,
+            "proj:shape": header.shape,
+            "proj:transform": [*header.transform, 0.0, 0.0, 1.0],
+            "datetime": datetime,
+        },
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]],
+        },
+        "links": [{"rel": "collection", "href": collection_id, "type": "application/json"}],
+        "assets": {
+            "dem": {"href": url, "type": COG_MEDIA_TYPE, "roles": []},
+        },
+        "bbox": [minx, miny, maxx, maxy],
+        "stac_extensions": [PROJECTION_EXTENSION],
+        "collection": collection_id,
+    }
+
+
+@metrics.timed("fetch")
+def _read_header(url: str) -> Tuple[str, tiff.Header]:
+    return url, tiff.read_header(url)
+
+
+@click.command()
+@click.option("--prefix", type=str, default="s3://copernicus-dem-30m/", help="List the DEM files under this S3 prefix.")
+@click.option("--list", "list_path", type=str, help="Read the DEM file URLs from this file instead of listing --prefix.")
+@click.option("--collections", "collections_path", type=str, default="collections.json")
+@click.option("--items", "items_path", type=str, default="items.json")
+@click.option("--collection-id", type=str, default="copernicus-dem")
+@click.option("--datetime", type=str, default="2022-05-09T00:00:00Z", help="Items datetime.")
+@click.option("--with-s3-urls/--without-s3-url", type=bool, default=True)
+@click.option("--concurrency", type=int, default=100, help="Number of files read in parallel.")
+@options.checkpoint_options
+@options.output_options
+@options.metrics_options
+def main(prefix, list_path, collections_path, items_path, collection_id, datetime, with_s3_urls, concurrency, checkpoint_path, index_path, dsn, method, batch_size, shard_by, shard_size, compression, writers, geoparquet_path, metrics_path, prometheus_path):
+    fetch.configure(max_connections=concurrency)
+    metrics.export(metrics_path, prometheus_path)
+
+    if Path(collections_path).exists():
+        with open(collections_path, "rb") as f:
+            if collection_id in [jsonio.loads(l).get("id") for l in f]:
+                print(f"{collection_id} collection already found in {collections_path}")
+                return
+
+    if list_path:
+        with open(list_path, "r") as fin:
+            urls = [discover.http_url(f.strip()) for f in fin if f.strip()]
+    else:
+        # a bucket root, or a sub prefix listed in full
+        prefixes = LATITUDE_PREFIXES if not discover.parse(prefix).prefix else None
+        urls = discover.list_urls(prefix, suffix="_DEM.tif", exclude=(), depth=0, prefixes=prefixes, max_workers=concurrency)
+
+    checkpoint_path = checkpoint_path or f"{items_path}.checkpoint"
+    summary = CollectionSummary()
+
+    with open_output(items_path, dsn, shard_by=shard_by, shard_size=shard_size, compression=compression, writers=writers, geoparquet=geoparquet_path, method=method, batch_size=batch_size) as f_itm, IdIndex(index_path) as index, Checkpoint(checkpoint_path, f_itm, on_commit=[index.save]) as checkpoint:
+        for item_dict in itertools.chain(checkpoint.items(collection_id), index.summaries(collection_id)):
+            summary.add(item_dict)
+
+        headers = pipeline.stream(
+            _read_header,
+            (url for url in metrics.iterate("walk", urls) if url not in checkpoint and url not in index),
+            max_workers=concurrency,
+        )
+        with click.progressbar(headers, show_pos=True) as bar:
+            for url, header in bar:
+                item_dict = create_item(url, header, collection_id, datetime)
+                item_dict = transform.copernicus_dem_item(item_dict, collection_id, with_s3_urls)
+                if not index.add(url, item_dict):
+                    continue
+
+                summary.add(item_dict)
+                f_itm.write(item_dict)
+                checkpoint.add(url, item_dict)
+                metrics.incr("items_total", collection=collection_id)
+
+    with open(Path(__file__).parent / "collection.json", "r") as f:
+        collection = json.load(f)
+
+    collection["id"] = collection_id
+    # all the Items share one datetime: keep the published interval, extended to the Items
+    start, end = collection["extent"]["temporal"]["interval"][0]
+    summary.add({"properties": {"start_datetime": start, "end_datetime": end}})
+    if summary.bbox:
+        collection["extent"]["spatial"]["bbox"] = [summary.bbox]
+    if any(summary.interval):
+        collection["extent"]["temporal"]["interval"] = [summary.interval]
+
+    with open_output(collections_path, dsn) as f_col:
+        f_col.write(collection)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,154 +1,118 @@
 """Create STAC Collections and Items files."""
 
-import json
-import time
-from concurrent import futures
-from typing import Any, Dict, Sequence, Type, Union, Tuple
+import sys
+from functools import partial
+from typing import Dict, Optional, Tuple
 from pathlib import Path
 
-import httpx
 import click
 import pystac
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
 
-def retry(
-    tries: int,
-    exceptions: Union[Type[Exception], Sequence[Type[Exception]]] = Exception,
-    delay: float = 0.0,
-):
-    """Retry Decorator"""
+from crawler import fetch, jsonio, metrics, options, pipeline, transform, traverse  # noqa: E402
+from crawler.cache import DocumentCache  # noqa: E402
+from crawler.checkpoint import Checkpoint  # noqa: E402
+from crawler.collection import CollectionSummary  # noqa: E402
+from crawler.index import IdIndex  # noqa: E402
+from crawler.output import open_output  # noqa: E402
+from crawler.sync import SyncState, SyncStacIO, check_outputs  # noqa: E402
 
-    def _decorator(func: Any):
-        def _newfn(*args: Any, **kwargs: Any):
 
-            attempt = 0
-            while attempt < tries:
-                try:
-                    return func(*args, **kwargs)
-                except exceptions:  # type: ignore
-                    attempt += 1
-                    time.sleep(delay)
+@metrics.timed("fetch")
+def get_item(url: str, state: Optional[SyncState] = None) -> Tuple[str, Optional[Dict], Dict]:
+    if state is None:
+        return url, fetch.get_json(url), {}
 
-            return func(*args, **kwargs)
+    return (url, *state.get_json(url))
 
-        return _newfn
 
-    return _decorator
+def _collection(collection: pystac.Collection, collection_id: str, summary: CollectionSummary, with_assets_extension: bool) -> Dict:
+    c = collection.to_dict()
+    c["links"] = []
+    c["id"] = collection_id
+    c["description"] = "LINZ OpenData | " + c["description"]
 
+    if with_assets_extension:
+        if not c.get("stac_extensions"):
+            c["stac_extensions"] = []
+        c["stac_extensions"].append("https://stac-extensions.github.io/item-assets/v1.0.0/schema.json")
+        c["item_assets"] = summary.item_assets
 
-@retry(tries=3, delay=1)
-def get_collection(url) -> pystac.Collection:
-    return pystac.Collection.from_file(url)
-
-
-@retry(tries=3, delay=1)
-def get_item(url: str) -> Tuple[str, Dict]:
-    resp = httpx.get(url)
-    resp.raise_for_status()
-    return url, resp.json()
+    return c
 
 
 @click.command()
+@click.option('--catalog', "catalog_url", type=str, default="https://nz-imagery.s3-ap-southeast-2.amazonaws.com/catalog.json", help="Root catalog URL.")
 @click.option('--collections', "collections_path", type=str, default="collections.json")
 @click.option('--items', "items_path", type=str, default="items.json")
 @click.option('--with-s3-urls/--without-s3-url', type=bool, default=False)
 @click.option('--with-assets-extension/--without-assets-extension', type=bool, default=False)
-def main(collections_path, items_path, with_s3_urls, with_assets_extension):
+@click.option('--concurrency', type=int, default=50, help="Number of Items fetched in parallel.")
+@click.option('--processes', type=int, default=0, help="Number of worker processes transforming the Items (default to inline).")
+@options.checkpoint_options
+@options.incremental_options
+@options.output_options
+@options.cache_options
+@options.metrics_options
+def main(catalog_url, collections_path, items_path, with_s3_urls, with_assets_extension, concurrency, processes, checkpoint_path, index_path, sync_path, dsn, method, batch_size, shard_by, shard_size, compression, writers, geoparquet_path, cache_path, cache_ttl, metrics_path, prometheus_path):
     click.echo("Connecting to static catalog...")
+    fetch.configure(max_connections=concurrency)
+    metrics.export(metrics_path, prometheus_path)
+
+    state = None
+    if sync_path:
+        state = SyncState(sync_path)
+        pystac.StacIO.set_default(lambda: SyncStacIO(state))
 
-    catalogs = pystac.Catalog.from_file(
-        "https://nz-imagery.s3-ap-southeast-2.amazonaws.com/catalog.json"
-    )
-    collection_links = [
-        link.absolute_href
-        for link in catalogs.get_child_links()
-    ]
+    cache = DocumentCache(cache_path, ttl=cache_ttl * 3600) if cache_path else None
+    read = partial(state.get_text, cache=cache) if state else partial(traverse.read_text, cache=cache)
 
-    with futures.ThreadPoolExecutor(max_workers=50) as executor:
-        collections = list(executor.map(get_collection, collection_links))
+    with metrics.timer("walk"):
+        catalog = traverse.read_node(catalog_url, read=read)
+        collections = [
+            node.to_pystac()
+            for node in traverse.children(catalog, read, max_workers=concurrency)
+        ]
 
     previous_col = []
     if Path(collections_path).exists():
-        with open(collections_path, "r") as f:
-            previous_col = [json.loads(l).get("id") for l in f.readlines()]
+        with open(collections_path, "rb") as f:
+            previous_col = [jsonio.loads(l).get("id") for l in f]
 
         print(f"{len(previous_col)} collections already found in {collections_path}")
 
-    with open(collections_path, "a") as f_col, open(items_path, "a") as f_itm:
-        for collection in collections:
-            collection_id = "LINZ_" + collection.id.replace("-","_")
-            if collection_id in previous_col:
-                continue
-
-            collection_assets = {}
-
-            print(f"Looking for Items in {collection_id} Collection")
-
-            items_links = [
-                link.absolute_href
-                for link in collection.get_item_links()
-            ]
-
-            with futures.ThreadPoolExecutor(max_workers=50) as executor:
-                future_to_item = [
-                    executor.submit(get_item, link) for link in items_links
-                ]
-                with click.progressbar(
-                    futures.as_completed(future_to_item),
-                    length=len(items_links),
-                    show_percent=True,
-                    show_pos=True,
-                ) as future:
-                    for res in future:
-                        url, item_dict = res.result()
-                        item_id = item_dict['id']
-                        root_path = url.replace(f"{item_id}.json", "")
-
-                        item_dict["links"] = []
-                        item_dict["collection"] = collection_id
-                        item_dict["id"] = item_id.replace("/", "_")
-                        if with_s3_urls:
-                            if "stac_extensions" not in item_dict:
-                                item_dict["stac_extensions"] = []
-
-                            item_dict["stac_extensions"].append("https://stac-extensions.github.io/alternate-assets/v1.1.0/schema.json")
-                            for asset in item_dict["assets"]:
-                                ori = item_dict["assets"][asset]["href"].replace("./", root_path)
-                                item_dict["assets"][asset]["href"] = ori.replace("https://nz-imagery.s3-ap-southeast-2.amazonaws.com", "s3://nz-imagery")
-                                item_dict["assets"][asset]["alternate"] = {
-                                    "public": {
-                                        "title": "Public Access",
-                                        "href": ori,
-                                    }
-                                }
-
-                        collection_assets.update(
-                            **{
-                                name: {
-                                    "type": values.get("type", "unknown"),
-                                    "title": values.get("title", name),
-                                    "roles": values.get("roles", ["data"]),
-                                }
-                                for name, values in item_dict["assets"].items()
-                            }
-                        )
-
-                        f_itm.write(json.dumps(item_dict) + "\n")
-
-            c = collection.to_dict()
-            c["links"] = []
-            c["id"] = collection_id
-            c["description"] = "LINZ OpenData | " + c["description"]
-
-            if with_assets_extension:
-                if not c.get("stac_extensions"):
-                    c["stac_extensions"] = []
-                c["stac_extensions"].append("https://stac-extensions.github.io/item-assets/v1.0.0/schema.json")
-                c["item_assets"] = collection_assets
-
-            f_col.write(json.dumps(c) + "\n")
-
-
+    jobs = []
+    for collection in collections:
+        collection_id = "LINZ_" + collection.id.replace("-","_")
+        if collection_id not in previous_col:
+            jobs.append((collection_id, collection))
+
+    checkpoint_path = checkpoint_path or f"{items_path}.checkpoint"
+
+    with open_output(collections_path, dsn) as f_col, open_output(items_path, dsn, shard_by=shard_by, shard_size=shard_size, compression=compression, writers=writers, geoparquet=geoparquet_path, method=method, batch_size=batch_size) as f_itm, IdIndex(index_path) as index, Checkpoint(checkpoint_path, f_itm, on_commit=[index.save]) as checkpoint:
+        if state:
+            check_outputs(checkpoint)
+
+        pipeline.crawl_collections(
+            jobs,
+            partial(get_item, state=state),
+            transform.Transform(transform.linz_item, with_s3_urls=with_s3_urls),
+            lambda collection_id, collection, summary: f_col.write(_collection(collection, collection_id, summary, with_assets_extension)),
+            f_itm,
+            checkpoint,
+            index,
+            state=state,
+            # without new Items, the Collection was already written by the previous incremental run
+            skip_unchanged=bool(state),
+            max_workers=concurrency,
+            processes=processes,
+        )
+
+    if state:
+        state.close()
+    if cache:
+        cache.close()
 
 
 if __name__ == '__main__':
@@ -1,10 +1,15 @@
-"""Create STAC Items file."""
+"""Create STAC Collection file."""
 
-import json
+import sys
 from copy import deepcopy
+from pathlib import Path
 
 import click
-import pystac
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from crawler import jsonio  # noqa: E402
+from crawler.collection import CollectionSummary  # noqa: E402
 
 template = {
     "type": "Collection",
@@ -45,41 +50,27 @@ template = {
 @click.option('--collection', "collection_id", type=str)
 @click.option('--output', "output_path", type=str, default="collections.json")
 def main(items_path, collection_id, output_path):
-    with open(items_path, "r") as fin:
-        items = [json.loads(f.strip("\n")) for f in fin.readlines()]
-
-    collection_assets = {}
-    for item in items:
-        collection_assets.update(
-            **{
-                name: {
-                    "type": values["type"],
-                    "title": values["title"],
-                    "roles": values.get("roles", ["data"]),
-                }
-                for name, values in item["assets"].items()
-            }
-        )
-
-    minx, miny, maxx, maxy = zip(*[x["bbox"] for x in items])
-    datetimes = [x["properties"]["datetime"] for x in items]
+    summary = CollectionSummary()
+    with open(items_path, "rb") as fin:
+        for line in fin:
+            summary.add(jsonio.loads(line))
 
     collection = deepcopy(template)
     collection["id"] = collection_id
     collection["title"] = collection_id
-    collection["item_assets"] = collection_assets
+    collection["item_assets"] = summary.item_assets
 
     collection["extent"]["spatial"]["bbox"] = [
-        [min(minx), min(miny), max(maxx), max(maxy)],
-        [min(minx), min(miny), max(maxx), max(maxy)],
+        summary.bbox,
+        summary.bbox,
     ]
 
     collection["extent"]["temporal"]["interval"] = [
-        [min(datetimes), max(datetimes)],
+        summary.interval,
     ]
 
-    with open(output_path, "w") as f:
-        f.write(json.dumps(collection))
+    with open(output_path, "wb") as f:
+        f.write(jsonio.dumps(collection))
 
 if __name__ == '__main__':
     main()
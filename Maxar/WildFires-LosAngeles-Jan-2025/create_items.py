@@ -1,43 +1,63 @@
 """Create STAC Items file."""
 
-import json
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
 
 import click
 import pystac
 
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from crawler import discover, fetch, metrics, options, pipeline, transform  # noqa: E402
+from crawler.checkpoint import Checkpoint  # noqa: E402
+from crawler.index import IdIndex  # noqa: E402
+from crawler.output import NdjsonWriter  # noqa: E402
+
 collection_id = "WildFires-LosAngeles-Jan-2025"
 
+
+def _get_item(url: str) -> Tuple[str, Dict]:
+    item = pystac.Item.from_file(url)
+    return url, item.make_asset_hrefs_absolute().to_dict()
+
+
 @click.command()
 @click.option('--list', "stac_path", type=str, default="list_items.txt")
+@click.option('--s3-prefix', type=str, help="List the Items under this prefix (e.g s3://maxar-opendata/events/WildFires-LosAngeles-Jan-2025/ard/11/) instead of reading --list.")
 @click.option('--output', "output_path", type=str, default="items.json")
 @click.option('--with-s3-urls/--without-s3-url', type=bool, default=False)
-def main(stac_path, output_path, with_s3_urls):
-    with open(stac_path, "r") as fin:
-        item_paths = [f for f in fin.readlines()]
-
-    with open(output_path, "a") as f_itm:
-        # Loop through each items
+@click.option('--concurrency', type=int, default=50, help="Number of Items fetched in parallel.")
+@options.checkpoint_options
+@options.metrics_options
+def main(stac_path, s3_prefix, output_path, with_s3_urls, concurrency, checkpoint_path, index_path, metrics_path, prometheus_path):
+    fetch.configure(max_connections=concurrency)
+    metrics.export(metrics_path, prometheus_path)
+
+    if s3_prefix:
+        item_paths = discover.list_urls(s3_prefix, max_workers=concurrency)
+    else:
+        with open(stac_path, "r") as fin:
+            item_paths = [f.strip() for f in fin.readlines()]
+
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+
+    with NdjsonWriter(output_path) as f_itm, IdIndex(index_path) as index, Checkpoint(checkpoint_path, f_itm, on_commit=[index.save]) as checkpoint:
+        # Loop through each items (fetched in parallel)
         # edit items and save into a top level collection JSON file
-        for p in item_paths:
-            item = pystac.Item.from_file(p)
-            item_dict = item.make_asset_hrefs_absolute().to_dict()
-            item_dict["links"] = []
-            item_dict["collection"] = collection_id
-            item_dict["id"] = item.id.replace("/", "_")
-            if with_s3_urls:
-                item_dict["stac_extensions"].append("https://stac-extensions.github.io/alternate-assets/v1.1.0/schema.json")
-                for asset in item_dict["assets"]:
-                    ori = item_dict["assets"][asset]["href"]
-                    item_dict["assets"][asset]["href"] = ori.replace("https://maxar-opendata.s3.amazonaws.com", "s3://maxar-opendata")
-                    item_dict["assets"][asset]["alternate"] = {
-                        "public": {
-                            "title": "Public Access",
-                            "href": ori,
-                        }
-                    }
-
-            f_itm.write(json.dumps(item_dict) + "\n")
+        items = pipeline.stream(
+            _get_item,
+            (p for p in item_paths if p not in checkpoint and p not in index),
+            max_workers=concurrency,
+        )
+        for p, item_dict in items:
+            item_dict = transform.maxar_item(item_dict, collection_id, with_s3_urls)
+            if not index.add(p, item_dict):
+                continue
+
+            f_itm.write(item_dict)
+            checkpoint.add(p, item_dict)
+            metrics.incr("items_total", collection=collection_id)
 
 if __name__ == '__main__':
     main()
-
@@ -1,83 +1,127 @@
 """Create STAC Collections and Items files."""
 
-import json
+import sys
+from functools import partial
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 
 import click
 import pystac
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from crawler import fetch, jsonio, metrics, options, pipeline, transform, traverse  # noqa: E402
+from crawler.cache import DocumentCache  # noqa: E402
+from crawler.checkpoint import Checkpoint  # noqa: E402
+from crawler.collection import CollectionSummary  # noqa: E402
+from crawler.index import IdIndex  # noqa: E402
+from crawler.output import open_output  # noqa: E402
+from crawler.sync import SyncState, SyncStacIO, check_outputs  # noqa: E402
+
+
+@metrics.timed("fetch")
+def _get_item(url: str, state: Optional[SyncState] = None) -> Tuple[str, Optional[Dict], Dict]:
+    if state is None:
+        item, validators = pystac.Item.from_file(url), {}
+    else:
+        item_dict, validators = state.get_json(url)
+        if item_dict is None:
+            return url, None, {}
+
+        item = pystac.Item.from_dict(item_dict, migrate=True)
+        item.set_self_href(url)
+
+    return url, item.make_asset_hrefs_absolute().to_dict(), validators
+
+
+def _collection(collection: pystac.Collection, collection_id: str, summary: CollectionSummary, with_assets_extension: bool) -> Dict:
+    c = collection.to_dict()
+    c["links"] = []
+    c["id"] = collection_id
+    c["description"] = "Maxar OpenData | " + c["description"]
+
+    if with_assets_extension:
+        if not c.get("stac_extensions"):
+            c["stac_extensions"] = []
+        c["stac_extensions"].append("https://stac-extensions.github.io/item-assets/v1.0.0/schema.json")
+        c["item_assets"] = summary.item_assets
+
+    return c
+
 
 @click.command()
+@click.option('--catalog', "catalog_url", type=str, default="https://maxar-opendata.s3.amazonaws.com/events/catalog.json", help="Root catalog URL.")
 @click.option('--collections', "collections_path", type=str, default="collections.json")
 @click.option('--items', "items_path", type=str, default="items.json")
 @click.option('--with-s3-urls/--without-s3-url', type=bool, default=False)
 @click.option('--with-assets-extension/--without-assets-extension', type=bool, default=False)
-def main(collections_path, items_path, with_s3_urls, with_assets_extension):
+@click.option('--concurrency', type=int, default=50, help="Number of Items fetched in parallel.")
+@click.option('--processes', type=int, default=0, help="Number of worker processes transforming the Items (default to inline).")
+@options.checkpoint_options
+@options.incremental_options
+@options.output_options
+@options.cache_options
+@options.metrics_options
+def main(catalog_url, collections_path, items_path, with_s3_urls, with_assets_extension, concurrency, processes, checkpoint_path, index_path, sync_path, dsn, method, batch_size, shard_by, shard_size, compression, writers, geoparquet_path, cache_path, cache_ttl, metrics_path, prometheus_path):
     click.echo("Connecting to static catalog...")
-    catalog = pystac.Catalog.from_file("https://maxar-opendata.s3.amazonaws.com/events/catalog.json")
+    fetch.configure(max_connections=concurrency)
+    metrics.export(metrics_path, prometheus_path)
+
+    state = None
+    if sync_path:
+        state = SyncState(sync_path)
+        pystac.StacIO.set_default(lambda: SyncStacIO(state))
+
+    cache = DocumentCache(cache_path, ttl=cache_ttl * 3600) if cache_path else None
+    read = partial(state.get_text, cache=cache) if state else partial(traverse.read_text, cache=cache)
+
+    # all the collections are fetched in parallel
+    with metrics.timer("walk"):
+        catalog = traverse.read_node(catalog_url, read=read)
+        collections = [
+            child
+            for child in (node.to_pystac() for node in traverse.children(catalog, read, max_workers=concurrency))
+            if isinstance(child, pystac.Collection)
+        ]
 
     previous_col = []
     if Path(collections_path).exists():
-        with open(collections_path, "r") as f:
-            previous_col = [json.loads(l).get("id") for l in f.readlines()]
+        with open(collections_path, "rb") as f:
+            previous_col = [jsonio.loads(l).get("id") for l in f]
 
         print(f"{len(previous_col)} collections already found in {collections_path}")
 
-    with open(collections_path, "a") as f_col, open(items_path, "a") as f_itm:
-        for collection in catalog.get_collections():
-            collection_id = "MAXAR_" + collection.id.replace("-","_")
-            if collection_id in previous_col:
-                continue
-
-            collection_assets = {}
-
-            print(f"Looking for Items in {collection_id} Collection")
-
-            # Loop through each items
-            # edit items and save into a top level collection JSON file
-            for item in collection.get_items():
-                item_dict = item.make_asset_hrefs_absolute().to_dict()
-                item_dict["links"] = []
-                item_dict["collection"] = collection_id
-                item_dict["id"] = item.id.replace("/", "_")
-                if with_s3_urls:
-                    item_dict["stac_extensions"].append("https://stac-extensions.github.io/alternate-assets/v1.1.0/schema.json")
-                    for asset in item_dict["assets"]:
-                        ori = item_dict["assets"][asset]["href"]
-                        item_dict["assets"][asset]["href"] = ori.replace("https://maxar-opendata.s3.amazonaws.com", "s3://maxar-opendata")
-                        item_dict["assets"][asset]["alternate"] = {
-                            "public": {
-                                "title": "Public Access",
-                                "href": ori,
-                            }
-                        }
-
-                    collection_assets.update(
-                        **{
-                            name: {
-                                "type": values["type"],
-                                "title": values["title"],
-                                "roles": values.get("roles", ["data"]),
-                            }
-                            for name, values in item_dict["assets"].items()
-                        }
-                    )
-
-                    f_itm.write(json.dumps(item_dict) + "\n")
-
-            c = collection.to_dict()
-            c["links"] = []
-            c["id"] = collection_id
-            c["description"] = "Maxar OpenData | " + c["description"]
-
-            if with_assets_extension:
-                if not c.get("stac_extensions"):
-                    c["stac_extensions"] = []
-                c["stac_extensions"].append("https://stac-extensions.github.io/item-assets/v1.0.0/schema.json")
-                c["item_assets"] = collection_assets
-
-            f_col.write(json.dumps(c) + "\n")
-
+    jobs = []
+    for collection in collections:
+        collection_id = "MAXAR_" + collection.id.replace("-","_")
+        if collection_id not in previous_col:
+            jobs.append((collection_id, collection))
+
+    checkpoint_path = checkpoint_path or f"{items_path}.checkpoint"
+
+    with open_output(collections_path, dsn) as f_col, open_output(items_path, dsn, shard_by=shard_by, shard_size=shard_size, compression=compression, writers=writers, geoparquet=geoparquet_path, method=method, batch_size=batch_size) as f_itm, IdIndex(index_path) as index, Checkpoint(checkpoint_path, f_itm, on_commit=[index.save]) as checkpoint:
+        if state:
+            check_outputs(checkpoint)
+
+        pipeline.crawl_collections(
+            jobs,
+            partial(_get_item, state=state),
+            transform.Transform(transform.maxar_item, with_s3_urls=with_s3_urls),
+            lambda collection_id, collection, summary: f_col.write(_collection(collection, collection_id, summary, with_assets_extension)),
+            f_itm,
+            checkpoint,
+            index,
+            state=state,
+            # without new Items, the Collection was already written by the previous incremental run
+            skip_unchanged=bool(state),
+            max_workers=concurrency,
+            processes=processes,
+        )
+
+    if state:
+        state.close()
+    if cache:
+        cache.close()
 
 
 if __name__ == '__main__':
@@ -1,7 +1,15 @@
-import json
+import sys
+from pathlib import Path
+
 import click
 import pystac
-import httpx
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from crawler import fetch, metrics, options, search, transform  # noqa: E402
+from crawler.checkpoint import Checkpoint  # noqa: E402
+from crawler.index import IdIndex  # noqa: E402
+from crawler.output import open_output  # noqa: E402
 
 COLLECTION_ID_UPSTREAM = "sentinel-2-l2a"
 COLLECTION_ID_DOWNSTREAM = "sentinel-2-iceland"
@@ -9,18 +17,30 @@ COLLECTION_BBOX = [-24.95, 63.38, -13.99, 66.56]
 
 
 @click.command()
+@click.option("--api", "api_url", type=str, default="https://earth-search.aws.element84.com/v1", help="STAC API root URL.")
 @click.option("--collections", "collections_path", type=str, default="collections.json")
 @click.option("--items", "items_path", type=str, default="items.json")
 @click.option('--with-s3-urls/--without-s3-url', type=bool, default=False)
-def main(collections_path, items_path, with_s3_urls):
+@options.checkpoint_options
+@options.output_options
+@click.option("--datetime", type=str, default="2023-01-01T00:00:00Z/2023-12-31T23:59:59Z", help="Search datetime interval.")
+@click.option("--split", type=click.Choice(["year", "month", "week", "day"]), help="Split the datetime interval in windows searched concurrently.")
+@click.option("--concurrency", type=int, default=8, help="Number of time windows searched in parallel.")
+@options.metrics_options
+def main(api_url, collections_path, items_path, with_s3_urls, checkpoint_path, index_path, dsn, method, batch_size, shard_by, shard_size, compression, writers, geoparquet_path, datetime, split, concurrency, metrics_path, prometheus_path):
     click.echo("Connecting to static catalog...")
+    fetch.configure(max_connections=concurrency)
+    metrics.export(metrics_path, prometheus_path)
     try:
-        catalog = pystac.Catalog.from_file("https://earth-search.aws.element84.com/v1/")
+        catalog = pystac.Catalog.from_file(f"{api_url}/")
     except Exception as e:
         print(f"Error loading catalog: {e}")
         return
 
-    with open(collections_path, "a") as f_col, open(items_path, "a") as f_itm:
+    checkpoint_path = checkpoint_path or f"{items_path}.checkpoint"
+    failed_windows = 0
+
+    with open_output(collections_path, dsn) as f_col, open_output(items_path, dsn, shard_by=shard_by, shard_size=shard_size, compression=compression, writers=writers, geoparquet=geoparquet_path, method=method, batch_size=batch_size) as f_itm, IdIndex(index_path) as index, Checkpoint(checkpoint_path, f_itm, on_commit=[index.save]) as checkpoint:
         for collection in catalog.get_collections():
             # Ignore all but one collection
             if collection.id != COLLECTION_ID_UPSTREAM:
@@ -31,7 +51,7 @@ def main(collections_path, items_path, with_s3_urls):
             try:
                 # Load the collection from URL
                 collection = pystac.Collection.from_file(
-                    f"https://earth-search.aws.element84.com/v1/collections/{collection.id}"
+                    f"{api_url}/collections/{collection.id}"
                 )
                 print(f"Collection loaded successfully: {collection.id}")
             except Exception as e:
@@ -39,52 +59,46 @@ def main(collections_path, items_path, with_s3_urls):
                 continue
 
             # Obtain items from Earth Search API
-            url = "https://earth-search.aws.element84.com/v1/search"
+            url = f"{api_url}/search"
             payload = {
                 "collections": [COLLECTION_ID_UPSTREAM],
                 "bbox": COLLECTION_BBOX,
-                "datetime": "2023-01-01T00:00:00Z/2023-12-31T23:59:59Z",
+                "datetime": datetime,
                 "limit": 500,
                 "query": {"eo:cloud_cover": {"lt": 5}},
             }
 
-            try:
-                with httpx.Client() as client:
-                    response = client.post(url, json=payload)
-                    response.raise_for_status()
-            except httpx.RequestError as e:
-                print(f"Error during request: {e}")
-                continue
-            except httpx.HTTPStatusError as e:
-                print(f"HTTP error occurred: {e}")
-                continue
-
-            data = response.json()
+            # windows whose search failed, the others are still written
+            failed = []
+            items = metrics.iterate("search", search.search_windows(url, payload, split=split, max_workers=concurrency, failed=failed))
 
-             # Loop through each items
-             # edit items and save into a top level collection JSON file
-            for item_dict in data.get("features", []):
+            # Loop through each items (as they are returned by the API)
+            # edit items and save into a top level collection JSON file
+            for item_dict in items:
+                key = item_dict["id"]
+                if key in checkpoint or key in index:
+                    continue
 
                 print(f"Fetched Item ID: {item_dict['id']}")
 
-                item_dict["collection"] = COLLECTION_ID_DOWNSTREAM
-                item_dict["links"] = []
+                with metrics.timer("transform"):
+                    item_dict = transform.sentinel2_item(item_dict, COLLECTION_ID_DOWNSTREAM, with_s3_urls)
 
-                # Filter out assets with 'jp2' in their href
-                if "assets" in item_dict:
-                    filtered_assets = {k: v for k, v in item_dict["assets"].items() if 'jp2' not in v["href"]}
-                    item_dict["assets"] = filtered_assets
+                if not index.add(key, item_dict):
+                    continue
 
-                # Replace HTTP URLs with S3 URLs
-                if with_s3_urls:
-                    for asset in item_dict["assets"].values():
-                        asset["href"] = asset["href"].replace("https://sentinel-cogs.s3.us-west-2.amazonaws.com/sentinel-s2-l2a-cogs", "s3://sentinel-cogs/sentinel-s2-l2a-cogs")
+                f_itm.write(item_dict)
+                checkpoint.add(key, item_dict)
+                metrics.incr("items_total", collection=COLLECTION_ID_DOWNSTREAM)
 
-                 # Remove additional metadata
-                item_dict["properties"] = {k: v for k, v in item_dict["properties"].items() if not k.startswith("s2:")}
-                item_dict["properties"] = {k: v for k, v in item_dict["properties"].items() if not k.startswith("earthsearch:")}
+            checkpoint.commit()
 
-                f_itm.write(json.dumps(item_dict) + "\n")
+            for window, error in failed:
+                print(f"Error searching {window}: {error}")
+            failed_windows += len(failed)
+            if failed:
+                # written by the run completing the windows, only once
+                continue
 
             c = collection.to_dict()
             c["links"] = []
@@ -99,7 +113,11 @@ def main(collections_path, items_path, with_s3_urls):
                 filtered_assets = {k: v for k, v in c["item_assets"].items() if 'jp2' not in v["type"]}
                 c["item_assets"] = filtered_assets
 
-            f_col.write(json.dumps(c) + "\n")
+            f_col.write(c)
+
+    if failed_windows:
+        # the Items found are checkpointed: a new run only adds the missing ones
+        raise click.ClickException(f"{failed_windows} search windows failed, run again to complete them")
 
 
 if __name__ == "__main__":
@@ -1,173 +1,186 @@
 """Create STAC Collections and Items files."""
 
-import json
-import time
-from concurrent import futures
-from typing import Any, Dict, Sequence, Type, Union
+import itertools
+import sys
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
 
 import click
-import httpx
 import pystac
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
 
-def retry(
-    tries: int,
-    exceptions: Union[Type[Exception], Sequence[Type[Exception]]] = Exception,
-    delay: float = 0.0,
-):
-    """Retry Decorator"""
+from crawler import discover, fetch, jsonio, metrics, options, pipeline, transform, traverse  # noqa: E402
+from crawler.cache import DocumentCache  # noqa: E402
+from crawler.checkpoint import Checkpoint  # noqa: E402
+from crawler.collection import CollectionSummary  # noqa: E402
+from crawler.index import IdIndex  # noqa: E402
+from crawler.output import open_output  # noqa: E402
+from crawler.sync import SyncState, SyncStacIO, check_outputs  # noqa: E402
 
-    def _decorator(func: Any):
-        def _newfn(*args: Any, **kwargs: Any):
 
-            attempt = 0
-            while attempt < tries:
-                try:
-                    return func(*args, **kwargs)
-                except exceptions:  # type: ignore
-                    attempt += 1
-                    time.sleep(delay)
+@metrics.timed("fetch")
+def _get_item(url: str, state: Optional[SyncState] = None) -> Tuple[str, Optional[Dict], Dict]:
+    if state is None:
+        return url, fetch.get_json(url), {}
 
-            return func(*args, **kwargs)
+    return (url, *state.get_json(url))
 
-        return _newfn
 
-    return _decorator
-
-
-@retry(tries=3, delay=1)
-def _get_item(url: str) -> Dict:
-    resp = httpx.get(url)
-    resp.raise_for_status()
-    return resp.json()
+def _get_items_links(catalog: traverse.Node, read: Callable[[str], str], max_workers: int) -> Iterator[str]:
+    # Items are only linked from the (leaf) day catalogs
+    for node in traverse.walk(catalog, read, max_workers=max_workers):
+        if node.depth > catalog.depth and not node.child_links:
+            yield from node.item_links
 
 
 @click.command()
+@click.option("--catalog", "catalog_url", type=str, default="https://s3.us-west-2.amazonaws.com/umbra-open-data-catalog/stac/catalog.json", help="Root catalog URL.")
 @click.option("--collections", "collections_path", type=str, default="collections.json")
 @click.option("--items", "items_path", type=str, default="items.json")
 @click.option("--with-s3-urls/--without-s3-url", type=bool, default=False)
 @click.option(
     "--with-assets-extension/--without-assets-extension", type=bool, default=False
 )
-def main(collections_path, items_path, with_s3_urls, with_assets_extension):
+@click.option("--concurrency", type=int, default=50, help="Number of Items fetched in parallel.")
+@click.option("--discovery", type=click.Choice(["catalog", "s3"]), default="catalog", help="Find the Items by walking the year/month/day catalogs, or by listing the bucket.")
+@click.option("--processes", type=int, default=0, help="Number of worker processes transforming the Items (default to inline).")
+@options.checkpoint_options
+@options.incremental_options
+@options.output_options
+@options.cache_options
+@options.metrics_options
+def main(catalog_url, collections_path, items_path, with_s3_urls, with_assets_extension, concurrency, discovery, processes, checkpoint_path, index_path, sync_path, dsn, method, batch_size, shard_by, shard_size, compression, writers, geoparquet_path, cache_path, cache_ttl, metrics_path, prometheus_path):
     click.echo("Connecting to static catalog...")
+    fetch.configure(max_connections=concurrency)
+    metrics.export(metrics_path, prometheus_path)
+
+    state = None
+    if sync_path:
+        state = SyncState(sync_path)
+        pystac.StacIO.set_default(lambda: SyncStacIO(state))
+
+    cache = DocumentCache(cache_path, ttl=cache_ttl * 3600) if cache_path else None
+    read = partial(state.get_text, cache=cache) if state else partial(traverse.read_text, cache=cache)
+
+    with metrics.timer("walk"):
+        top_catalog = traverse.read_node(catalog_url, read=read)
+        sub_catalogs = traverse.children(top_catalog, read, max_workers=concurrency)
+
+    previous_col = []
+    if Path(collections_path).exists():
+        with open(collections_path, "rb") as f:
+            previous_col = [jsonio.loads(l).get("id") for l in f]
+
+        print(f"{len(previous_col)} collections already found in {collections_path}")
+
+    checkpoint_path = checkpoint_path or f"{items_path}.checkpoint"
 
-    top_catalogs = pystac.Catalog.from_file(
-        "https://s3.us-west-2.amazonaws.com/umbra-open-data-catalog/stac/catalog.json"
-    )
-    sub_catalogs = [
-        pystac.Catalog.from_file(link.absolute_href)
-        for link in top_catalogs.get_child_links()
-    ]
+    with open_output(collections_path, dsn) as f_col, open_output(items_path, dsn, shard_by=shard_by, shard_size=shard_size, compression=compression, writers=writers, geoparquet=geoparquet_path, method=method, batch_size=batch_size) as f_itm, IdIndex(index_path) as index, Checkpoint(checkpoint_path, f_itm, on_commit=[index.save]) as checkpoint:
+        if state:
+            check_outputs(checkpoint)
 
-    with open(collections_path, "a") as f_col, open(items_path, "a") as f_itm:
         for catalog in sub_catalogs:
-            collection_id = "UMBRA_" + catalog.id
+            catalog_id = catalog.doc["id"]
+            collection_id = "UMBRA_" + catalog_id
+            if collection_id in previous_col:
+                continue
 
             print(f"Looking for Items in {collection_id} Collection")
 
-            spatial_extent = []
-            temporal_extent = []
-            collection_assets = {}
-
-            items_links = []
-            # Year
-            for _, sub, _ in catalog.walk():
-                # Month -> Day
-                for ss in sub:
-                    if not ss.get_child_links():
-                        items_links.extend(
-                            [link.absolute_href for link in ss.get_item_links()]
-                        )
-
-            with futures.ThreadPoolExecutor(max_workers=50) as executor:
-                with click.progressbar(
-                    length=len(items_links), show_percent=True, show_pos=True
-                ) as bar:
-                    future_to_item = [
-                        executor.submit(_get_item, link) for link in items_links
-                    ]
-
-                    # Loop through each items
-                    # edit items and save into a top level collection JSON file
-                    for future in futures.as_completed(future_to_item):
-                        item_dict = future.result()
-                        item_dict["links"] = []
-                        item_dict["collection"] = collection_id
-                        item_dict["id"] = item_dict["id"].replace("/", "_")
-
-                        if "stac_extensions" not in item_dict:
-                            item_dict["stac_extensions"]
-
-                        if with_s3_urls:
-                            item_dict["stac_extensions"].append(
-                                "https://stac-extensions.github.io/alternate-assets/v1.1.0/schema.json"
-                            )
-                            for asset in item_dict["assets"]:
-                                ori = item_dict["assets"][asset]["href"].replace("http://", "https://")
-                                item_dict["assets"][asset]["href"] = ori.replace(
-                                    "https://umbra-open-data-catalog.s3.amazonaws.com",
-                                    "s3://umbra-open-data-catalog",
-                                )
-                                item_dict["assets"][asset]["alternate"] = {
-                                    "public": {
-                                        "title": "Public Access",
-                                        "href": ori,
-                                    }
-                                }
-
-                        if bbox := item_dict.get("bbox"):
-                            spatial_extent.append(bbox)
-
-                        st = item_dict["properties"].get("start_datetime")
-                        et = item_dict["properties"].get("end_datetime")
-                        if st and et:
-                            temporal_extent.extend((st, et))
-                        else:
-                            dt = item_dict["properties"]["datetime"]
-                            temporal_extent.append(dt)
-
-                        collection_assets.update(
-                            **{
-                                name: {
-                                    "type": values.get("type", "unknown"),
-                                    "title": values.get("title", name),
-                                    "roles": values.get("roles", ["data"]),
-                                }
-                                for name, values in item_dict["assets"].items()
-                            }
-                        )
-                        f_itm.write(json.dumps(item_dict) + "\n")
-                        bar.update(1)
-
-                xmins, ymins, xmaxs, ymaxs = zip(*spatial_extent)
-                bbox = min(xmins), min(ymins), max(xmaxs), max(ymaxs)
-                dts = sorted(temporal_extent)
-                start_datetime, end_datetime = dts[0], dts[-1]
-
-                col = pystac.collection.Collection(
-                    id=collection_id,
-                    title=f"UMBRA OpenData for {catalog.id}",
-                    description=f"UMBRA OpenData for {catalog.id}",
-                    extent=pystac.Extent(
-                        spatial=pystac.SpatialExtent([bbox]),
-                        temporal=pystac.TemporalExtent(
-                            [
-                                pystac.utils.str_to_datetime(start_datetime),
-                                pystac.utils.str_to_datetime(end_datetime),
-                            ]
-                        )
-                    ),
-                    stac_extensions=[
-                        "https://stac-extensions.github.io/item-assets/v1.0.0/schema.json",
-                    ],
-                    license="CC-BY-4.0",
-                    extra_fields={
-                        "item_assets": collection_assets
-                    }
-                )
-                c = col.to_dict()
-                f_col.write(json.dumps(c) + "\n")
+            summary = CollectionSummary()
+
+            # Items already written by a previous (interrupted) run,
+            # seen by previous incremental runs or skipped by the index
+            changed = checkpoint.count(collection_id)
+            previous_items = itertools.chain(
+                checkpoint.items(collection_id),
+                state.summaries(collection_id) if state else [],
+                index.summaries(collection_id),
+            )
+            for item_dict in previous_items:
+                summary.add(item_dict)
+
+            # Year -> Month -> Day, discovered while Items are being fetched
+            if discovery == "s3":
+                prefix = catalog.url.rsplit("/", 1)[0] + "/"
+                links = discover.list_urls(prefix, max_workers=concurrency)
+            else:
+                links = _get_items_links(catalog, read, max_workers=concurrency)
+
+            items_links = (
+                link
+                for link in metrics.iterate("walk", links)
+                if link not in checkpoint
+                # incremental runs fetch them again, to look for changes
+                and (state or link not in index)
+            )
+
+            fetched = pipeline.stream(partial(_get_item, state=state), items_links, max_workers=concurrency)
+            items = pipeline.process(
+                transform.Transform(transform.umbra_item, collection_id=collection_id, with_s3_urls=with_s3_urls),
+                fetched,
+                processes=processes,
+                stage="transform",
+            )
+
+            with click.progressbar(items, show_pos=True) as bar:
+                # Loop through each items
+                # and save into a top level collection JSON file
+                for url, item_dict, validators in bar:
+                    if item_dict is None:
+                        # unchanged since the last incremental run
+                        continue
+
+                    if not index.add(url, item_dict):
+                        continue
+
+                    summary.add(item_dict)
+                    f_itm.write(item_dict)
+                    checkpoint.add(url, item_dict)
+                    if state:
+                        state.save(url, validators, item_dict)
+                    changed += 1
+                    metrics.incr("items_total", collection=collection_id)
+
+            checkpoint.commit()
+            if state:
+                state.commit()
+            if not changed and state:
+                # nothing new since the previous incremental run
+                continue
+
+            start_datetime, end_datetime = summary.interval
+
+            col = pystac.collection.Collection(
+                id=collection_id,
+                title=f"UMBRA OpenData for {catalog_id}",
+                description=f"UMBRA OpenData for {catalog_id}",
+                extent=pystac.Extent(
+                    spatial=pystac.SpatialExtent([summary.bbox]),
+                    temporal=pystac.TemporalExtent(
+                        [
+                            pystac.utils.str_to_datetime(start_datetime),
+                            pystac.utils.str_to_datetime(end_datetime),
+                        ]
+                    )
+                ),
+                stac_extensions=[
+                    "https://stac-extensions.github.io/item-assets/v1.0.0/schema.json",
+                ],
+                license="CC-BY-4.0",
+                extra_fields={
+                    "item_assets": summary.item_assets
+                }
+            )
+            c = col.to_dict()
+            f_col.write(c)
+
+    if state:
+        state.close()
+    if cache:
+        cache.close()
 
 
 if __name__ == "__main__":
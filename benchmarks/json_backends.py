@@ -0,0 +1,63 @@
+"""Compare the JSON backends on the bundled NDJSON samples.
+
+python benchmarks/json_backends.py Umbra/items.json.zip Copernicus-Dem/items.json.zip
+"""
+
+import io
+import sys
+import time
+import zipfile
+from pathlib import Path
+from typing import List
+
+import click
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from crawler import jsonio  # noqa: E402
+
+
+def _read_lines(path: str, limit: int) -> List[bytes]:
+    with zipfile.ZipFile(path) as zf:
+        with zf.open(zf.namelist()[0]) as f:
+            lines = []
+            for line in f:
+                lines.append(line)
+                if limit and len(lines) >= limit:
+                    break
+    return lines
+
+
+@click.command()
+@click.argument("archives", nargs=-1, required=True)
+@click.option("--limit", type=int, default=0, help="Number of Items to read from each archive (default to all).")
+@click.option("--repeat", type=int, default=3, help="Keep the best of N runs.")
+def main(archives, limit, repeat):
+    for archive in archives:
+        lines = _read_lines(archive, limit)
+        click.echo(f"{archive}: {len(lines)} items")
+
+        for name, backend in jsonio.backends.items():
+            decode = encode = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                items = [backend.loads(line) for line in lines]
+                t1 = time.perf_counter()
+
+                out = io.BufferedWriter(io.BytesIO(), buffer_size=1024 * 1024)
+                for item in items:
+                    out.write(backend.dumps(item) + b"\n")
+                out.flush()
+                t2 = time.perf_counter()
+
+                decode = min(decode, t1 - t0)
+                encode = min(encode, t2 - t1)
+
+            click.echo(
+                f"  {name:<8} loads: {len(lines) / decode:>10.0f} items/s"
+                f"  dumps: {len(lines) / encode:>10.0f} items/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
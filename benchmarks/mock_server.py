@@ -0,0 +1,611 @@
+"""Local HTTP server serving synthetic Maxar, Umbra, LINZ and Earth Search catalogs.
+
+python benchmarks/mock_server.py --port 8000 --items 1000 --latency 20 --error-rate 0.01
+
+Documents are generated from their path, so the size of the catalogs does
+not change the server memory use. Latency and errors are derived from a
+hash of the path (and `seed`), which makes two runs with the same options
+serve exactly the same responses.
+
+- `/maxar/catalog.json`: `collections` events with `items` Items each
+- `/umbra/catalog.json`: `collections` sub catalogs, each a year/month/day tree with `items` Items
+- `/linz/catalog.json`: `collections` Collections with `items` Item links each
+- `/earth-search/`: a `sentinel-2-l2a` Collection and a paginated `/search` (POST)
+- `/{maxar,umbra,linz}?list-type=2`: S3 ListObjectsV2 (path style) of the static catalogs
+- `/copernicus-dem-30m/`: `collections * items` Copernicus DEM GeoTIFF tiles (headers only, no pixel data), listed with ListObjectsV2 and read with range requests
+
+GET responses have an `ETag` (CRC32 of the body) and `If-None-Match`
+requests are answered with `304 Not Modified`.
+"""
+
+import functools
+import json
+import re
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import click
+
+UMBRA_YEARS = 2
+UMBRA_MONTHS = 3
+UMBRA_DAYS = 5
+
+SEARCH_START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+SEARCH_END = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _catalog(id: str, links: List[Dict]) -> Dict:
+    return {
+        "type": "Catalog",
+        "stac_version": "1.0.0",
+        "id": id,
+        "description": f"Mock {id} catalog",
+        "links": links,
+    }
+
+
+def _collection(id: str, links: List[Dict]) -> Dict:
+    return {
+        "type": "Collection",
+        "stac_version": "1.0.0",
+        "id": id,
+        "description": f"Mock {id} collection",
+        "license": "CC-BY-4.0",
+        "extent": {
+            "spatial": {"bbox": [[-180, -90, 180, 90]]},
+            "temporal": {"interval": [["2023-01-01T00:00:00Z", None]]},
+        },
+        "links": links,
+    }
+
+
+def _item(id: str, n: int, dt: datetime, hrefs: Dict[str, str]) -> Dict:
+    x, y = (n * 7) % 360 - 180, (n * 3) % 170 - 85
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "stac_extensions": [],
+        "id": id,
+        "properties": {
+            "datetime": dt.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "platform": "mock",
+            "gsd": 0.5,
+            "s2:mock": n,
+            "earthsearch:mock": n,
+        },
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[x, y], [x + 1, y], [x + 1, y + 1], [x, y + 1], [x, y]]],
+        },
+        "bbox": [x, y, x + 1, y + 1],
+        "links": [],
+        "assets": {
+            name: {"href": href, "type": "image/tiff; application=geotiff", "title": name, "roles": ["data"]}
+            for name, href in hrefs.items()
+        },
+    }
+
+
+def _dem_tile(lat: int, lon: int, size: int = 3600) -> bytes:
+    """Little endian GeoTIFF header of a 1x1 degree, pixel-is-point Copernicus DEM tile."""
+    res = 1 / size
+    geo_keys = [1, 1, 0, 3, 1024, 0, 1, 2, 1025, 0, 1, 2, 2048, 0, 1, 4326]
+    tags = [
+        # tag, type, values
+        (256, 3, [size]),
+        (257, 3, [size]),
+        (258, 3, [32]),
+        (259, 3, [1]),
+        (262, 3, [1]),
+        (277, 3, [1]),
+        (339, 3, [3]),
+        (33550, 12, [res, res, 0.0]),
+        (33922, 12, [0.0, 0.0, 0.0, float(lon), float(lat + 1), 0.0]),
+        (34735, 3, geo_keys),
+    ]
+    formats = {3: "H", 12: "d"}
+
+    ifd_offset = 8
+    data_offset = ifd_offset + 2 + 12 * len(tags) + 4
+    entries, data = [], b""
+    for tag, type_id, values in tags:
+        raw = struct.pack(f"<{len(values)}{formats[type_id]}", *values)
+        if len(raw) <= 4:
+            entries.append(struct.pack("<HHI", tag, type_id, len(values)) + raw.ljust(4, b"\0"))
+        else:
+            entries.append(struct.pack("<HHII", tag, type_id, len(values), data_offset + len(data)))
+            data += raw
+
+    return b"II*\0" + struct.pack("<I", ifd_offset) + struct.pack("<H", len(tags)) + b"".join(entries) + b"\0" * 4 + data
+
+
+def _dem_name(n: int) -> str:
+    lat, lon = n // 360 - 90, n % 360 - 180
+    return "Copernicus_DSM_COG_10_{}{:02d}_00_{}{:03d}_00_DEM".format(
+        "N" if lat >= 0 else "S", abs(lat), "E" if lon >= 0 else "W", abs(lon)
+    )
+
+
+class Catalogs:
+    """Synthetic documents, by path."""
+
+    def __init__(self, collections: int = 2, items: int = 1000, assets: int = 4, page_size: int = 100):
+        self.collections = collections
+        self.items = items
+        self.assets = assets
+        self.page_size = page_size
+        self.base_url = ""
+
+    def _hrefs(self, prefix: str) -> Dict[str, str]:
+        return {f"asset{i}": f"{prefix}_{i}.tif" for i in range(self.assets)}
+
+    # Maxar
+    def maxar(self, path: str) -> Optional[Dict]:
+        if path == "/maxar/catalog.json":
+            return _catalog("events", [
+                {"rel": "child", "href": f"./event-{c}/collection.json"}
+                for c in range(self.collections)
+            ])
+
+        if m := re.fullmatch(r"/maxar/event-(\d+)/collection.json", path):
+            return _collection(f"event-{m[1]}", [
+                {"rel": "item", "href": f"./{i}.json"} for i in range(self.items)
+            ])
+
+        if m := re.fullmatch(r"/maxar/event-(\d+)/(\d+).json", path):
+            c, i = int(m[1]), int(m[2])
+            return _item(
+                f"{c}/{i}",
+                i,
+                SEARCH_START + timedelta(hours=i),
+                self._hrefs(f"https://maxar-opendata.s3.amazonaws.com/events/event-{c}/{i}"),
+            )
+
+        return None
+
+    # Umbra: sub catalog -> year -> month -> day -> Items
+    def _umbra_day_items(self) -> int:
+        return max(1, self.items // (UMBRA_YEARS * UMBRA_MONTHS * UMBRA_DAYS))
+
+    def umbra(self, path: str) -> Optional[Dict]:
+        parts = path.strip("/").split("/")[1:]
+        if not parts or not parts[-1].endswith(".json"):
+            return None
+
+        levels = parts[:-1]
+        if parts[-1] == "catalog.json":
+            if not levels:
+                return _catalog("umbra", [
+                    {"rel": "child", "href": f"{self.base_url}/umbra/{c}/catalog.json"}
+                    for c in range(self.collections)
+                ])
+
+            depth = len(levels)
+            prefix = f"{self.base_url}/umbra/{'/'.join(levels)}"
+            if depth == 1:
+                return _catalog(f"task-{levels[0]}", [
+                    {"rel": "child", "href": f"{prefix}/{y}/catalog.json"} for y in range(UMBRA_YEARS)
+                ])
+            if depth == 2:
+                return _catalog("year", [
+                    {"rel": "child", "href": f"{prefix}/{m}/catalog.json"} for m in range(UMBRA_MONTHS)
+                ])
+            if depth == 3:
+                return _catalog("month", [
+                    {"rel": "child", "href": f"{prefix}/{d}/catalog.json"} for d in range(UMBRA_DAYS)
+                ])
+            if depth == 4:
+                return _catalog("day", [
+                    {"rel": "item", "href": f"{prefix}/{i}.json"} for i in range(self._umbra_day_items())
+                ])
+
+            return None
+
+        if len(levels) == 4:
+            n = zlib.crc32(path.encode())
+            return _item(
+                f"{'-'.join(levels)}-{parts[-1][:-5]}",
+                n,
+                SEARCH_START + timedelta(days=int(levels[2]) * 30 + int(levels[3]), seconds=n % 86400),
+                self._hrefs(f"http://umbra-open-data-catalog.s3.amazonaws.com/sar-data/{'/'.join(levels)}/{parts[-1][:-5]}"),
+            )
+
+        return None
+
+    # LINZ
+    def linz(self, path: str) -> Optional[Dict]:
+        if path == "/linz/catalog.json":
+            return _catalog("linz", [
+                {"rel": "child", "href": f"./col-{c}/collection.json"}
+                for c in range(self.collections)
+            ])
+
+        if m := re.fullmatch(r"/linz/col-(\d+)/collection.json", path):
+            return _collection(f"col-{m[1]}", [
+                {"rel": "item", "href": f"./{m[1]}_{i}.json"} for i in range(self.items)
+            ])
+
+        if m := re.fullmatch(r"/linz/col-(\d+)/(\d+)_(\d+).json", path):
+            item_id = f"{m[2]}_{m[3]}"
+            item = _item(item_id, int(m[3]), SEARCH_START + timedelta(hours=int(m[3])), {})
+            item["assets"] = {
+                f"asset{i}": {"href": f"./{item_id}_{i}.tiff", "type": "image/tiff", "roles": ["data"]}
+                for i in range(self.assets)
+            }
+            return item
+
+        return None
+
+    # Earth Search
+    @property
+    def search_total(self) -> int:
+        return self.collections * self.items
+
+    def _search_item(self, i: int) -> Dict:
+        step = (SEARCH_END - SEARCH_START) / self.search_total
+        return _item(
+            f"S2_MOCK_{i}",
+            i,
+            SEARCH_START + step * i,
+            self._hrefs(f"https://sentinel-cogs.s3.us-west-2.amazonaws.com/sentinel-s2-l2a-cogs/mock/{i}"),
+        )
+
+    def earth_search(self, path: str) -> Optional[Dict]:
+        if path in ("/earth-search", "/earth-search/"):
+            return _catalog("earth-search", [
+                {"rel": "child", "href": f"{self.base_url}/earth-search/collections/sentinel-2-l2a"},
+            ])
+
+        if path == "/earth-search/collections/sentinel-2-l2a":
+            return _collection("sentinel-2-l2a", [])
+
+        return None
+
+    def search(self, body: Dict) -> Dict:
+        step = (SEARCH_END - SEARCH_START) / self.search_total
+        first, last = 0, self.search_total - 1
+        if interval := body.get("datetime"):
+            start, end = (
+                datetime.fromisoformat(dt.replace("Z", "+00:00")) for dt in interval.split("/")
+            )
+            first = max(first, -((SEARCH_START - start) // step))
+            last = min(last, (end - SEARCH_START) // step)
+
+        limit = body.get("limit", self.page_size)
+        offset = first + body.get("token", 0)
+        stop = min(offset + limit, last + 1)
+        features = [self._search_item(i) for i in range(offset, stop)]
+
+        links = []
+        if stop <= last:
+            links.append({
+                "rel": "next",
+                "href": f"{self.base_url}/earth-search/search",
+                "method": "POST",
+                "body": {"token": stop - first},
+                "merge": True,
+            })
+
+        return {"type": "FeatureCollection", "features": features, "links": links}
+
+    # Copernicus DEM: one GeoTIFF per 1x1 degree tile
+    def dem_tile(self, path: str) -> Optional[bytes]:
+        m = re.fullmatch(r"/copernicus-dem-30m/(\w+)/(\w+)\.tif", path)
+        if not m or m[1] != m[2] or m[1] not in self._dem_names:
+            return None
+
+        lat = int(m[1][23:25]) * (1 if m[1][22] == "N" else -1)
+        lon = int(m[1][30:33]) * (1 if m[1][29] == "E" else -1)
+        return _dem_tile(lat, lon)
+
+    @functools.cached_property
+    def _dem_names(self) -> List[str]:
+        # spread over the globe, 360 * 180 tiles at most
+        count = min(self.collections * self.items, 360 * 180)
+        return [_dem_name(n * (360 * 180) // count) for n in range(count)]
+
+    # S3 ListObjectsV2 (path style) over the static catalogs
+    def _keys(self, bucket: str) -> List[str]:
+        if bucket == "copernicus-dem-30m":
+            keys = [f"{name}/{name}.tif" for name in self._dem_names]
+        elif bucket == "maxar":
+            keys = ["catalog.json"]
+            for c in range(self.collections):
+                keys.append(f"event-{c}/collection.json")
+                keys.extend(f"event-{c}/{i}.json" for i in range(self.items))
+        elif bucket == "linz":
+            keys = ["catalog.json"]
+            for c in range(self.collections):
+                keys.append(f"col-{c}/collection.json")
+                keys.extend(f"col-{c}/{c}_{i}.json" for i in range(self.items))
+        elif bucket == "umbra":
+            keys = ["catalog.json"]
+            for c in range(self.collections):
+                keys.append(f"{c}/catalog.json")
+                for y in range(UMBRA_YEARS):
+                    keys.append(f"{c}/{y}/catalog.json")
+                    for m in range(UMBRA_MONTHS):
+                        keys.append(f"{c}/{y}/{m}/catalog.json")
+                        for d in range(UMBRA_DAYS):
+                            keys.append(f"{c}/{y}/{m}/{d}/catalog.json")
+                            keys.extend(f"{c}/{y}/{m}/{d}/{i}.json" for i in range(self._umbra_day_items()))
+        else:
+            return []
+
+        return sorted(keys)
+
+    def list_objects(self, bucket: str, params: Dict[str, str]) -> Optional[bytes]:
+        keys = self._keys(bucket)
+        if not keys:
+            return None
+
+        prefix = params.get("prefix", "")
+        delimiter = params.get("delimiter")
+        token = params.get("continuation-token", "")
+        max_keys = int(params.get("max-keys", 1000))
+
+        contents: List[str] = []
+        prefixes: List[str] = []
+        truncated = False
+        for key in keys:
+            if not key.startswith(prefix) or key <= token:
+                continue
+
+            common = None
+            if delimiter and delimiter in key[len(prefix):]:
+                common = prefix + key[len(prefix):].split(delimiter, 1)[0] + delimiter
+                if prefixes and prefixes[-1] == common:
+                    continue
+
+            if len(contents) + len(prefixes) >= max_keys:
+                truncated = True
+                break
+
+            if common is None:
+                contents.append(key)
+            else:
+                prefixes.append(common)
+
+        last = max(contents[-1:] + [p + "\uffff" for p in prefixes[-1:]], default="")
+        xml = ['<?xml version="1.0" encoding="UTF-8"?>']
+        xml.append('<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">')
+        xml.append(f"<Name>{bucket}</Name><Prefix>{prefix}</Prefix><KeyCount>{len(contents) + len(prefixes)}</KeyCount>")
+        xml.append(f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>")
+        if truncated:
+            xml.append(f"<NextContinuationToken>{last}</NextContinuationToken>")
+        xml.extend(f"<Contents><Key>{key}</Key><Size>1024</Size></Contents>" for key in contents)
+        xml.extend(f"<CommonPrefixes><Prefix>{p}</Prefix></CommonPrefixes>" for p in prefixes)
+        xml.append("</ListBucketResult>")
+        return "".join(xml).encode()
+
+    def get(self, path: str) -> Optional[Dict]:
+        for prefix, handler in (
+            ("/maxar/", self.maxar),
+            ("/umbra/", self.umbra),
+            ("/linz/", self.linz),
+            ("/earth-search", self.earth_search),
+        ):
+            if path.startswith(prefix):
+                return handler(path)
+
+        return None
+
+
+class MockServer:
+    """Serve `Catalogs` on localhost, in a background thread."""
+
+    def __init__(
+        self,
+        catalogs: Catalogs,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        max_concurrency: int = 0,
+    ):
+        self.catalogs = catalogs
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.max_concurrency = max_concurrency
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._attempts: Dict[str, int] = {}
+        self.reset()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any):
+                pass
+
+            def do_GET(self):
+                server._handle(self, None)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                server._handle(self, json.loads(self.rfile.read(length) or b"{}"))
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        catalogs.base_url = self.url
+        self._thread: Optional[threading.Thread] = None
+
+    def reset(self):
+        """Clear the request statistics."""
+        with self._lock:
+            self.latencies: List[float] = []
+            self.errors = 0
+            self.throttled = 0
+            self._attempts.clear()
+
+    def _hash(self, path: str) -> float:
+        return (zlib.crc32(f"{self.seed}:{path}".encode()) % 10000) / 10000
+
+    def _should_fail(self, path: str) -> bool:
+        with self._lock:
+            attempt = self._attempts.get(path, 0)
+            self._attempts[path] = attempt + 1
+
+        # only the first attempt fails, so that retries eventually succeed
+        return attempt == 0 and self._hash(path) < self.error_rate
+
+    def _handle(self, handler: BaseHTTPRequestHandler, body: Optional[Dict]):
+        t0 = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+            throttled = bool(self.max_concurrency) and self._in_flight > self.max_concurrency
+
+        try:
+            self._respond(handler, body, throttled)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.latencies.append(time.perf_counter() - t0)
+                self.throttled += throttled
+
+    def _respond(self, handler: BaseHTTPRequestHandler, body: Optional[Dict], throttled: bool):
+        path, _, query = handler.path.partition("?")
+        params = dict(parse_qsl(query))
+        if self.latency and not throttled:
+            # between 0.5x and 1.5x the requested latency
+            time.sleep(self.latency * (0.5 + self._hash(path + "#latency")))
+
+        status, doc = 200, None
+        if throttled:
+            # like S3 `503 SlowDown`, when more than `max_concurrency` requests are in flight
+            status = 503
+        elif self._should_fail(f"{handler.command} {handler.path} {body}"):
+            status = 503
+        elif handler.command == "POST" and path == "/earth-search/search":
+            doc = self.catalogs.search(body or {})
+        elif handler.command == "GET" and params.get("list-type") == "2":
+            doc = self.catalogs.list_objects(path.strip("/"), params)
+        elif handler.command == "GET" and path.endswith(".tif"):
+            doc = self.catalogs.dem_tile(path)
+        elif handler.command == "GET":
+            doc = self.catalogs.get(path)
+
+        if doc is None and status == 200:
+            status = 404
+
+        headers = {}
+        if isinstance(doc, bytes) and path.endswith(".tif"):
+            data, content_type = doc, "image/tiff; application=geotiff"
+            if m := re.fullmatch(r"bytes=(\d+)-(\d*)", handler.headers.get("Range", "")):
+                start, end = int(m[1]), int(m[2] or len(data) - 1)
+                status, data = 206, data[start:end + 1]
+                headers["Content-Range"] = f"bytes {start}-{start + len(data) - 1}/{len(doc)}"
+        elif isinstance(doc, bytes):
+            data, content_type = doc, "application/xml"
+        else:
+            data, content_type = (json.dumps(doc).encode() if doc is not None else b""), "application/json"
+
+        if status == 200 and handler.command == "GET":
+            # conditional requests (`--incremental`)
+            headers["ETag"] = f'"{zlib.crc32(data):08x}"'
+            if handler.headers.get("If-None-Match") == headers["ETag"]:
+                status, data = 304, b""
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(data)))
+        if status == 503:
+            handler.send_header("Retry-After", "0")
+        handler.end_headers()
+        handler.wfile.write(data)
+
+        if status >= 500:
+            with self._lock:
+                self.errors += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Request count, errors and p50/p99 latency (ms), as seen by the server."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            errors = self.errors
+            throttled = self.throttled
+
+        def _percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "throttled": throttled,
+            "p50_ms": round(_percentile(0.50), 2),
+            "p99_ms": round(_percentile(0.99), 2),
+        }
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args: Any):
+        self.stop()
+
+
+def urls(base_url: str) -> Dict[str, Tuple[str, str]]:
+    """Generator script and catalog option for each source."""
+    return {
+        "maxar": ("Maxar/generate.py", f"--catalog={base_url}/maxar/catalog.json"),
+        "umbra": ("Umbra/generate.py", f"--catalog={base_url}/umbra/catalog.json"),
+        "linz": ("Linz/generate.py", f"--catalog={base_url}/linz/catalog.json"),
+        "sentinel-2": ("Sentinel-2-Iceland/generate.py", f"--api={base_url}/earth-search"),
+        "copernicus-dem": ("Copernicus-Dem/generate.py", f"--prefix={base_url}/copernicus-dem-30m/"),
+    }
+
+
+@click.command()
+@click.option("--port", type=int, default=8000)
+@click.option("--collections", type=int, default=2, help="Number of Collections (or sub catalogs) per source.")
+@click.option("--items", type=int, default=1000, help="Number of Items per Collection.")
+@click.option("--assets", type=int, default=4, help="Number of assets per Item.")
+@click.option("--latency", type=float, default=0.0, help="Mean response latency, in milliseconds.")
+@click.option("--error-rate", type=float, default=0.0, help="Share of documents answered with a 503 on the first request.")
+@click.option("--seed", type=int, default=0)
+@click.option("--max-concurrency", type=int, default=0, help="Answer `503 SlowDown` above this number of requests in flight.")
+def main(port, collections, items, assets, latency, error_rate, seed, max_concurrency):
+    server = MockServer(
+        Catalogs(collections=collections, items=items, assets=assets),
+        port=port,
+        latency=latency / 1000,
+        error_rate=error_rate,
+        seed=seed,
+        max_concurrency=max_concurrency,
+    )
+    for source, (script, option) in urls(server.url).items():
+        click.echo(f"{source}: python {script} {option}")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
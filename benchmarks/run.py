@@ -0,0 +1,136 @@
+"""Run the generators against the local mock server and report their throughput.
+
+python benchmarks/run.py --items 2000 --latency 20 --output results.json
+python benchmarks/run.py --items 2000 --latency 20 --baseline results.json
+
+Each `generate.py` runs in its own process so its peak RSS can be read
+from `os.wait4`. With `--baseline`, the command fails when a source is
+more than `--tolerance` slower (in items/s) than in the baseline results.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import click
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from mock_server import Catalogs, MockServer, urls  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _count_lines(path: Path) -> int:
+    if not path.exists():
+        return 0
+    if path.is_dir():
+        # sharded output (--shard-by, --shard-size or --compression)
+        with open(path / "manifest.json", "rb") as f:
+            return sum(shard["items"] for shard in json.load(f)["shards"])
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def run_generator(script: str, args: List[str]) -> Dict:
+    """Run a generator in a temporary directory, returning its items/s and peak RSS."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        items_path = Path(tmpdir) / "items.json"
+        cmd = [
+            sys.executable,
+            str(ROOT / script),
+            f"--items={items_path}",
+            f"--collections={Path(tmpdir) / 'collections.json'}",
+            *args,
+        ]
+
+        t0 = time.perf_counter()
+        with open(Path(tmpdir) / "stderr", "w+b") as stderr:
+            proc = subprocess.Popen(cmd, cwd=tmpdir, stdout=subprocess.DEVNULL, stderr=stderr)
+            _, status, rusage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - t0
+            proc.returncode = os.waitstatus_to_exitcode(status)
+
+            if proc.returncode != 0:
+                stderr.seek(0)
+                raise click.ClickException(f"{script} failed:\n{stderr.read().decode()[-2000:]}")
+
+        count = _count_lines(items_path)
+
+    return {
+        "items": count,
+        "seconds": round(elapsed, 3),
+        "items_per_s": round(count / elapsed, 1),
+        # kilobytes on Linux
+        "max_rss_mb": round(rusage.ru_maxrss / 1024, 1),
+    }
+
+
+@click.command()
+@click.option("--source", "sources", type=click.Choice(["maxar", "umbra", "linz", "sentinel-2", "copernicus-dem"]), multiple=True, help="Sources to benchmark (default to all).")
+@click.option("--collections", type=int, default=2, help="Number of Collections (or sub catalogs) per source.")
+@click.option("--items", type=int, default=1000, help="Number of Items per Collection.")
+@click.option("--assets", type=int, default=4, help="Number of assets per Item.")
+@click.option("--latency", type=float, default=10.0, help="Mean response latency, in milliseconds.")
+@click.option("--error-rate", type=float, default=0.0, help="Share of documents answered with a 503 on the first request.")
+@click.option("--seed", type=int, default=0)
+@click.option("--max-concurrency", type=int, default=0, help="Answer `503 SlowDown` above this number of requests in flight.")
+@click.option("--repeat", type=int, default=1, help="Keep the best of N runs.")
+@click.option("--arg", "extra_args", type=str, multiple=True, help="Extra option passed to every generator (e.g --arg=--concurrency=100).")
+@click.option("--output", "output_path", type=str, help="Save the results to this JSON file.")
+@click.option("--baseline", "baseline_path", type=str, help="Compare with the results saved in this JSON file.")
+@click.option("--tolerance", type=float, default=0.2, help="Allowed items/s regression against the baseline.")
+def main(sources, collections, items, assets, latency, error_rate, seed, max_concurrency, repeat, extra_args, output_path, baseline_path, tolerance):
+    catalogs = Catalogs(collections=collections, items=items, assets=assets)
+    results: Dict[str, Dict] = {}
+
+    with MockServer(catalogs, latency=latency / 1000, error_rate=error_rate, seed=seed, max_concurrency=max_concurrency) as server:
+        for source, (script, option) in urls(server.url).items():
+            if sources and source not in sources:
+                continue
+
+            best = None
+            for _ in range(repeat):
+                server.reset()
+                result = run_generator(script, [option, *extra_args])
+                result.update(server.stats())
+                if best is None or result["items_per_s"] > best["items_per_s"]:
+                    best = result
+
+            results[source] = best
+            click.echo(
+                f"{source:<11} {best['items']:>7} items  {best['items_per_s']:>9.1f} items/s"
+                f"  p50 {best['p50_ms']:>7.2f} ms  p99 {best['p99_ms']:>7.2f} ms"
+                f"  {best['requests']:>7} requests ({best['errors']} errors, {best['throttled']} throttled)"
+                f"  peak RSS {best['max_rss_mb']:>7.1f} MB"
+            )
+
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for source, result in results.items():
+            if source not in baseline:
+                continue
+
+            ratio = result["items_per_s"] / baseline[source]["items_per_s"]
+            click.echo(f"{source:<11} {ratio:>6.2f}x baseline")
+            if ratio < 1 - tolerance:
+                regressions.append(source)
+
+        if regressions:
+            raise click.ClickException(f"Throughput regression for: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
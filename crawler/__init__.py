@@ -0,0 +1 @@
+"""Shared helpers for the OpenData STAC generators."""
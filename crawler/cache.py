@@ -0,0 +1,113 @@
+"""Persistent cache of catalog and collection documents."""
+
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+
+class DocumentCache:
+    """SQLite store of fetched documents, with a TTL and a size bound.
+
+    Documents older than `ttl` seconds are ignored (and refetched). When
+    the bodies exceed `max_size` bytes, the least recently used documents
+    are evicted.
+
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 512 * 1024 * 1024,
+        ttl: float = 24 * 3600,
+        commit_every: int = 100,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.commit_every = commit_every
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                url TEXT PRIMARY KEY,
+                body TEXT,
+                size INTEGER,
+                fetched_at REAL,
+                accessed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS documents_accessed_at ON documents (accessed_at);
+            """
+        )
+        self._size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+
+    def get(self, url: str) -> Optional[str]:
+        """Return the cached body of `url`, unless missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self.db.execute(
+                "SELECT body, fetched_at FROM documents WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+
+            self.db.execute("UPDATE documents SET accessed_at = ? WHERE url = ?", (now, url))
+            self._maybe_commit()
+            return row[0]
+
+    def put(self, url: str, body: str):
+        now = time.time()
+        size = len(body.encode())
+        with self._lock:
+            previous = self.db.execute("SELECT size FROM documents WHERE url = ?", (url,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO documents (url, body, size, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (url, body, size, now, now),
+            )
+            self._size += size - (previous[0] if previous else 0)
+            if self._size > self.max_size:
+                self._evict()
+            self._maybe_commit()
+
+    def _evict(self):
+        # down to 90% of the limit, so eviction does not run on every put
+        target = self.max_size * 0.9
+        while self._size > target:
+            rows = self.db.execute(
+                "SELECT url, size FROM documents ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+
+            for url, size in rows:
+                self.db.execute("DELETE FROM documents WHERE url = ?", (url,))
+                self._size -= size
+                if self._size <= target:
+                    break
+
+    def _maybe_commit(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.db.commit()
+            self._pending = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def commit(self):
+        with self._lock:
+            self.db.commit()
+            self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
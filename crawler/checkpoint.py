@@ -0,0 +1,216 @@
+"""Item level checkpoint for resumable crawls."""
+
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from crawler import jsonio
+
+
+def summary(item: Dict) -> Dict:
+    """Keep the parts of an Item needed to rebuild its Collection summary."""
+    properties = item.get("properties", {})
+    return {
+        "bbox": item.get("bbox"),
+        "properties": {
+            key: properties[key]
+            for key in ("datetime", "start_datetime", "end_datetime")
+            if key in properties
+        },
+        "assets": {
+            name: {
+                key: values[key]
+                for key in ("type", "title", "roles")
+                if key in values
+            }
+            for name, values in item.get("assets", {}).items()
+        },
+    }
+
+
+class Checkpoint:
+    """SQLite journal of the Items written to an NDJSON file.
+
+    The journal stores, for every Item, the key it was fetched from (URL or
+    id), its collection and a small `summary` used to rebuild the
+    collection extent and `item_assets` on resume.
+
+    Rows are committed together with the size of the items file at that
+    time. When a crawl is restarted, anything written to the items file
+    after the last commit is truncated, so the Items it contained are
+    fetched again and written exactly once.
+
+    `items_file` can be any output with a `flush()` method. For a
+    directory of shards (`crawler.output.ShardedWriter`), its manifest is
+    committed instead of a size, and the shards are truncated back to it.
+    Outputs which are not files (e.g `crawler.ingest.PgstacWriter`) are
+    only flushed before each commit. The secondary outputs of a
+    `crawler.output.TeeWriter` with a manifest (e.g
+    `crawler.geoparquet.GeoparquetWriter`) have theirs committed too.
+
+    `finished` tells whether a previous run using the journal ended without
+    an error (see `crawler.sync.check_outputs`).
+
+    `on_commit` functions run after every commit, including the automatic
+    ones every `commit_every` Items (e.g `crawler.index.IdIndex.save`, so
+    the index never lags behind the journal by more than that).
+
+    """
+
+    def __init__(self, path: str, items_file: Any, commit_every: int = 500, on_commit: Iterable[Callable[[], None]] = ()):
+        self.items_file = items_file
+        self.commit_every = commit_every
+        self.on_commit = list(on_commit)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                key TEXT PRIMARY KEY,
+                id TEXT,
+                collection TEXT,
+                summary TEXT
+            );
+            CREATE INDEX IF NOT EXISTS items_collection ON items (collection);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self._resume()
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'finished'").fetchone()
+        self.finished = row is not None
+
+    def _resume(self):
+        self._resume_main()
+
+        for name, output in self._others():
+            row = self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+            if not len(self):
+                output.restore(None)
+            elif row is None or not output.restore(jsonio.loads(row[0])):
+                raise ValueError(
+                    f"{getattr(output, 'directory', output)} does not hold the Items of the checkpoint: "
+                    "resume with the same outputs, or start over with a new checkpoint"
+                )
+
+    def _others(self) -> List[Tuple[str, Any]]:
+        others = getattr(self.items_file, "others", ())
+        return [(f"manifest.{i}", other) for i, other in enumerate(others) if hasattr(other, "restore")]
+
+    def _resume_main(self):
+        if hasattr(self.items_file, "restore"):
+            # the manifest file is written on flush, before the journal
+            # commit: the one of the journal is the reference
+            row = self.db.execute("SELECT value FROM meta WHERE name = 'manifest'").fetchone()
+            if row is None or not self.items_file.restore(jsonio.loads(row[0])):
+                # The shards are not the ones we were writing to: start over
+                self.db.execute("DELETE FROM items")
+                self._save_meta("manifest", jsonio.dumps({"shards": []}).decode())
+                self.db.commit()
+                self.items_file.restore({"shards": []})
+            return
+
+        size = self._size()
+        if size is None:
+            return
+
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'offset'").fetchone()
+        offset = int(row[0]) if row else 0
+        if size < offset:
+            # The items file is not the one we were writing to: start over
+            self.db.execute("DELETE FROM items")
+            self._save_meta("offset", "0")
+            self.db.commit()
+        elif size > offset:
+            os.ftruncate(self.items_file.fileno(), offset)
+
+    def _size(self) -> Optional[int]:
+        self.items_file.flush()
+        if not hasattr(self.items_file, "fileno"):
+            return None
+
+        return os.fstat(self.items_file.fileno()).st_size
+
+    def _save_meta(self, name: str, value: str):
+        self.db.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+            (name, value),
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.db.execute("SELECT count(*) FROM items").fetchone()[0]
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return (
+                self.db.execute("SELECT 1 FROM items WHERE key = ?", (key,)).fetchone()
+                is not None
+            )
+
+    def count(self, collection_id: str) -> int:
+        """Number of Items already written for a collection."""
+        with self._lock:
+            return self.db.execute(
+                "SELECT count(*) FROM items WHERE collection = ?", (collection_id,)
+            ).fetchone()[0]
+
+    def add(self, key: str, item: Dict):
+        """Record an Item once it has been written to the items file."""
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO items (key, id, collection, summary) VALUES (?, ?, ?, ?)",
+                (key, item["id"], item.get("collection"), jsonio.dumps(summary(item))),
+            )
+            self._pending += 1
+
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def items(self, collection_id: str) -> Iterator[Dict[str, Any]]:
+        """Yield the summaries of the Items already written for a collection."""
+        cursor = self.db.cursor()
+        with self._lock:
+            cursor.execute(
+                "SELECT summary FROM items WHERE collection = ?", (collection_id,)
+            )
+
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+
+            for (row,) in rows:
+                yield jsonio.loads(row)
+
+    def commit(self):
+        """Flush the items file and commit the journal."""
+        with self._lock:
+            size = self._size()
+            if hasattr(self.items_file, "manifest"):
+                self._save_meta("manifest", jsonio.dumps(self.items_file.manifest()).decode())
+            elif size is not None:
+                self._save_meta("offset", str(size))
+            for name, output in self._others():
+                self._save_meta(name, jsonio.dumps(output.manifest()).decode())
+            self.db.commit()
+            self._pending = 0
+
+        for func in self.on_commit:
+            func()
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type: Any, *args: Any):
+        if exc_type is None:
+            with self._lock:
+                self._save_meta("finished", "1")
+        self.close()
@@ -0,0 +1,118 @@
+"""Single pass Collection summaries."""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+def item_assets(item: Dict) -> Dict:
+    """`item_assets` entries for the assets of an Item."""
+    return {
+        name: {
+            "type": values.get("type", "unknown"),
+            "title": values.get("title", name),
+            "roles": values.get("roles", ["data"]),
+        }
+        for name, values in item.get("assets", {}).items()
+    }
+
+
+def merge_item_assets(current: Dict, new: Dict) -> Dict:
+    """Merge `item_assets`, whatever the order Items come in.
+
+    When Items disagree on an asset, the roles are combined and the
+    smallest `type`/`title` wins, so the result does not depend on which
+    worker (thread or process) returned an Item first.
+    """
+    for name, values in new.items():
+        if name not in current:
+            current[name] = dict(values)
+            continue
+
+        existing = current[name]
+        if existing == values:
+            continue
+
+        for key in ("type", "title"):
+            existing[key] = min(existing[key], values[key], key=str)
+
+        if existing["roles"] != values["roles"]:
+            existing["roles"] = sorted(set(existing["roles"] or []) | set(values["roles"] or []))
+
+    return current
+
+
+def _parse_datetime(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class CollectionSummary:
+    """Spatial/temporal extent and `item_assets` of a Collection.
+
+    Items are folded one at a time, so memory use does not depend on the
+    number of Items.
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.item_assets: Dict[str, Dict] = {}
+        self._bbox: Optional[List[float]] = None
+        self._start: Optional[Tuple[datetime, str]] = None
+        self._end: Optional[Tuple[datetime, str]] = None
+
+    def add(self, item: Dict):
+        """Fold an Item (or a `crawler.checkpoint.summary`) into the summary."""
+        self.count += 1
+        merge_item_assets(self.item_assets, item_assets(item))
+
+        if bbox := item.get("bbox"):
+            if len(bbox) == 6:
+                bbox = [bbox[0], bbox[1], bbox[3], bbox[4]]
+
+            if self._bbox is None:
+                self._bbox = list(bbox)
+            else:
+                self._bbox = [
+                    min(self._bbox[0], bbox[0]),
+                    min(self._bbox[1], bbox[1]),
+                    max(self._bbox[2], bbox[2]),
+                    max(self._bbox[3], bbox[3]),
+                ]
+
+        properties = item.get("properties", {})
+        st = properties.get("start_datetime")
+        et = properties.get("end_datetime")
+        if not (st and et):
+            st = et = properties.get("datetime")
+
+        if st:
+            start = (_parse_datetime(st), st)
+            if self._start is None or start[0] < self._start[0]:
+                self._start = start
+
+        if et:
+            end = (_parse_datetime(et), et)
+            if self._end is None or end[0] > self._end[0]:
+                self._end = end
+
+    def as_item(self) -> Dict:
+        """The summary as an Item summary (see `crawler.checkpoint.summary`), which `add()` folds back."""
+        start, end = self.interval
+        return {
+            "bbox": self._bbox,
+            "properties": {"start_datetime": start, "end_datetime": end} if start and end else {},
+            "assets": {name: dict(values) for name, values in self.item_assets.items()},
+        }
+
+    @property
+    def bbox(self) -> Optional[List[float]]:
+        """Union of the Items bbox."""
+        return self._bbox
+
+    @property
+    def interval(self) -> List[Optional[str]]:
+        """`[start, end]` datetimes, as found in the Items."""
+        return [
+            self._start[1] if self._start else None,
+            self._end[1] if self._end else None,
+        ]
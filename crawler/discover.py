@@ -0,0 +1,152 @@
+"""Item discovery from S3 listings (ListObjectsV2, anonymous access).
+
+Listing a bucket returns up to 1000 keys per request, which is far
+cheaper than fetching every intermediate catalog of a static STAC tree
+just to read its links.
+
+    for url in discover.list_urls("s3://maxar-opendata/events/WildFires-LosAngeles-Jan-2025/ard/11/"):
+        ...
+
+Prefixes can be given as `s3://bucket/prefix` or as a public
+`https://` URL (virtual-hosted or path-style), in which case the
+returned URLs use the same host.
+"""
+
+import xml.etree.ElementTree as ET
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+from crawler import fetch, metrics, pipeline
+
+_NS = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+
+class Location(NamedTuple):
+    """S3 prefix, with the base URL its objects are served from."""
+
+    base_url: str
+    bucket: str
+    prefix: str
+    virtual_host: bool
+
+    @property
+    def list_url(self) -> str:
+        # GET https://{bucket}.s3.amazonaws.com/ or https://s3.amazonaws.com/{bucket}
+        return f"{self.base_url}/" if self.virtual_host else self.base_url
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{quote(key)}"
+
+
+def parse(url: str) -> Location:
+    """Parse `s3://bucket/prefix` or an `https://` S3 URL."""
+    parsed = urlparse(url)
+    path = parsed.path.lstrip("/")
+    if parsed.scheme == "s3":
+        return Location(f"https://{parsed.netloc}.s3.amazonaws.com", parsed.netloc, path, True)
+
+    host = parsed.netloc
+    if ".s3" in host and not host.startswith("s3"):
+        # virtual-hosted style: https://{bucket}.s3[.region].amazonaws.com/{key}
+        bucket = host.split(".s3", 1)[0]
+        return Location(f"{parsed.scheme}://{host}", bucket, path, True)
+
+    # path style: https://s3[.region].amazonaws.com/{bucket}/{key} (or a local S3 stand-in)
+    bucket, _, prefix = path.partition("/")
+    return Location(f"{parsed.scheme}://{host}/{bucket}", bucket, prefix, False)
+
+
+def http_url(url: str) -> str:
+    """Public `https://` URL of an `s3://` URL (other URLs are returned as is)."""
+    if url.startswith("s3://"):
+        location = parse(url)
+        return location.url(location.prefix)
+    return url
+
+
+def list_objects(
+    location: Location,
+    prefix: Optional[str] = None,
+    delimiter: Optional[str] = None,
+) -> Iterator[Tuple[List[str], List[str]]]:
+    """Yield `(keys, common_prefixes)` for every page of a ListObjectsV2 listing."""
+    params = {"list-type": "2", "prefix": location.prefix if prefix is None else prefix}
+    if delimiter:
+        params["delimiter"] = delimiter
+
+    while True:
+        with metrics.timer("s3_list"):
+            resp = fetch.request("GET", location.list_url, params=params)
+        root = ET.fromstring(resp.content)
+
+        keys = [el.text or "" for el in root.findall(f"{_NS}Contents/{_NS}Key")]
+        prefixes = [el.text or "" for el in root.findall(f"{_NS}CommonPrefixes/{_NS}Prefix")]
+        metrics.incr("s3_keys_total", len(keys))
+        yield keys, prefixes
+
+        token = root.findtext(f"{_NS}NextContinuationToken")
+        if root.findtext(f"{_NS}IsTruncated") != "true" or not token:
+            return
+        params["continuation-token"] = token
+
+
+def _fan_out(location: Location, depth: int) -> Tuple[List[str], List[str]]:
+    """Keys of the first `depth` levels, and the sub prefixes below them."""
+    top_keys: List[str] = []
+    level = [location.prefix]
+    for _ in range(depth):
+        next_level = []
+        for prefix in level:
+            for keys, prefixes in list_objects(location, prefix, delimiter="/"):
+                top_keys.extend(keys)
+                next_level.extend(prefixes)
+        level = next_level
+
+    return top_keys, level
+
+
+def _list_prefix(location: Location, prefix: str) -> List[str]:
+    return [key for keys, _ in list_objects(location, prefix) for key in keys]
+
+
+def list_keys(
+    url: str,
+    suffix: str = ".json",
+    exclude: Iterable[str] = ("catalog.json", "collection.json"),
+    depth: int = 2,
+    max_workers: int = 16,
+    prefixes: Optional[Iterable[str]] = None,
+) -> Iterator[str]:
+    """Yield the keys under an S3 prefix ending with `suffix`.
+
+    The first `depth` levels of sub prefixes are listed with a `/`
+    delimiter, then every sub prefix is listed (and paginated) in
+    parallel. When the key names are known to start with one of
+    `prefixes` (relative to the listed prefix), those are listed in
+    parallel instead, e.g when every object has its own `/` prefix.
+    """
+    location = parse(url)
+    exclude = tuple(exclude)
+
+    def _keep(key: str) -> bool:
+        name = key.rsplit("/", 1)[-1]
+        return key.endswith(suffix) and name not in exclude
+
+    if prefixes is None:
+        top_keys, sub_prefixes = _fan_out(location, depth)
+    else:
+        top_keys, sub_prefixes = [], [location.prefix + prefix for prefix in prefixes]
+    yield from filter(_keep, top_keys)
+    for keys in pipeline.stream(
+        lambda prefix: _list_prefix(location, prefix),
+        sub_prefixes,
+        max_workers=max_workers,
+    ):
+        yield from filter(_keep, keys)
+
+
+def list_urls(url: str, **kwargs: Any) -> Iterator[str]:
+    """Same as `list_keys`, returning the object URLs."""
+    location = parse(url)
+    for key in list_keys(url, **kwargs):
+        yield location.url(key)
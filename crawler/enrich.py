@@ -0,0 +1,165 @@
+"""Asset enrichment with HEAD requests: size, checksum and reachability.
+
+python -m crawler.enrich Maxar/items.json --output items-enriched.json --unreachable unreachable.json --concurrency 200 --cache assets.db
+
+Every asset (its public `alternate` href when it points to S3) is checked
+with a HEAD request over the shared connection pools, `--concurrency`
+assets at a time whatever the number of assets per Item. Reachable assets
+get `file:size` from `Content-Length` and, when the ETag is an MD5 (single
+part S3 uploads), `file:checksum` as an MD5 multihash. Unreachable ones
+(4xx, 5xx after retries, connection errors) are left unchanged and listed
+in the `--unreachable` NDJSON report. With `--cache`, results are kept in
+SQLite (see `crawler.cache.DocumentCache`) so assets checked less than
+`--cache-ttl` hours ago are not requested again.
+"""
+
+import re
+import time
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+import httpx
+
+from crawler import discover, fetch, jsonio, metrics, pipeline
+from crawler.cache import DocumentCache
+from crawler.retransform import read_records
+
+FILE_EXTENSION = "https://stac-extensions.github.io/file/v2.1.0/schema.json"
+
+# single part uploads: the ETag is the MD5 of the object
+_MD5_ETAG = re.compile(r'^"?([0-9a-fA-F]{32})"?$')
+
+
+def head_url(asset: Dict) -> str:
+    """URL to check an asset at (public URL of `s3://` hrefs)."""
+    public = asset.get("alternate", {}).get("public", {}).get("href")
+    return public or discover.http_url(asset["href"])
+
+
+@metrics.timed("head")
+def head(url: str, cache: Optional[DocumentCache] = None) -> Optional[Dict]:
+    """`{"size", "etag"}` of a remote file, None when it can not be reached."""
+    if cache is not None:
+        body = cache.get(url)
+        if body is not None:
+            metrics.incr("cache_hits_total")
+            return jsonio.loads(body)
+        metrics.incr("cache_misses_total")
+
+    try:
+        resp = fetch.request("HEAD", url)
+    except (httpx.HTTPStatusError, httpx.TransportError):
+        # unreachable assets are not cached, they are checked again next time
+        return None
+
+    size = resp.headers.get("Content-Length")
+    result = {"size": int(size) if size is not None else None, "etag": resp.headers.get("ETag")}
+    if cache is not None:
+        cache.put(url, jsonio.dumps(result).decode())
+    return result
+
+
+def enrich_asset(asset: Dict, result: Dict) -> Dict:
+    """Add the `file:` fields of a HEAD result."""
+    if result["size"] is not None:
+        asset["file:size"] = result["size"]
+
+    match = _MD5_ETAG.match(result["etag"] or "")
+    if match:
+        # multihash: 0xd5 (md5), 0x10 (16 bytes)
+        asset["file:checksum"] = "d510" + match.group(1).lower()
+
+    return asset
+
+
+class _Pending:
+    """An Item waiting for the HEAD requests of its assets."""
+
+    def __init__(self, item: Dict, urls: List[Tuple[str, str]]):
+        self.item = item
+        self.urls = urls
+        self.remaining = max(len(urls), 1)
+        self.unreachable: List[Tuple[str, str]] = []
+
+
+def _tasks(records: Iterable[bytes]) -> Iterator[Tuple[_Pending, Optional[str], Optional[str]]]:
+    """One `(item, asset name, url)` task per asset to check (one without asset for the other Items)."""
+    for line in records:
+        item = jsonio.loads(line)
+        urls = [(name, head_url(asset)) for name, asset in item.get("assets", {}).items()]
+        # relative or local hrefs are not checked
+        pending = _Pending(item, [(name, url) for name, url in urls if url.startswith(("http://", "https://"))])
+        if not pending.urls:
+            yield pending, None, None
+        for name, url in pending.urls:
+            yield pending, name, url
+
+
+def _check(task: Tuple[_Pending, Optional[str], Optional[str]], cache: Optional[DocumentCache] = None):
+    pending, name, url = task
+    return pending, name, url, head(url, cache) if url else None
+
+
+def enrich(records: Iterable[bytes], concurrency: int = 200, cache: Optional[DocumentCache] = None) -> Iterator[Tuple[Dict, List[Tuple[str, str]]]]:
+    """Yield `(item, unreachable (asset name, url) pairs)` for NDJSON Items, as their assets are checked."""
+    for pending, name, url, result in pipeline.stream(partial(_check, cache=cache), _tasks(records), max_workers=concurrency):
+        item = pending.item
+        if name is not None:
+            metrics.incr("assets_total", collection=item.get("collection"))
+            if result is None:
+                metrics.incr("assets_unreachable_total", collection=item.get("collection"))
+                pending.unreachable.append((name, url))
+            else:
+                enrich_asset(item["assets"][name], result)
+
+        pending.remaining -= 1
+        if pending.remaining:
+            continue
+
+        if any("file:size" in asset or "file:checksum" in asset for asset in item.get("assets", {}).values()):
+            extensions = item.setdefault("stac_extensions", [])
+            if FILE_EXTENSION not in extensions:
+                extensions.append(FILE_EXTENSION)
+
+        yield item, pending.unreachable
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True)
+@click.option("--output", "output_path", type=str, default="items.json", help="NDJSON output file.")
+@click.option("--unreachable", "unreachable_path", type=str, default="unreachable.json", help="NDJSON report of the unreachable assets (collection, item, asset, url).")
+@click.option("--concurrency", type=int, default=200, help="Number of HEAD requests in flight.")
+@click.option("--cache", "cache_path", type=str, help="Keep the results in this SQLite file, to skip the assets checked recently on the next runs.")
+@click.option("--cache-ttl", type=float, default=24 * 7, help="Hours after which cached assets are checked again (with --cache).")
+@click.option("--metrics", "metrics_path", type=str, help="Write a JSON summary of the metrics to this file.")
+def main(inputs, output_path, unreachable_path, concurrency, cache_path, cache_ttl, metrics_path):
+    """Add file:size/file:checksum to the assets of NDJSON Items, and report the unreachable ones."""
+    fetch.configure(max_connections=concurrency)
+    metrics.export(metrics_path)
+
+    # no eviction: entries are small, and they all have to be kept
+    cache = DocumentCache(cache_path, max_size=1 << 62, ttl=cache_ttl * 3600) if cache_path else None
+
+    t0 = time.perf_counter()
+    count = unreachable = 0
+    try:
+        with open(output_path, "wb", buffering=1024 * 1024) as out, open(unreachable_path, "wb") as report:
+            for path in inputs:
+                click.echo(f"Reading {path}")
+                for item, failed in enrich(read_records(path), concurrency, cache):
+                    out.write(jsonio.dumps(item) + b"\n")
+                    count += 1
+                    for name, url in failed:
+                        report.write(jsonio.dumps({"collection": item.get("collection"), "item": item["id"], "asset": name, "url": url}) + b"\n")
+                    unreachable += len(failed)
+    finally:
+        if cache:
+            cache.close()
+
+    elapsed = time.perf_counter() - t0
+    click.echo(f"{count} items enriched to {output_path} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} items/s), {unreachable} unreachable assets (see {unreachable_path})")
+
+
+if __name__ == "__main__":
+    main()
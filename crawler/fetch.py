@@ -0,0 +1,197 @@
+"""Pooled HTTP fetch layer shared by the generators."""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+import pystac
+from pystac.stac_io import DefaultStacIO
+
+from crawler import metrics, throttle
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # pragma: nocover
+    h2 = None  # type: ignore
+
+
+def _key(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+class ClientPool:
+    """One keep-alive `httpx.Client`, and one concurrency limiter, per host.
+
+    httpx limits are enforced per client, so keeping a client per
+    `scheme://host` gives each host its own connection budget while every
+    request to the same S3 endpoint reuses the same pooled connections.
+
+    With `adaptive`, the number of requests in flight to a host starts at
+    `initial_concurrency` and follows `throttle.AdaptiveLimiter` (up to
+    `max_connections`), otherwise it is fixed to `max_connections`.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 50,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        http2: bool = True,
+        retries: int = 5,
+        adaptive: bool = True,
+        initial_concurrency: int = 8,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections or max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout)
+        self.http2 = http2 and h2 is not None
+        self.retries = retries
+        self.max_connections = max_connections
+        self.initial_concurrency = initial_concurrency if adaptive else max_connections
+        self._clients: Dict[str, httpx.Client] = {}
+        self._limiters: Dict[str, throttle.AdaptiveLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> httpx.Client:
+        """Return the client for the host of `url`."""
+        key = _key(url)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = httpx.Client(
+                        limits=self.limits,
+                        timeout=self.timeout,
+                        http2=self.http2,
+                        follow_redirects=True,
+                    )
+                    self._clients[key] = client
+        return client
+
+    def limiter(self, url: str) -> throttle.AdaptiveLimiter:
+        """Return the concurrency limiter for the host of `url`."""
+        key = _key(url)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.setdefault(
+                    key,
+                    throttle.AdaptiveLimiter(self.max_connections, initial=self.initial_concurrency),
+                )
+        return limiter
+
+    def close(self):
+        """Close all the clients."""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients = {}
+
+
+_pool = ClientPool()
+
+
+def configure(**kwargs: Any) -> ClientPool:
+    """Replace the shared pool (see `ClientPool` for options).
+
+    Also makes pystac read catalogs, collections and items through the pool.
+    """
+    global _pool
+    _pool.close()
+    _pool = ClientPool(**kwargs)
+    pystac.StacIO.set_default(HttpxStacIO)
+    return _pool
+
+
+def get_client(url: str) -> httpx.Client:
+    """Return the pooled client for `url`."""
+    return _pool.get(url)
+
+
+def request(method: str, url: str, stream: bool = False, **kwargs: Any) -> httpx.Response:
+    """Send a request using the shared pool.
+
+    Throttling (429, 503), transient server errors and transport errors
+    are retried with exponential backoff and jitter, honouring
+    `Retry-After`, while other errors (e.g 404) are raised at once.
+    `304 Not Modified` responses (conditional requests) are returned as is.
+
+    With `stream=True`, the body is not read: the caller reads it (or not)
+    and closes the response.
+    """
+    host = urlparse(url).netloc
+    client = get_client(url)
+    limiter = _pool.limiter(url)
+
+    attempt = 0
+    while True:
+        resp: Optional[httpx.Response] = None
+        error: Optional[Exception] = None
+        with limiter:
+            started = time.monotonic()
+            t0 = time.perf_counter()
+            try:
+                resp = client.send(client.build_request(method, url, **kwargs), stream=stream)
+            except httpx.TransportError as e:
+                error = e
+                metrics.incr("http_errors_total", host=host, error=type(e).__name__)
+            finally:
+                metrics.observe("http_request_seconds", time.perf_counter() - t0, host=host)
+
+        if resp is not None:
+            metrics.incr("http_requests_total", host=host, status=resp.status_code)
+            if resp.status_code >= 400:
+                metrics.incr("http_errors_total", host=host, error=resp.status_code)
+
+            if resp.status_code not in throttle.RETRYABLE_STATUS:
+                limiter.success()
+                if resp.status_code != 304 and resp.is_error:
+                    resp.close()
+                    resp.raise_for_status()
+                return resp
+
+            resp.close()
+
+        wait = None
+        if resp is None or resp.status_code in throttle.THROTTLE_STATUS:
+            wait = throttle.retry_after(resp) if resp is not None else None
+            limiter.throttle(started, pause=wait)
+            metrics.incr("throttled_total", host=host)
+        metrics.gauge("concurrency_limit", int(limiter.limit), host=host)
+
+        attempt += 1
+        if attempt > _pool.retries:
+            if error is not None:
+                raise error
+            resp.raise_for_status()  # type: ignore
+
+        metrics.incr("retries_total", host=host)
+        time.sleep(max(wait or 0.0, throttle.backoff(attempt)))
+
+
+def get(url: str, **kwargs: Any) -> httpx.Response:
+    """GET `url` using the shared pool."""
+    return request("GET", url, **kwargs)
+
+
+def get_json(url: str) -> Dict:
+    """Fetch a JSON document."""
+    return get(url).json()
+
+
+class HttpxStacIO(DefaultStacIO):
+    """pystac StacIO reading remote documents with the shared pool."""
+
+    def read_text_from_href(self, href: str) -> str:
+        if urlparse(href).scheme in ("http", "https"):
+            return get(href, headers=self.headers).text
+
+        return super().read_text_from_href(href)
@@ -0,0 +1,412 @@
+"""stac-geoparquet output, written in row groups from the Item stream.
+
+Items are flattened as in stac-geoparquet: `properties` become top level
+columns (datetimes as UTC timestamps), `geometry` is WKB and `bbox` a
+`{xmin, ymin, xmax, ymax}` struct. Files are partitioned per collection
+(`{directory}/collection={id}/part-00000.parquet`), with GeoParquet 1.1
+metadata.
+
+Needs `pyarrow` (only imported when a writer is created). Existing NDJSON
+outputs can be converted with:
+
+python -m crawler.geoparquet Umbra/items.json.zip --output umbra-parquet
+"""
+
+import itertools
+import json
+import os
+import re
+import struct
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import click
+
+from crawler import jsonio, metrics
+
+DATETIME_PROPERTIES = ("datetime", "start_datetime", "end_datetime", "created", "updated")
+
+_WKB_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+
+
+def _has_z(geometry: Dict) -> bool:
+    coords = geometry.get("coordinates")
+    while isinstance(coords, list) and coords and isinstance(coords[0], list):
+        coords = coords[0]
+    return bool(coords) and len(coords) > 2
+
+
+def _points(coords: List, dim: int) -> bytes:
+    fmt = "<" + "d" * dim
+    return struct.pack("<I", len(coords)) + b"".join(struct.pack(fmt, *c[:dim]) for c in coords)
+
+
+def wkb(geometry: Dict, dim: Optional[int] = None) -> bytes:
+    """ISO WKB (little endian) of a GeoJSON geometry."""
+    geom_type = geometry["type"]
+    if dim is None:
+        dim = 3 if geom_type != "GeometryCollection" and _has_z(geometry) else 2
+
+    code = _WKB_TYPES[geom_type] + (1000 if dim == 3 else 0)
+    head = struct.pack("<BI", 1, code)
+    coords = geometry.get("coordinates")
+
+    if geom_type == "Point":
+        return head + struct.pack("<" + "d" * dim, *coords[:dim])
+    if geom_type == "LineString":
+        return head + _points(coords, dim)
+    if geom_type == "Polygon":
+        return head + struct.pack("<I", len(coords)) + b"".join(_points(ring, dim) for ring in coords)
+    if geom_type == "GeometryCollection":
+        parts = [wkb(g) for g in geometry["geometries"]]
+    else:
+        part_type = geom_type[len("Multi"):]
+        parts = [wkb({"type": part_type, "coordinates": c}, dim) for c in coords]
+
+    return head + struct.pack("<I", len(parts)) + b"".join(parts)
+
+
+def _parse_datetime(value: Any) -> Any:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value
+
+
+def to_row(item: Dict) -> Dict:
+    """Flatten an Item into a stac-geoparquet row."""
+    row = {key: value for key, value in item.items() if key not in ("properties", "geometry", "bbox")}
+    for key, value in item.get("properties", {}).items():
+        row[key] = _parse_datetime(value) if key in DATETIME_PROPERTIES else value
+
+    geometry = item.get("geometry")
+    row["geometry"] = wkb(geometry) if geometry else None
+
+    bbox = item.get("bbox")
+    if bbox and len(bbox) == 6:
+        row["bbox"] = dict(zip(("xmin", "ymin", "zmin", "xmax", "ymax", "zmax"), bbox))
+    elif bbox:
+        row["bbox"] = dict(zip(("xmin", "ymin", "xmax", "ymax"), bbox))
+    return row
+
+
+def _geo_metadata() -> bytes:
+    # without "crs", readers default to OGC:CRS84 (a null "crs" means unknown)
+    return json.dumps({
+        "version": "1.1.0",
+        "primary_column": "geometry",
+        "columns": {
+            "geometry": {
+                "encoding": "WKB",
+                "geometry_types": [],
+                "covering": {
+                    "bbox": {
+                        "xmin": ["bbox", "xmin"],
+                        "ymin": ["bbox", "ymin"],
+                        "xmax": ["bbox", "xmax"],
+                        "ymax": ["bbox", "ymax"],
+                    }
+                },
+            }
+        },
+    }).encode()
+
+
+_PART_NAME = re.compile(r"_?part-(\d{5})\.(parquet|ndjson)(\.tmp)?")
+
+
+def _unify(pa: Any, schemas: List[Any]) -> Any:
+    try:
+        # int and float columns, or structs with other fields (e.g assets)
+        return pa.unify_schemas(schemas, promote_options="permissive")
+    except TypeError:
+        # pyarrow < 14
+        return pa.unify_schemas(schemas)
+
+
+class _Partition:
+    """Parquet files of one collection.
+
+    Items are appended to a NDJSON journal (`_part-00000.ndjson`), which is
+    flushed with the checkpoint and truncated back to it on resume. It is
+    only converted to `part-00000.parquet` by `finish()`, with one schema
+    unified over all its Items: a new file is only started for a column
+    changing to an incompatible type.
+    """
+
+    def __init__(self, directory: str, compression: str, row_group_size: int):
+        self.directory = directory
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.files: List[str] = []
+        # name of the next Parquet file, whose Items are in the journal
+        self.pending: Optional[str] = None
+        self.file: Any = None
+
+    def _names(self) -> List[str]:
+        return [name for name in os.listdir(self.directory) if _PART_NAME.fullmatch(name)]
+
+    def _journal(self, name: str) -> str:
+        return os.path.join(self.directory, "_" + name.replace(".parquet", ".ndjson"))
+
+    @property
+    def journal(self) -> str:
+        return self._journal(str(self.pending))
+
+    def write(self, obj: Dict):
+        if self.file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.pending is None:
+                indexes = [int(_PART_NAME.fullmatch(name)[1]) for name in self._names()]
+                self.pending = f"part-{max(indexes, default=-1) + 1:05d}.parquet"
+            self.file = open(self.journal, "ab", buffering=1024 * 1024)
+
+        with metrics.timer("encode"):
+            data = jsonio.dumps(obj) + b"\n"
+        self.file.write(data)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def manifest(self) -> Dict:
+        self.flush()
+        return {
+            "files": list(self.files),
+            "pending": self.pending,
+            "bytes": os.path.getsize(self.journal) if self.pending else 0,
+        }
+
+    def check(self, entry: Dict) -> bool:
+        """Whether the files of a manifest entry are still there."""
+        if any(not os.path.exists(os.path.join(self.directory, name)) for name in entry["files"]):
+            return False
+
+        if entry["pending"]:
+            journal = self._journal(entry["pending"])
+            if os.path.exists(journal):
+                return os.path.getsize(journal) >= entry["bytes"]
+            # converted by `finish()` after the last commit
+            return os.path.exists(os.path.join(self.directory, entry["pending"]))
+
+        return True
+
+    def load(self, entry: Optional[Dict]):
+        """Go back to a manifest entry, removing the files written after it."""
+        keep = set(entry["files"]) if entry else set()
+        self.files = list(keep)
+        if entry and entry["pending"]:
+            self.pending = entry["pending"]
+            if os.path.exists(self.journal):
+                with open(self.journal, "r+b") as f:
+                    f.truncate(entry["bytes"])
+                keep.add(os.path.basename(self.journal))
+            else:
+                # the journal was converted once the crawl ended: these files hold its Items
+                first = int(_PART_NAME.fullmatch(self.pending)[1])
+                converted = [
+                    name for name in self._names()
+                    if name.endswith(".parquet") and not name.startswith("_") and int(_PART_NAME.fullmatch(name)[1]) >= first
+                ]
+                self.files.extend(converted)
+                keep.update(converted)
+                self.pending = None
+
+        for name in self._names():
+            if name not in keep:
+                os.remove(os.path.join(self.directory, name))
+        self.files.sort()
+
+    def _tables(self, pa: Any) -> Iterator[Any]:
+        with open(self.journal, "rb") as f:
+            while True:
+                lines = list(itertools.islice(f, self.row_group_size))
+                if not lines:
+                    return
+                yield pa.Table.from_pylist([to_row(jsonio.loads(line)) for line in lines])
+
+    def finish(self, pa: Any, pq: Any):
+        """Convert the journal to Parquet files."""
+        if self.pending is None:
+            return
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        # first pass: one schema for all the row groups, unless a column
+        # changes to an incompatible type
+        schemas: List[Any] = []
+        segments: List[int] = []
+        for table in self._tables(pa):
+            schema = None
+            if schemas:
+                try:
+                    schema = _unify(pa, [schemas[-1], table.schema])
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    pass
+
+            if schema is None:
+                schemas.append(table.schema)
+            else:
+                schemas[-1] = schema
+            segments.append(len(schemas) - 1)
+
+        first = int(_PART_NAME.fullmatch(self.pending)[1])
+        names = [f"part-{first + i:05d}.parquet" for i in range(len(schemas))]
+        writer: Any = None
+        current = -1
+        try:
+            for table, segment in zip(self._tables(pa), segments):
+                schema = schemas[segment]
+                if segment != current:
+                    current = segment
+                    if writer is not None:
+                        writer.close()
+                    # written under a temporary name, only renamed once complete
+                    writer = pq.ParquetWriter(
+                        os.path.join(self.directory, f"_{names[segment]}.tmp"),
+                        schema.with_metadata({b"geo": _geo_metadata()}),
+                        compression=self.compression,
+                    )
+
+                table = pa.Table.from_arrays(
+                    [
+                        table.column(field.name).cast(field.type)
+                        if field.name in table.column_names
+                        else pa.nulls(len(table), field.type)
+                        for field in schema
+                    ],
+                    schema=writer.schema,
+                )
+                with metrics.timer("parquet_write"):
+                    writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        for name in names:
+            os.replace(os.path.join(self.directory, f"_{name}.tmp"), os.path.join(self.directory, name))
+        self.files.extend(names)
+        os.remove(self.journal)
+        self.pending = None
+
+
+def check_pyarrow(ctx: click.Context, param: click.Parameter, value: Optional[str]) -> Optional[str]:
+    """click callback of the `--geoparquet` options: fail before crawling when pyarrow is missing."""
+    if value:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise click.BadParameter("`pyarrow` is required to write stac-geoparquet") from None
+    return value
+
+
+class GeoparquetWriter:
+    """Write Items to stac-geoparquet files, partitioned per collection.
+
+    Items are journaled per collection while crawling and converted to
+    Parquet, in row groups of `row_group_size` Items, by `close()` (see
+    `_Partition`). With `crawler.checkpoint.Checkpoint`, the `manifest()`
+    of the journals is committed along with the Items, and `restore()`
+    truncates them back to it on resume, so an interrupted crawl loses
+    none of the Items already committed.
+
+    """
+
+    def __init__(self, directory: str, row_group_size: int = 10_000, compression: str = "zstd"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("`pyarrow` is required to write stac-geoparquet") from None
+
+        self.pa, self.pq = pa, pq
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self._partitions: Dict[str, _Partition] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(root, name))
+
+    def _partition(self, name: str) -> _Partition:
+        partition = self._partitions.get(name)
+        if partition is None:
+            partition = _Partition(os.path.join(self.directory, name), self.compression, self.row_group_size)
+            self._partitions[name] = partition
+        return partition
+
+    def write(self, obj: Dict):
+        name = re.sub(r"[^\w.-]", "_", obj.get("collection") or "none")
+        self._partition(f"collection={name}").write(obj)
+
+    def flush(self):
+        for partition in self._partitions.values():
+            partition.flush()
+
+    def manifest(self) -> Dict:
+        """Parquet files and journal sizes of every collection."""
+        return {"partitions": {name: partition.manifest() for name, partition in self._partitions.items()}}
+
+    def restore(self, manifest: Optional[Dict]) -> bool:
+        """Go back to a manifest committed elsewhere (`None` to start over).
+
+        Returns False, without changing anything, when files of `manifest`
+        are missing (it is not a manifest of this directory).
+        """
+        entries = manifest["partitions"] if manifest else {}
+        if not all(self._partition(name).check(entry) for name, entry in entries.items()):
+            return False
+
+        for name in os.listdir(self.directory):
+            if name.startswith("collection=") and os.path.isdir(os.path.join(self.directory, name)):
+                self._partition(name).load(entries.get(name))
+        return True
+
+    def close(self):
+        for partition in self._partitions.values():
+            partition.finish(self.pa, self.pq)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True)
+@click.option("--output", "output_path", type=str, required=True, help="Output directory.")
+@click.option("--row-group-size", type=int, default=10_000)
+@click.option("--compression", type=click.Choice(["zstd", "snappy", "gzip", "none"]), default="zstd")
+def main(inputs, output_path, row_group_size, compression):
+    """Convert NDJSON Items (plain, .zip, .gz, .zst or shards) to stac-geoparquet."""
+    from crawler.retransform import read_records
+
+    t0 = time.perf_counter()
+    count = 0
+    with GeoparquetWriter(output_path, row_group_size=row_group_size, compression=compression) as writer:
+        for path in inputs:
+            click.echo(f"Reading {path}")
+            for line in read_records(path):
+                writer.write(jsonio.loads(line))
+                count += 1
+
+    elapsed = time.perf_counter() - t0
+    click.echo(f"{count} items written to {output_path} in {elapsed:.1f}s ({count / elapsed:.0f} items/s)")
+
+
+if __name__ == "__main__":
+    main()
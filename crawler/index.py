@@ -0,0 +1,262 @@
+"""Compact index of the Items emitted, shared across runs and generators.
+
+Two sets of 64-bit hashes are kept in sorted `array('Q')`:
+
+- the keys (URL or id) Items were fetched from, so that Items already
+  emitted by a previous run can be skipped before they are fetched,
+- the `{collection}/{id}` of the Items written, and of the pairs of id and
+  key it came from, so that two distinct sources rewritten to the same Item
+  id (e.g `a/b` and `a_b`) are reported instead of being silently dropped
+  by `pypgstac load --method insert_ignore`.
+
+The Items are also folded into one `CollectionSummary` per collection,
+kept in `{path}.summaries`, so that the extent and `item_assets` of a
+Collection still cover the Items skipped because they are in the index.
+
+That is 24 bytes per Item, and a lookup is a binary search (a few
+microseconds at millions of Items). With 64-bit hashes, the probability of
+a false positive stays below 1e-6 up to ~5 million Items.
+
+`save()` runs with every checkpoint commit (`Checkpoint(..., on_commit=[index.save])`):
+it only appends the hashes added since the previous save to `{path}.log`
+(after rewriting the summaries, which may be ahead of the hashes but
+never behind),
+which is merged into `path` on `close()` or once it grows past a quarter
+of the index.
+
+    with IdIndex("ids.idx") as index:
+        if url not in index:
+            ...
+            if index.add(url, item):
+                f_itm.write(item)
+"""
+
+import hashlib
+import itertools
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import click
+
+from crawler import jsonio, metrics
+from crawler.collection import CollectionSummary
+
+MAGIC = b"STACIDX1"
+_HEADER = struct.Struct("<8sQQQ")
+# number of keys, ids and pairs of a log record
+_RECORD = struct.Struct("<QQQ")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+def _find(values: array, value: int) -> int:
+    """Position of `value` in a sorted array, or -1."""
+    i = bisect_left(values, value)
+    return i if i < len(values) and values[i] == value else -1
+
+
+class IdIndex:
+    """Sorted hashes of the keys and Item ids emitted.
+
+    New entries are buffered and merged into the sorted arrays when the
+    buffer grows past a quarter of the index. The index is written to
+    `path` by `save()` (appended to its log) and `close()` (atomically
+    rewritten); without a path it only lives for the run, which still
+    detects collisions within the run.
+
+    """
+
+    def __init__(self, path: Optional[str] = None, min_buffer: int = 65536):
+        self.path = path
+        self.min_buffer = min_buffer
+        self.collisions: List[Tuple[str, str, str]] = []
+        self._lock = threading.Lock()
+
+        # sorted hashes of the keys, ids and (id, key) pairs, and the
+        # hashes added since the last merge
+        self._sorted = [array("Q"), array("Q"), array("Q")]
+        self._new: List[Set[int]] = [set(), set(), set()]
+        # hashes added since the last save, and number of hashes in the log
+        self._unsaved = [array("Q"), array("Q"), array("Q")]
+        self._logged = 0
+        self._summaries: Dict[str, CollectionSummary] = {}
+        self._summaries_changed = False
+
+        if path and os.path.exists(f"{path}.summaries"):
+            with open(f"{path}.summaries", "rb") as f:
+                for collection_id, item in jsonio.loads(f.read()).items():
+                    self._summaries[collection_id] = CollectionSummary()
+                    self._summaries[collection_id].add(item)
+        if path and os.path.exists(path):
+            self._load(path)
+        if path and os.path.exists(f"{path}.log"):
+            self._load_log(f"{path}.log")
+
+    def _load(self, path: str):
+        with open(path, "rb") as f:
+            magic, *counts = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an Item index")
+
+            for values, count in zip(self._sorted, counts):
+                values.fromfile(f, count)
+                if sys.byteorder == "big":
+                    values.byteswap()
+
+    def _load_log(self, path: str):
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    break
+
+                record = [array("Q") for _ in range(3)]
+                try:
+                    for values, count in zip(record, _RECORD.unpack(header)):
+                        values.fromfile(f, count)
+                except EOFError:
+                    # interrupted while appending this record
+                    break
+
+                for kind, values in enumerate(record):
+                    if sys.byteorder == "big":
+                        values.byteswap()
+                    self._new[kind].update(h for h in values if _find(self._sorted[kind], h) < 0)
+                    self._logged += len(values)
+
+        self._merge()
+
+    def __len__(self) -> int:
+        return len(self._sorted[1]) + len(self._new[1])
+
+    def _has(self, kind: int, h: int) -> bool:
+        return h in self._new[kind] or _find(self._sorted[kind], h) >= 0
+
+    def __contains__(self, key: str) -> bool:
+        """Whether an Item was already emitted from this key."""
+        h = _hash(key)
+        with self._lock:
+            return self._has(0, h)
+
+    def add(self, key: str, item: Dict) -> bool:
+        """Record an Item fetched from `key`.
+
+        Returns False when its id was already emitted, in the same
+        collection, from another key: the collision is reported and the
+        Item should not be written. An Item emitted again from the same key
+        (e.g an update found by an incremental run) is not a collision.
+
+        """
+        collection_id = item.get("collection") or ""
+        item_id = f"{collection_id}/{item['id']}"
+        hashes = (_hash(key), _hash(item_id), _hash(f"{item_id}\0{key}"))
+
+        with self._lock:
+            known = [self._has(kind, h) for kind, h in enumerate(hashes)]
+            if known[1] and not known[2]:
+                self.collisions.append((collection_id, item["id"], key))
+                metrics.incr("id_collisions_total", collection=collection_id)
+                click.echo(f"Item id collision: {collection_id}/{item['id']} ({key}) was already emitted from another source", err=True)
+                return False
+
+            for kind, h in enumerate(hashes):
+                if not known[kind]:
+                    self._new[kind].add(h)
+                    self._unsaved[kind].append(h)
+
+            if collection_id not in self._summaries:
+                self._summaries[collection_id] = CollectionSummary()
+            self._summaries[collection_id].add(item)
+            self._summaries_changed = True
+
+            if sum(map(len, self._new)) >= max(self.min_buffer, len(self._sorted[1]) // 4):
+                self._merge()
+
+        return True
+
+    def summaries(self, collection_id: str) -> Iterator[Dict]:
+        """Yield the summary of the Items emitted for a collection (see `CollectionSummary.as_item`)."""
+        with self._lock:
+            summary = self._summaries.get(collection_id)
+            if summary is not None:
+                yield summary.as_item()
+
+    def _save_summaries(self):
+        if not self._summaries_changed:
+            return
+
+        tmp = f"{self.path}.summaries.tmp"
+        with open(tmp, "wb") as f:
+            f.write(jsonio.dumps({collection_id: summary.as_item() for collection_id, summary in self._summaries.items()}))
+        os.replace(tmp, f"{self.path}.summaries")
+        self._summaries_changed = False
+
+    def _merge(self):
+        for kind, new in enumerate(self._new):
+            if new:
+                # timsort merges the two sorted runs in linear time
+                self._sorted[kind] = array("Q", sorted(itertools.chain(self._sorted[kind], new)))
+                self._new[kind] = set()
+
+    def save(self):
+        """Append the entries added since the last save to the index log."""
+        if not self.path:
+            return
+
+        with self._lock:
+            if not any(self._unsaved):
+                return
+
+            self._save_summaries()
+            unsaved = sum(map(len, self._unsaved))
+            if self._logged + unsaved > sum(map(len, self._sorted)) // 4:
+                self._write()
+                return
+
+            with metrics.timer("index_save"), open(f"{self.path}.log", "ab") as f:
+                f.write(_RECORD.pack(*map(len, self._unsaved)))
+                for values in self._unsaved:
+                    if sys.byteorder == "big":
+                        values.byteswap()
+                    values.tofile(f)
+            self._logged += unsaved
+            self._unsaved = [array("Q"), array("Q"), array("Q")]
+
+    def _write(self):
+        """Rewrite the whole index, atomically, and drop its log."""
+        with metrics.timer("index_save"):
+            self._save_summaries()
+            self._merge()
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, *map(len, self._sorted)))
+                for values in self._sorted:
+                    if sys.byteorder == "big":
+                        values = array("Q", values)
+                        values.byteswap()
+                    values.tofile(f)
+            os.replace(tmp, self.path)
+            if os.path.exists(f"{self.path}.log"):
+                os.remove(f"{self.path}.log")
+            self._logged = 0
+            self._unsaved = [array("Q"), array("Q"), array("Q")]
+
+    def close(self):
+        if self.path:
+            with self._lock:
+                self._write()
+        if self.collisions:
+            click.echo(f"{len(self.collisions)} Items skipped because of id collisions", err=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
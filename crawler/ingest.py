@@ -0,0 +1,160 @@
+"""Stream Items and Collections directly into pgSTAC."""
+
+import threading
+from queue import Queue
+from typing import Any, Dict, List, Optional, Set
+
+from psycopg_pool import ConnectionPool
+from pypgstac.db import PgstacDB
+from pypgstac.load import Loader, Methods
+
+from crawler import metrics
+
+_DONE = object()
+
+
+def _stub_collection(collection_id: str) -> Dict:
+    """Placeholder Collection, replaced once the generator writes the real one."""
+    return {
+        "type": "Collection",
+        "id": collection_id,
+        "stac_version": "1.0.0",
+        "description": collection_id,
+        "links": [],
+        "license": "proprietary",
+        "extent": {
+            "spatial": {"bbox": [[-180, -90, 180, 90]]},
+            "temporal": {"interval": [[None, None]]},
+        },
+    }
+
+
+class PgstacWriter:
+    """Load STAC objects into pgSTAC while they are being crawled.
+
+    Collections are upserted as soon as they are written. Items are put on
+    a bounded queue and loaded by a background thread, in batches of
+    `batch_size`, using pypgstac's COPY based loader. The crawl keeps
+    fetching while the previous batch is being loaded.
+
+    pgSTAC needs the Collection to exist before its Items are loaded, while
+    the generators only write a Collection once all its Items are known:
+    a placeholder Collection is created for unknown collection ids and
+    replaced when the real Collection is written.
+
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        method: str = "upsert",
+        batch_size: int = 1000,
+        pool_size: int = 4,
+    ):
+        self.method = Methods(method)
+        self.batch_size = batch_size
+        self.pool = ConnectionPool(dsn, min_size=1, max_size=pool_size, open=True)
+
+        self._collections = Loader(PgstacDB(pool=self.pool))
+        self._known: Set[str] = set()
+        self._queue: "Queue[Any]" = Queue(maxsize=batch_size * 2)
+        self._error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def _ensure_collections(self, loader: Loader, items: List[Dict]):
+        missing = {item["collection"] for item in items} - self._known
+        if not missing:
+            return
+
+        conn = loader.db.connect()
+        rows = conn.execute(
+            "SELECT id FROM collections WHERE id = ANY(%s)", (list(missing),)
+        ).fetchall()
+        existing = {row[0] for row in rows}
+        stubs = [_stub_collection(cid) for cid in missing - existing]
+        if stubs:
+            loader.load_collections(iter(stubs), Methods.insert_ignore)
+
+        self._known |= missing
+
+    def _load_items(self):
+        loader = Loader(PgstacDB(pool=self.pool))
+        batch: List[Dict] = []
+
+        def _flush():
+            if batch:
+                with metrics.timer("pgstac_load"):
+                    self._ensure_collections(loader, batch)
+                    loader.load_items(iter(batch), self.method, chunksize=self.batch_size)
+                metrics.incr("pgstac_items_total", len(batch))
+                batch.clear()
+
+        try:
+            while True:
+                obj = self._queue.get()
+                if obj is _DONE:
+                    _flush()
+                    return
+
+                if isinstance(obj, threading.Event):
+                    _flush()
+                    obj.set()
+                    continue
+
+                batch.append(obj)
+                if len(batch) >= self.batch_size:
+                    _flush()
+
+        except BaseException as e:  # noqa: B036
+            self._error = e
+
+            # unblock writers and flushes
+            while True:
+                obj = self._queue.get()
+                if isinstance(obj, threading.Event):
+                    obj.set()
+                if obj is _DONE:
+                    return
+
+    def write(self, obj: Dict):
+        """Queue an Item, or upsert a Collection."""
+        self._check()
+        if obj.get("type") == "Collection":
+            # the real Collection replaces the placeholder
+            self._collections.load_collections(iter([obj]), Methods.upsert)
+            self._known.add(obj["id"])
+            return
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load_items, daemon=True)
+            self._thread.start()
+
+        self._queue.put(obj)
+        metrics.gauge("pgstac_queue", self._queue.qsize())
+
+    def flush(self):
+        """Wait until every queued Item is loaded."""
+        if self._thread is None:
+            return
+
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        self._check()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_DONE)
+            self._thread.join()
+        self.pool.close()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
@@ -0,0 +1,49 @@
+"""JSON (de)serialisation backends.
+
+`orjson` is used when installed, stdlib `json` otherwise. Both encode to
+bytes so NDJSON can be written to binary, buffered files directly.
+"""
+
+import json
+from typing import Any, Callable, Dict, NamedTuple, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: nocover
+    orjson = None  # type: ignore
+
+
+class Backend(NamedTuple):
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Union[bytes, str]], Any]
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+backends: Dict[str, Backend] = {
+    "json": Backend("json", _json_dumps, json.loads),
+}
+if orjson is not None:
+    backends["orjson"] = Backend("orjson", orjson.dumps, orjson.loads)
+
+backend = backends.get("orjson", backends["json"])
+
+
+def set_backend(name: str) -> Backend:
+    """Select the backend used by `dumps`/`loads`."""
+    global backend
+    backend = backends[name]
+    return backend
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode `obj` to JSON bytes."""
+    return backend.dumps(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode a JSON document."""
+    return backend.loads(data)
@@ -0,0 +1,255 @@
+"""Crawl instrumentation: stage timers, counters, histograms and gauges.
+
+Every helper records into a process wide `Metrics` registry, which can be
+exported as a JSON summary at the end of a run and as a Prometheus text
+file (for the node_exporter textfile collector) during the run.
+
+    with metrics.timer("walk"):
+        ...
+    metrics.incr("http_requests_total", host="example.com", status=200)
+    metrics.observe("http_request_seconds", 0.12, host="example.com")
+    metrics.gauge("pipeline_pending", 42)
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative bucket counts, Prometheus style."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile (capped to the maximum)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """Thread safe registry of the crawl metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.timers: Dict[Key, List[float]] = {}
+            self.counters: Dict[Key, float] = {}
+            self.histograms: Dict[Key, Histogram] = {}
+            self.gauges: Dict[Key, List[float]] = {}
+
+    def add_time(self, stage: str, seconds: float, count: int = 1, **labels: Any):
+        key = _key(stage, labels)
+        with self._lock:
+            timer = self.timers.setdefault(key, [0, 0.0])
+            timer[0] += count
+            timer[1] += seconds
+
+    @contextmanager
+    def timer(self, stage: str, **labels: Any) -> Iterator[None]:
+        """Time a block of code, accumulated per stage."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - t0, **labels)
+
+    def timed(self, stage: str, **labels: Any) -> Callable[[Callable], Callable]:
+        """Decorator timing every call of a function."""
+
+        def _decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def _wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.timer(stage, **labels):
+                    return func(*args, **kwargs)
+
+            return _wrapper
+
+        return _decorator
+
+    def iterate(self, stage: str, iterable: Iterable[Any], **labels: Any) -> Iterator[Any]:
+        """Yield from `iterable`, timing how long each object takes to be produced."""
+        iterator = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                obj = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(stage, time.perf_counter() - t0, **labels)
+            yield obj
+
+    def incr(self, name: str, value: float = 1, **labels: Any):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def gauge(self, name: str, value: float, **labels: Any):
+        """Set a gauge (e.g a queue depth), keeping track of its maximum."""
+        key = _key(name, labels)
+        with self._lock:
+            current = self.gauges.get(key)
+            if current is None:
+                self.gauges[key] = [value, value]
+            else:
+                current[0] = value
+                current[1] = max(current[1], value)
+
+    def summary(self) -> Dict:
+        """JSON serialisable summary."""
+
+        def _name(key: Key) -> str:
+            name, labels = key
+            return name + _format_labels(labels)
+
+        with self._lock:
+            return {
+                "elapsed_s": round(time.time() - self.started, 3),
+                "stages": {
+                    _name(key): {
+                        "count": int(count),
+                        "total_s": round(total, 3),
+                        "mean_ms": round(total / count * 1000, 3) if count else 0.0,
+                    }
+                    for key, (count, total) in sorted(self.timers.items())
+                },
+                "counters": {_name(key): value for key, value in sorted(self.counters.items())},
+                "histograms": {
+                    _name(key): {
+                        "count": hist.count,
+                        "sum_s": round(hist.sum, 3),
+                        "p50_s": hist.quantile(0.5),
+                        "p99_s": hist.quantile(0.99),
+                        "buckets": {str(b): c for b, c in zip(hist.buckets, hist.counts)},
+                    }
+                    for key, hist in sorted(self.histograms.items())
+                },
+                "gauges": {
+                    _name(key): {"value": value, "max": peak}
+                    for key, (value, peak) in sorted(self.gauges.items())
+                },
+            }
+
+    def prometheus(self, prefix: str = "stac_crawler_") -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for (stage, labels), (count, total) in sorted(self.timers.items()):
+                lbl = _format_labels(labels, stage=stage)
+                lines.append(f"{prefix}stage_seconds_total{lbl} {total}")
+                lines.append(f"{prefix}stage_calls_total{lbl} {count}")
+
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+
+            for (name, labels), hist in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(f"{prefix}{name}_bucket{_format_labels(labels, le=le)} {cumulative}")
+                lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {hist.sum}")
+                lines.append(f"{prefix}{name}_count{_format_labels(labels)} {hist.count}")
+
+            for (name, labels), (value, peak) in sorted(self.gauges.items()):
+                lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+                lines.append(f"{prefix}{name}_max{_format_labels(labels)} {peak}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str):
+        _atomic_write(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path: str):
+        _atomic_write(path, self.prometheus())
+
+
+def _atomic_write(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+registry = Metrics()
+
+add_time = registry.add_time
+timer = registry.timer
+timed = registry.timed
+iterate = registry.iterate
+incr = registry.incr
+observe = registry.observe
+gauge = registry.gauge
+
+
+def export(json_path: Optional[str] = None, prometheus_path: Optional[str] = None, interval: float = 10.0):
+    """Write the metrics when the process exits, and every `interval` seconds to `prometheus_path`."""
+    if prometheus_path:
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                registry.write_prometheus(prometheus_path)
+
+        threading.Thread(target=_loop, daemon=True).start()
+
+    def _final():
+        if json_path:
+            registry.write_json(json_path)
+        if prometheus_path:
+            registry.write_prometheus(prometheus_path)
+
+    if json_path or prometheus_path:
+        atexit.register(_final)
@@ -0,0 +1,58 @@
+"""click options shared by the generators.
+
+    @click.command()
+    @click.option("--concurrency", ...)
+    @options.checkpoint_options
+    @options.output_options
+    @options.metrics_options
+    def main(concurrency, checkpoint_path, index_path, dsn, ..., metrics_path, prometheus_path):
+        ...
+"""
+
+from typing import Any, Callable
+
+import click
+
+from crawler import geoparquet
+
+
+def _group(*decorators: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Apply several click options at once, in the order they are listed."""
+
+    def _decorator(func: Any) -> Any:
+        for decorator in reversed(decorators):
+            func = decorator(func)
+        return func
+
+    return _decorator
+
+
+checkpoint_options = _group(
+    click.option("--checkpoint", "checkpoint_path", type=str, help="Item checkpoint database (default to the Items output followed by `.checkpoint`)."),
+    click.option("--index", "index_path", type=str, help="Item ID index shared by the generators: Items already emitted are not fetched again, and Item id collisions are reported."),
+)
+
+incremental_options = _group(
+    click.option("--incremental", "sync_path", type=str, help="Only write new or changed Items (and their Collections), using the ETag/Last-Modified stored in this SQLite file."),
+)
+
+output_options = _group(
+    click.option("--dsn", type=str, help="Load Items and Collections directly into this pgSTAC database instead of writing files."),
+    click.option("--method", type=click.Choice(["insert", "ignore", "upsert", "delsert", "insert_ignore"]), default="insert_ignore", help="pgSTAC load method for Items (with --dsn)."),
+    click.option("--batch-size", type=int, default=1000, help="Number of Items per pgSTAC load batch (with --dsn)."),
+    click.option("--shard-by", type=click.Choice(["collection"]), help="Write the Items to one NDJSON file per Collection, in the --items directory (see manifest.json)."),
+    click.option("--shard-size", type=int, default=0, help="Start a new Items file every N Items, in the --items directory."),
+    click.option("--compression", type=click.Choice(["gzip", "zstd"]), help="Compress the Items files, in the --items directory."),
+    click.option("--writers", type=int, default=4, help="Number of threads compressing and writing the Items files (with --shard-by, --shard-size or --compression)."),
+    click.option("--geoparquet", "geoparquet_path", type=str, callback=geoparquet.check_pyarrow, help="Also write the Items as stac-geoparquet, partitioned per Collection, in this directory (needs pyarrow)."),
+)
+
+cache_options = _group(
+    click.option("--cache", "cache_path", type=str, help="Cache the catalogs and collections in this SQLite file, to skip fetching them again on the next runs."),
+    click.option("--cache-ttl", type=float, default=24, help="Hours after which cached documents are fetched again (with --cache)."),
+)
+
+metrics_options = _group(
+    click.option("--metrics", "metrics_path", type=str, help="Write a JSON summary of the crawl metrics to this file."),
+    click.option("--prometheus", "prometheus_path", type=str, help="Write the crawl metrics to this Prometheus text file, updated during the run."),
+)
@@ -0,0 +1,273 @@
+"""Run several sources at once, under one concurrency and memory budget.
+
+python -m crawler.orchestrate --output refresh --source maxar --source umbra --source linz --max-concurrency 200
+
+Every source runs its generator script in its own process (a failing
+source does not stop the others), with its outputs, log and metrics in
+`{output}/{source}/`. The `--max-concurrency` budget (HTTP requests in
+flight) is shared between the sources in proportion of their default
+concurrency, and a source only starts when its memory estimate (or, once
+running, its resident memory) fits in `--max-memory` with the running ones.
+
+Sources are plugins: a `Source` registered with `register()`, from this
+module or from a module given with `--plugin`.
+"""
+
+import importlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import click
+
+from crawler import jsonio, output
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _catalog_args(directory: Path) -> List[str]:
+    return [f"--collections={directory / 'collections.json'}", f"--items={directory / 'items.json'}"]
+
+
+class Source(NamedTuple):
+    """A generator script and how to run it."""
+
+    name: str
+    # relative to the repository root, run from its own directory
+    script: str
+    # output options, for an output directory
+    args: Callable[[Path], List[str]] = _catalog_args
+    concurrency: int = 50
+    # estimated peak resident memory, in MB
+    memory: int = 200
+    # whether the script accepts --metrics
+    metrics: bool = True
+
+
+sources: Dict[str, Source] = {}
+
+
+def register(source: Source) -> Source:
+    """Make a source available to the orchestrator."""
+    sources[source.name] = source
+    return source
+
+
+register(Source("maxar", "Maxar/generate.py"))
+register(Source("umbra", "Umbra/generate.py"))
+register(Source("linz", "Linz/generate.py"))
+register(Source("sentinel-2", "Sentinel-2-Iceland/generate.py", concurrency=8))
+register(Source("copernicus-dem", "Copernicus-Dem/generate.py", concurrency=100))
+register(
+    Source(
+        "wildfires-la",
+        "Maxar/WildFires-LosAngeles-Jan-2025/create_items.py",
+        args=lambda directory: [f"--output={directory / 'items.json'}"],
+    )
+)
+
+
+def _count(path: Path) -> int:
+    if path.is_dir():
+        with open(path / output.MANIFEST, "rb") as f:
+            return sum(shard["items"] for shard in jsonio.loads(f.read())["shards"])
+    if path.exists():
+        with open(path, "rb") as f:
+            return sum(1 for _ in f)
+    return 0
+
+
+def _rss(pid: int) -> int:
+    """Resident memory of a process, in MB (0 when unknown)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return 0
+
+
+class Job:
+    """One source run, in a subprocess."""
+
+    def __init__(self, source: Source, directory: Path, concurrency: int, extra_args: List[str]):
+        self.source = source
+        self.directory = directory
+        self.concurrency = concurrency
+        self.extra_args = extra_args
+        self.proc: Optional[subprocess.Popen] = None
+        self.returncode: Optional[int] = None
+        self.started = self.ended = 0.0
+        self.max_rss = 0
+
+    @property
+    def command(self) -> List[str]:
+        args = [sys.executable, str(ROOT / self.source.script), *self.source.args(self.directory)]
+        args.append(f"--concurrency={self.concurrency}")
+        if self.source.metrics:
+            args.append(f"--metrics={self.directory / 'metrics.json'}")
+        return args + self.extra_args
+
+    @property
+    def memory(self) -> int:
+        """Memory reserved by the job, in MB."""
+        return max(self.source.memory, _rss(self.proc.pid)) if self.proc else self.source.memory
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / "log.txt", "ab") as log:
+            self.proc = subprocess.Popen(
+                self.command,
+                cwd=(ROOT / self.source.script).parent,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        self.started = time.perf_counter()
+
+    def poll(self) -> bool:
+        """Whether the job has ended."""
+        if self.proc is None:
+            return False
+        if self.returncode is not None:
+            return True
+
+        pid, status, rusage = os.wait4(self.proc.pid, os.WNOHANG)
+        if pid == 0:
+            return False
+
+        self.ended = time.perf_counter()
+        self.returncode = self.proc.returncode = os.waitstatus_to_exitcode(status)
+        # kilobytes on Linux
+        self.max_rss = rusage.ru_maxrss // 1024
+        return True
+
+    def result(self) -> Dict:
+        return {
+            "status": "ok" if self.returncode == 0 else ("not started" if self.proc is None else "failed"),
+            "returncode": self.returncode,
+            "concurrency": self.concurrency,
+            "seconds": round(self.ended - self.started, 3) if self.ended else None,
+            "items": _count(self.directory / "items.json"),
+            "max_rss_mb": self.max_rss,
+            "log": str(self.directory / "log.txt"),
+        }
+
+
+def shares(selected: List[Source], max_concurrency: int) -> Dict[str, int]:
+    """Split the concurrency budget between sources, in proportion of their default concurrency.
+
+    Every source gets at least one request in flight and at most its
+    default concurrency, and the shares never add up to more than
+    `max_concurrency` (largest remainder split).
+    """
+    if max_concurrency < len(selected):
+        raise click.UsageError(f"--max-concurrency {max_concurrency} is below the number of sources ({len(selected)}), each needs at least one request in flight")
+
+    # one request each, the rest split in proportion of the concurrency above that
+    weights = {source.name: max(source.concurrency, 1) - 1 for source in selected}
+    extra = min(max_concurrency - len(selected), sum(weights.values()))
+    quotas = {name: weight * extra / max(sum(weights.values()), 1) for name, weight in weights.items()}
+    result = {name: 1 + int(quota) for name, quota in quotas.items()}
+
+    left = len(selected) + extra - sum(result.values())
+    for name in sorted(quotas, key=lambda name: quotas[name] - int(quotas[name]), reverse=True)[:left]:
+        result[name] += 1
+    return result
+
+
+def run(jobs: List[Job], max_memory: int, interval: float = 0.5) -> List[Job]:
+    """Run the jobs, starting them while they fit in the memory budget (in MB)."""
+    pending = list(jobs)
+    running: List[Job] = []
+    try:
+        while pending or running:
+            for job in [job for job in running if job.poll()]:
+                running.remove(job)
+                status = "done" if job.returncode == 0 else f"failed ({job.returncode}), see {job.directory / 'log.txt'}"
+                click.echo(f"{job.source.name}: {status} in {job.ended - job.started:.1f}s")
+
+            while pending:
+                job = pending[0]
+                used = sum(j.memory for j in running)
+                # always run at least one job, even above the budget
+                if running and used + job.source.memory > max_memory:
+                    break
+                pending.pop(0)
+                click.echo(f"{job.source.name}: starting with --concurrency={job.concurrency}")
+                job.start()
+                running.append(job)
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        for job in running:
+            job.proc.send_signal(signal.SIGINT)
+        for job in running:
+            job.proc.wait()
+        raise
+
+    return jobs
+
+
+@click.command()
+@click.option("--source", "names", type=str, multiple=True, help="Sources to run (default to all the registered ones).")
+@click.option("--output", "output_path", type=str, default="outputs", help="Output directory, with one sub directory per source.")
+@click.option("--max-concurrency", type=int, default=200, help="Number of HTTP requests in flight, shared by all the sources.")
+@click.option("--max-memory", type=int, default=4096, help="Memory budget of the running sources, in MB.")
+@click.option("--arg", "extra_args", type=str, multiple=True, help="Extra option for a source, as SOURCE:OPTION (e.g --arg=maxar:--with-s3-urls).")
+@click.option("--plugin", "plugins", type=str, multiple=True, help="Python module registering more sources (see `crawler.orchestrate.register`).")
+@click.option("--list", "list_sources", is_flag=True, help="List the registered sources and exit.")
+def main(names, output_path, max_concurrency, max_memory, extra_args, plugins, list_sources):
+    """Run the generators of several sources concurrently."""
+    for plugin in plugins:
+        importlib.import_module(plugin)
+
+    if list_sources:
+        for source in sources.values():
+            click.echo(f"{source.name:<15} {source.script} (concurrency {source.concurrency}, ~{source.memory} MB)")
+        return
+
+    unknown = [name for name in names if name not in sources]
+    if unknown:
+        raise click.UsageError(f"Unknown sources: {', '.join(unknown)} (see --list)")
+
+    args: Dict[str, List[str]] = {}
+    for value in extra_args:
+        name, sep, option = value.partition(":")
+        if not sep or name not in sources:
+            raise click.UsageError(f"Invalid --arg {value}, expected SOURCE:OPTION")
+        args.setdefault(name, []).append(option)
+
+    selected = [sources[name] for name in names] if names else list(sources.values())
+    concurrency = shares(selected, max_concurrency)
+    directory = Path(output_path).resolve()
+    jobs = [
+        Job(source, directory / source.name, concurrency[source.name], args.get(source.name, []))
+        for source in selected
+    ]
+
+    t0 = time.perf_counter()
+    run(jobs, max_memory)
+    elapsed = time.perf_counter() - t0
+
+    results = {job.source.name: job.result() for job in jobs}
+    with open(directory / "summary.json", "w") as f:
+        json.dump(results, f, indent=2)
+
+    for name, result in results.items():
+        click.echo(f"{name:<15} {result['status']:<7} {result['items']:>9} items  {result['seconds'] or 0:>8.1f}s  peak RSS {result['max_rss_mb']:>6} MB")
+    click.echo(f"{len(jobs)} sources in {elapsed:.1f}s")
+
+    failed = [name for name, result in results.items() if result["status"] != "ok"]
+    if failed:
+        raise click.ClickException(f"Failed sources: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""Outputs for the generated Items and Collections."""
+
+import os
+import re
+import threading
+import zlib
+from queue import Queue
+from typing import Any, Dict, List, Optional
+
+from crawler import jsonio, metrics
+
+MANIFEST = "manifest.json"
+
+EXTENSIONS = {None: ".ndjson", "gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+_SHARD_NAME = re.compile(r".+-\d{5}\.ndjson(\.gz|\.zst)?$")
+
+
+class NdjsonWriter:
+    """Append STAC objects to a NDJSON file."""
+
+    def __init__(self, path: str, buffer_size: int = 1024 * 1024):
+        self.path = path
+        self.file = open(path, "ab", buffering=buffer_size)
+
+    def write(self, obj: Dict):
+        with metrics.timer("encode"):
+            data = jsonio.dumps(obj) + b"\n"
+        with metrics.timer("write"):
+            self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+class _Compressor:
+    """Compress a shard as a series of members (gzip) or frames (zstd).
+
+    Every `finish()` ends the current member, so the file written so far
+    is a complete, readable stream which can be truncated back to.
+    """
+
+    def __init__(self, compression: Optional[str], level: Optional[int] = None):
+        self.compression = compression
+        self.level = level
+        self._obj: Any = None
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("`zstandard` is required for zstd compression") from None
+            self._zstd = zstandard.ZstdCompressor(level=level or 3)
+        elif compression not in (None, "gzip"):
+            raise ValueError(f"Unknown compression: {compression}")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.compression is None:
+            return data
+
+        if self._obj is None:
+            if self.compression == "gzip":
+                # wbits=31: gzip header and trailer
+                self._obj = zlib.compressobj(6 if self.level is None else self.level, zlib.DEFLATED, 31)
+            else:
+                self._obj = self._zstd.compressobj()
+
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        if self._obj is None:
+            return b""
+
+        data, self._obj = self._obj.flush(), None
+        return data
+
+
+class _Shard:
+    def __init__(self, index: int, directory: str, name: str, key: str, compressor: _Compressor, items: int = 0):
+        self.index = index
+        self.name = name
+        self.key = key
+        self.items = items
+        self.size = 0
+        self.path = os.path.join(directory, name)
+        self.compressor = compressor
+        self.file: Any = None
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+
+    def open(self):
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+
+    def write(self, chunk: List[bytes]):
+        with metrics.timer("write"):
+            self.file.write(self.compressor.compress(b"".join(chunk)))
+
+    def finish(self):
+        self.file.write(self.compressor.finish())
+        self.file.flush()
+        self.size = self.file.tell()
+
+    def close(self):
+        self.finish()
+        self.file.close()
+
+
+class ShardedWriter:
+    """Write Items to NDJSON shards, from a pool of writer threads.
+
+    Items go to one shard per collection (`by_collection`) and/or to a
+    new shard every `max_items` Items, named `{collection}-00000.ndjson`
+    or `items-00000.ndjson` in `directory`, optionally compressed with
+    gzip or zstd (`.gz`/`.zst`). Items are encoded by the caller, while
+    compression and writes run in `writers` threads (a shard always
+    belongs to the same thread, so its Items keep their order).
+
+    `directory/manifest.json` lists the shards with their number of Items
+    and size. It is written on `flush()`, after ending the current gzip
+    member (or zstd frame) of every shard: when a crawl is restarted,
+    shards are truncated back to the size recorded in the manifest and
+    shards missing from it are removed, as `crawler.checkpoint.Checkpoint`
+    does for a single file. With a checkpoint, the manifest is also stored
+    in its journal, in the same transaction as the Items, and the shards
+    are truncated back to that one instead.
+
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        by_collection: bool = True,
+        max_items: int = 0,
+        compression: Optional[str] = None,
+        level: Optional[int] = None,
+        writers: int = 4,
+        chunk_size: int = 256 * 1024,
+    ):
+        self.directory = directory
+        self.by_collection = by_collection
+        self.max_items = max_items
+        self.compression = compression
+        self.level = level
+        self.chunk_size = chunk_size
+        self.extension = EXTENSIONS[compression]
+        os.makedirs(directory, exist_ok=True)
+
+        self._shards: List[_Shard] = []
+        self._current: Dict[str, _Shard] = {}
+        self._error: Optional[BaseException] = None
+        self._queues: List["Queue[Any]"] = [Queue(maxsize=64) for _ in range(max(writers, 1))]
+        self._threads = [
+            threading.Thread(target=self._run, args=(queue,), daemon=True)
+            for queue in self._queues
+        ]
+        self._resume()
+        for thread in self._threads:
+            thread.start()
+
+    def _resume(self):
+        path = os.path.join(self.directory, MANIFEST)
+        entries = []
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                entries = jsonio.loads(f.read())["shards"]
+        self._load(entries)
+
+    def _load(self, entries: List[Dict]):
+        """Truncate the shards back to `entries` (manifest shards), remove the other ones."""
+        self._shards = []
+        self._current = {}
+        known = {entry["path"] for entry in entries}
+        for name in os.listdir(self.directory):
+            # written after the last flush
+            if name not in known and _SHARD_NAME.match(name):
+                os.remove(os.path.join(self.directory, name))
+
+        for entry in entries:
+            shard = self._new_shard(entry["path"], entry["key"], entry["items"])
+            with open(shard.path, "ab") as f:
+                f.truncate(entry["bytes"])
+            shard.size = entry["bytes"]
+            self._current[shard.key] = shard
+
+    def restore(self, manifest: Dict) -> bool:
+        """Go back to a manifest committed elsewhere (see `crawler.checkpoint.Checkpoint`).
+
+        Only before anything is written: `manifest.json` itself may be ahead
+        of the journal when the crawl stopped between a flush and a commit.
+        Returns False, without changing anything, when a shard is smaller
+        than in `manifest` (it is not a manifest of this directory).
+        """
+        for entry in manifest["shards"]:
+            path = os.path.join(self.directory, entry["path"])
+            if (os.path.getsize(path) if os.path.exists(path) else 0) < entry["bytes"]:
+                return False
+
+        self._load(manifest["shards"])
+        self._write_manifest()
+        return True
+
+    def _new_shard(self, name: str, key: str, items: int = 0) -> _Shard:
+        shard = _Shard(len(self._shards), self.directory, name, key, _Compressor(self.compression, self.level), items)
+        self._shards.append(shard)
+        return shard
+
+    def _run(self, queue: "Queue[Any]"):
+        while True:
+            shard, action = queue.get()
+            try:
+                if shard is None:
+                    return
+                if self._error is None:
+                    if shard.file is None:
+                        shard.open()
+                    if action == "finish":
+                        shard.finish()
+                    elif action == "close":
+                        shard.close()
+                    else:
+                        shard.write(action)
+            except BaseException as e:
+                self._error = e
+            finally:
+                queue.task_done()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def _submit(self, shard: _Shard, action: Any):
+        self._queues[shard.index % len(self._queues)].put((shard, action))
+
+    def _send(self, shard: _Shard):
+        if shard._buffer:
+            self._submit(shard, shard._buffer)
+            shard._buffer, shard._buffered = [], 0
+
+    def _shard_for(self, item: Dict) -> _Shard:
+        key = "items"
+        if self.by_collection and item.get("collection"):
+            key = item["collection"]
+        return self._shard(key)
+
+    def _shard(self, key: str) -> _Shard:
+        key = re.sub(r"[^\w.-]", "_", key)
+        shard = self._current.get(key)
+        if shard is not None and self.max_items and shard.items >= self.max_items:
+            self._send(shard)
+            self._submit(shard, "close")
+            shard = None
+
+        if shard is None:
+            count = sum(1 for s in self._shards if s.key == key)
+            shard = self._new_shard(f"{key}-{count:05d}{self.extension}", key)
+            self._current[key] = shard
+
+        return shard
+
+    def write(self, obj: Dict):
+        self._check()
+        shard = self._shard_for(obj)
+        with metrics.timer("encode"):
+            data = jsonio.dumps(obj) + b"\n"
+        self._append(shard, data)
+
+    def write_line(self, data: bytes, key: str):
+        """Write an already encoded NDJSON line to the shards of `key`."""
+        self._check()
+        self._append(self._shard(key), data)
+
+    def end(self, key: str):
+        """Close the current shard of `key`: its next Items go to a new shard."""
+        shard = self._current.pop(re.sub(r"[^\w.-]", "_", key), None)
+        if shard is not None:
+            self._send(shard)
+            self._submit(shard, "close")
+
+    def _append(self, shard: _Shard, data: bytes):
+        shard._buffer.append(data)
+        shard._buffered += len(data)
+        shard.items += 1
+        if shard._buffered >= self.chunk_size:
+            self._send(shard)
+
+    def _drain(self, action: str):
+        for shard in self._current.values():
+            self._send(shard)
+            self._submit(shard, action)
+        for queue in self._queues:
+            queue.join()
+        self._check()
+
+    def flush(self):
+        """Write the buffered Items, end the compressed streams and update the manifest."""
+        self._drain("finish")
+        self._write_manifest()
+
+    def manifest(self) -> Dict:
+        """Shards written so far, as of the last `flush()`."""
+        return {
+            "compression": self.compression,
+            "shards": [
+                {
+                    "path": shard.name,
+                    "key": shard.key,
+                    "items": shard.items,
+                    "bytes": shard.size,
+                }
+                for shard in self._shards
+                if shard.items
+            ],
+        }
+
+    def _write_manifest(self):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + ".tmp", "wb") as f:
+            f.write(jsonio.dumps(self.manifest()))
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        try:
+            self._drain("close")
+            self._write_manifest()
+        finally:
+            for queue in self._queues:
+                queue.put((None, None))
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+class TeeWriter:
+    """Write the same STAC objects to a main output and to secondary ones.
+
+    All of them are flushed, but only the main output and the secondary
+    outputs with a manifest are restored on resume by
+    `crawler.checkpoint.Checkpoint`.
+    """
+
+    def __init__(self, main: Any, *others: Any):
+        self.main = main
+        self.others = others
+        for name in ("fileno", "manifest", "restore"):
+            if hasattr(main, name):
+                setattr(self, name, getattr(main, name))
+
+    def write(self, obj: Dict):
+        self.main.write(obj)
+        for other in self.others:
+            other.write(obj)
+
+    def flush(self):
+        self.main.flush()
+        for other in self.others:
+            other.flush()
+
+    def close(self):
+        try:
+            for other in self.others:
+                other.close()
+        finally:
+            self.main.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+def open_output(
+    path: str,
+    dsn: Optional[str] = None,
+    shard_by: Optional[str] = None,
+    shard_size: int = 0,
+    compression: Optional[str] = None,
+    writers: int = 4,
+    geoparquet: Optional[str] = None,
+    **kwargs: Any,
+):
+    """Write to `path`, or straight into pgSTAC when a `dsn` is given.
+
+    With `shard_by="collection"`, a `shard_size` or a `compression`,
+    `path` is a directory of shards (see `ShardedWriter`). With a
+    `geoparquet` directory, the Items are also written as stac-geoparquet
+    (see `crawler.geoparquet.GeoparquetWriter`). `kwargs` are forwarded to
+    `crawler.ingest.PgstacWriter`.
+    """
+    if geoparquet:
+        from crawler.geoparquet import GeoparquetWriter
+
+        # created first, so a missing pyarrow does not leave the main output open
+        other = GeoparquetWriter(geoparquet)
+        try:
+            main = open_output(path, dsn, shard_by, shard_size, compression, writers, **kwargs)
+        except BaseException:
+            other.close()
+            raise
+        return TeeWriter(main, other)
+
+    if dsn:
+        from crawler.ingest import PgstacWriter
+
+        return PgstacWriter(dsn, **kwargs)
+
+    if shard_by or shard_size or compression:
+        return ShardedWriter(
+            path,
+            by_collection=shard_by == "collection",
+            max_items=shard_size,
+            compression=compression,
+            writers=writers,
+        )
+
+    return NdjsonWriter(path)
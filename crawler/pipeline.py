@@ -0,0 +1,333 @@
+"""Bounded producer/consumer pipeline."""
+
+import itertools
+import threading
+import time
+from collections import Counter, deque
+from concurrent import futures
+from queue import Queue
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import click
+
+from crawler import metrics
+from crawler.collection import CollectionSummary
+
+_DONE = object()
+
+
+def stream(
+    func: Callable[[Any], Any],
+    iterable: Iterable[Any],
+    max_workers: int = 50,
+    max_pending: Optional[int] = None,
+) -> Iterator[Any]:
+    """Yield `func(obj)` for every `obj` of `iterable`, as they complete.
+
+    `iterable` is consumed lazily in a producer thread (so link discovery
+    overlaps with fetching) and at most `max_pending` objects are either
+    being processed or waiting to be consumed, which keeps memory flat
+    whatever the size of `iterable`.
+
+    """
+    max_pending = max_pending or max_workers * 4
+    slots = threading.BoundedSemaphore(max_pending)
+    done: "Queue[Any]" = Queue()
+    stop = threading.Event()
+    state = {"submitted": 0, "error": None}
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def _produce():
+            try:
+                for obj in iterable:
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        return
+                    executor.submit(func, obj).add_done_callback(done.put)
+                    state["submitted"] += 1
+            except BaseException as e:  # noqa: B036
+                state["error"] = e
+            finally:
+                done.put(_DONE)
+
+        producer = threading.Thread(target=_produce, daemon=True)
+        producer.start()
+
+        consumed = 0
+        produced = False
+        try:
+            while not produced or consumed < state["submitted"]:
+                fut = done.get()
+                if fut is _DONE:
+                    produced = True
+                    continue
+
+                consumed += 1
+                slots.release()
+                metrics.gauge("pipeline_pending", state["submitted"] - consumed)
+                yield fut.result()
+
+            if state["error"] is not None:
+                raise state["error"]
+
+        finally:
+            stop.set()
+            producer.join()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _apply(func: Callable[[Any], Any], chunk: List[Any]) -> Tuple[List[Any], float]:
+    t0 = time.perf_counter()
+    results = [func(obj) for obj in chunk]
+    return results, time.perf_counter() - t0
+
+
+def process(
+    func: Callable[[Any], Any],
+    iterable: Iterable[Any],
+    processes: Optional[int] = None,
+    chunksize: int = 64,
+    max_pending: Optional[int] = None,
+    stage: str = "process",
+) -> Iterator[Any]:
+    """Yield `func(obj)` for every `obj` of `iterable`, computed in worker processes.
+
+    `func` and the objects must be picklable. Objects are sent in chunks of
+    `chunksize` and at most `max_pending` chunks (default `2 * processes`)
+    are in flight, results are yielded as the chunks complete so the
+    output order is not preserved. When `processes` is 0 or None, `func`
+    is applied inline. The time spent in `func` is recorded as the `stage`
+    metric, in every case.
+
+    """
+    if not processes:
+        for obj in iterable:
+            with metrics.timer(stage):
+                result = func(obj)
+            yield result
+        return
+
+    max_pending = max_pending or processes * 2
+    objects = iter(iterable)
+    pending: Set[futures.Future] = set()
+
+    with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    chunk = list(itertools.islice(objects, chunksize))
+                    if not chunk:
+                        exhausted = True
+                        break
+                    pending.add(executor.submit(_apply, func, chunk))
+
+                if not pending:
+                    return
+
+                metrics.gauge("process_pending_chunks", len(pending))
+                done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for fut in done:
+                    results, elapsed = fut.result()
+                    metrics.add_time(stage, elapsed, count=len(results))
+                    yield from results
+
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class JobEnd(NamedTuple):
+    """End of a job of `schedule()`, with its number of tasks."""
+
+    total: int
+
+
+def _round_robin(jobs: Iterable[Tuple[Any, Iterable[Any]]], active_jobs: int) -> Iterator[Tuple[Any, Any]]:
+    jobs = iter(jobs)
+    running: Deque[List[Any]] = deque()
+    while True:
+        while len(running) < active_jobs:
+            job = next(jobs, None)
+            if job is None:
+                break
+            key, tasks = job
+            running.append([key, iter(tasks), 0])
+
+        if not running:
+            return
+
+        entry = running.popleft()
+        task = next(entry[1], _DONE)
+        if task is _DONE:
+            yield entry[0], JobEnd(entry[2])
+            continue
+
+        entry[2] += 1
+        yield entry[0], task
+        running.append(entry)
+
+
+def track(records: Iterable[Tuple[Any, Any]]) -> Iterator[Tuple[Any, Any]]:
+    """Re-emit the `JobEnd` of every job after its last result.
+
+    For `(key, result)` streams whose order changed since `schedule()`,
+    e.g after `process()`.
+    """
+    totals: Dict[Any, int] = {}
+    seen: Counter = Counter()
+    for key, value in records:
+        if isinstance(value, JobEnd):
+            totals[key] = value.total
+        else:
+            seen[key] += 1
+            yield key, value
+
+        if totals.get(key) == seen[key]:
+            del seen[key]
+            yield key, JobEnd(totals.pop(key))
+
+
+def schedule(
+    func: Callable[[Any], Any],
+    jobs: Iterable[Tuple[Any, Iterable[Any]]],
+    max_workers: int = 50,
+    max_pending: Optional[int] = None,
+    active_jobs: int = 16,
+) -> Iterator[Tuple[Any, Any]]:
+    """Apply `func` to the tasks of several `(key, tasks)` jobs, sharing one worker pool.
+
+    Tasks of up to `active_jobs` jobs are interleaved (round robin), so
+    small jobs and the tail of large ones do not leave workers idle, and
+    a new job starts as soon as one is exhausted. Yields `(key,
+    func(task))` as they complete, then `(key, JobEnd(total))` once every
+    result of the job was yielded.
+
+    """
+
+    def _apply(entry: Tuple[Any, Any]) -> Tuple[Any, Any]:
+        key, task = entry
+        if isinstance(task, JobEnd):
+            return key, task
+        return key, func(task)
+
+    yield from track(stream(_apply, _round_robin(jobs, active_jobs), max_workers=max_workers, max_pending=max_pending))
+
+
+class Keyed:
+    """Picklable wrapper applying `func` to the `(key, result)` pairs of `schedule()`.
+
+    The job key is passed as the `name` keyword argument (e.g
+    `collection_id`) and `JobEnd` markers are passed through.
+    """
+
+    def __init__(self, func: Callable[..., Any], name: str):
+        self.func = func
+        self.name = name
+
+    def __call__(self, entry: Tuple[Any, Any]) -> Tuple[Any, Any]:
+        key, value = entry
+        if isinstance(value, JobEnd):
+            return key, value
+        return key, self.func(value, **{self.name: key})
+
+
+def crawl_collections(
+    collections: Iterable[Tuple[str, Any]],
+    get_item: Callable[[str], Tuple[str, Optional[Dict], Dict]],
+    transform: Callable[..., Any],
+    write_collection: Callable[[str, Any, CollectionSummary], None],
+    f_itm: Any,
+    checkpoint: Any,
+    index: Any,
+    state: Any = None,
+    skip_unchanged: bool = False,
+    max_workers: int = 50,
+    processes: int = 0,
+):
+    """Write the Items of static Collections, then each Collection once its Items are written.
+
+    `collections` yields `(collection_id, pystac.Collection)`. The Items
+    (links not in the `checkpoint`, nor in the `index` unless they are
+    revalidated with the `state` of an incremental run) of all the
+    Collections are fetched by one pool (see `schedule()`) with
+    `get_item(url) -> (url, item, validators)`, an unchanged Item being
+    None, and transformed by `transform(record, collection_id=...)` in
+    `processes` worker processes (see `process()`).
+
+    When the last Item of a Collection is written, the checkpoint (and the
+    `state`) is committed and `write_collection(collection_id, collection,
+    summary)` is called, unless no Item was written and `skip_unchanged`.
+
+    """
+    summaries: Dict[str, CollectionSummary] = {}
+    changed: Dict[str, int] = {}
+    sources: Dict[str, Any] = {}
+    started: Set[str] = set()
+
+    def _jobs() -> Iterator[Tuple[str, Iterator[str]]]:
+        # one job per collection, whose Items are fetched by the shared pool
+        for collection_id, collection in collections:
+            # Items already written by a previous (interrupted) run,
+            # seen by previous incremental runs or skipped by the index
+            summary = CollectionSummary()
+            previous_items = itertools.chain(
+                checkpoint.items(collection_id),
+                state.summaries(collection_id) if state else [],
+                index.summaries(collection_id),
+            )
+            for item_dict in previous_items:
+                summary.add(item_dict)
+
+            summaries[collection_id] = summary
+            changed[collection_id] = checkpoint.count(collection_id)
+            sources[collection_id] = collection
+
+            yield collection_id, (
+                link.absolute_href
+                for link in collection.get_item_links()
+                if link.absolute_href not in checkpoint
+                # incremental runs fetch them again, to look for changes
+                and (state or link.absolute_href not in index)
+            )
+
+    fetched = schedule(get_item, _jobs(), max_workers=max_workers)
+    items = track(process(Keyed(transform, "collection_id"), fetched, processes=processes, stage="transform"))
+
+    # Items are fetched in parallel, across collections
+    with click.progressbar(items, show_pos=True) as bar:
+        for collection_id, record in bar:
+            if collection_id not in started:
+                # from the consumer, the jobs being produced in another thread
+                started.add(collection_id)
+                click.echo(f"Looking for Items in {collection_id} Collection")
+
+            if isinstance(record, JobEnd):
+                # all the Items of the collection were written
+                checkpoint.commit()
+                if state:
+                    state.commit()
+                started.discard(collection_id)
+                collection, summary = sources.pop(collection_id), summaries.pop(collection_id)
+                if changed.pop(collection_id) or not skip_unchanged:
+                    write_collection(collection_id, collection, summary)
+                continue
+
+            url, item_dict, validators = record
+            if item_dict is None:
+                # unchanged since the last incremental run
+                continue
+
+            if not index.add(url, item_dict):
+                continue
+
+            summaries[collection_id].add(item_dict)
+
+            f_itm.write(item_dict)
+            checkpoint.add(url, item_dict)
+            if state:
+                state.save(url, validators, item_dict)
+            changed[collection_id] += 1
+            metrics.incr("items_total", collection=collection_id)
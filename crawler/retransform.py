@@ -0,0 +1,113 @@
+"""Apply the per-source Item rewrites to an existing NDJSON output, offline.
+
+python -m crawler.retransform Umbra/items.json.zip --source umbra --output items.json
+
+Records are streamed out of `.zip`, `.gz`, `.zst` (with `zstandard`) or
+plain NDJSON files, without extracting them to disk, or out of the shards
+of a `crawler.output.ShardedWriter` directory.
+"""
+
+import gzip
+import io
+import os
+import time
+import zipfile
+from functools import partial
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+import click
+
+from crawler import jsonio, output, pipeline, transform
+
+
+def _lines(f: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    for lineno, line in enumerate(f, start=1):
+        if line.strip():
+            yield lineno, line
+
+
+def read_records(path: str) -> Iterator[bytes]:
+    """Yield the NDJSON lines of a (possibly compressed) file."""
+    for _, line in read_numbered_records(path):
+        yield line
+
+
+def read_numbered_records(path: str) -> Iterator[Tuple[int, bytes]]:
+    """Yield the `(line number, line)` of the NDJSON lines, blank lines being skipped but counted."""
+    if os.path.isdir(path):
+        with open(os.path.join(path, output.MANIFEST), "rb") as f:
+            manifest = jsonio.loads(f.read())
+        for shard in manifest["shards"]:
+            yield from read_numbered_records(os.path.join(path, shard["path"]))
+
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                if name.endswith("/"):
+                    continue
+                with zf.open(name) as f:
+                    yield from _lines(f)
+
+    elif path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            yield from _lines(f)
+
+    elif path.endswith((".zst", ".zstd")):
+        try:
+            import zstandard
+        except ImportError:
+            raise click.UsageError("`zstandard` is required to read .zst files") from None
+
+        with open(path, "rb") as fh:
+            with zstandard.ZstdDecompressor().stream_reader(fh, read_across_frames=True) as reader:
+                yield from _lines(io.BufferedReader(reader, buffer_size=1024 * 1024))
+
+    else:
+        with open(path, "rb") as f:
+            yield from _lines(f)
+
+
+def retransform(
+    line: bytes,
+    func: Callable[..., Dict],
+    collection_id: Optional[str] = None,
+    with_s3_urls: bool = True,
+) -> bytes:
+    """Transform one NDJSON line."""
+    item = jsonio.loads(line)
+    item = func(item, collection_id or item.get("collection"), with_s3_urls)
+    return jsonio.dumps(item) + b"\n"
+
+
+@click.command()
+@click.argument("archives", nargs=-1, required=True)
+@click.option("--source", type=click.Choice(list(transform.sources)), required=True, help="Item rewrites to apply.")
+@click.option("--output", "output_path", type=str, default="items.json", help="NDJSON output file.")
+@click.option("--collection-id", type=str, help="New Collection ID (default to the Items one).")
+@click.option("--with-s3-urls/--without-s3-url", type=bool, default=True)
+@click.option("--processes", type=int, default=0, help="Number of worker processes (default to inline).")
+@click.option("--chunksize", type=int, default=1000, help="Number of Items sent to a worker at once.")
+def main(archives, source, output_path, collection_id, with_s3_urls, processes, chunksize):
+    func = partial(
+        retransform,
+        func=transform.sources[source],
+        collection_id=collection_id,
+        with_s3_urls=with_s3_urls,
+    )
+
+    count = 0
+    t0 = time.perf_counter()
+    with open(output_path, "wb", buffering=1024 * 1024) as out:
+        for archive in archives:
+            click.echo(f"Reading {archive}")
+            records = pipeline.process(func, read_records(archive), processes=processes, chunksize=chunksize)
+            for line in records:
+                out.write(line)
+                count += 1
+
+    elapsed = time.perf_counter() - t0
+    click.echo(f"{count} items written to {output_path} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} items/s)")
+
+
+if __name__ == "__main__":
+    main()
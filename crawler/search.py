@@ -0,0 +1,153 @@
+"""Paginated and time sliced STAC API search."""
+
+import calendar
+import threading
+from concurrent import futures
+from datetime import datetime, timedelta, timezone
+from queue import Queue
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from crawler import fetch, metrics
+
+_DONE = object()
+
+
+def search(url: str, payload: Dict) -> Iterator[Dict]:
+    """Yield the Items of a STAC API `/search`, following the `next` links."""
+    method, href, body = "POST", url, payload
+    while True:
+        if method == "POST":
+            resp = fetch.request("POST", href, json=body)
+        else:
+            resp = fetch.request("GET", href)
+
+        data = resp.json()
+        yield from data.get("features", [])
+
+        link = next(
+            (link for link in data.get("links", []) if link.get("rel") == "next"),
+            None,
+        )
+        if not link or not data.get("features"):
+            return
+
+        href = link["href"]
+        method = link.get("method", "GET").upper()
+        if method == "POST":
+            if link.get("merge"):
+                body = {**body, **link.get("body", {})}
+            else:
+                body = link.get("body", body)
+
+
+def _parse(dt: str) -> datetime:
+    value = datetime.fromisoformat(dt.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _format(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _next_start(dt: datetime, interval: str) -> datetime:
+    if interval == "day":
+        return dt + timedelta(days=1)
+    if interval == "week":
+        return dt + timedelta(weeks=1)
+    if interval == "month":
+        year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+        return dt.replace(year=year, month=month, day=min(dt.day, calendar.monthrange(year, month)[1]))
+    if interval == "year":
+        return dt.replace(year=dt.year + 1)
+
+    raise ValueError(f"Invalid interval: {interval}")
+
+
+def time_windows(interval: str, split: str) -> List[Tuple[str, str]]:
+    """Split a `start/end` datetime interval into non overlapping windows.
+
+    STAC API datetime ranges are closed, so each window ends one
+    microsecond before the next one starts.
+    """
+    start, end = (_parse(dt) for dt in interval.split("/"))
+    windows = []
+    while start <= end:
+        stop = min(_next_start(start, split) - timedelta(microseconds=1), end)
+        windows.append((_format(start), _format(stop)))
+        start = stop + timedelta(microseconds=1)
+
+    return windows
+
+
+def search_windows(
+    url: str,
+    payload: Dict,
+    split: Optional[str] = None,
+    max_workers: int = 8,
+    max_pending: int = 1000,
+    failed: Optional[List[Tuple[str, Exception]]] = None,
+) -> Iterator[Dict]:
+    """Run one paginated search per time window, concurrently.
+
+    Items are yielded as soon as any of the searches returns them. At most
+    `max_pending` Items are buffered whatever the number of windows.
+
+    An HTTP error raises once the other windows are done, unless a `failed`
+    list is given: the `(window, error)` of the failed searches are then
+    appended to it, and the Items of the other windows are still yielded.
+    """
+    if not split:
+        try:
+            yield from search(url, payload)
+        except httpx.HTTPError as e:
+            if failed is None:
+                raise
+            failed.append((payload["datetime"], e))
+            metrics.incr("search_windows_failed_total")
+        return
+
+    windows = time_windows(payload["datetime"], split)
+    results: "Queue[Any]" = Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def _search(window: Tuple[str, str]):
+        interval = "/".join(window)
+        try:
+            for item in search(url, {**payload, "datetime": interval}):
+                if stop.is_set():
+                    return
+                results.put(item)
+        except httpx.HTTPError as e:
+            if failed is None:
+                raise
+            failed.append((interval, e))
+            metrics.incr("search_windows_failed_total")
+        finally:
+            results.put(_DONE)
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tasks = [executor.submit(_search, window) for window in windows]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                metrics.gauge("search_queue", results.qsize())
+                obj = results.get()
+                if obj is _DONE:
+                    remaining -= 1
+                    continue
+                yield obj
+
+            for task in tasks:
+                task.result()
+
+        finally:
+            stop.set()
+            # unblock the searches waiting on a full queue
+            while any(not task.done() for task in tasks):
+                while not results.empty():
+                    results.get_nowait()
+                futures.wait(tasks, timeout=0.1)
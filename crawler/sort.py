@@ -0,0 +1,195 @@
+"""Sort NDJSON Items by collection and datetime before loading them in pgSTAC.
+
+python -m crawler.sort Umbra/items.json.zip --output items-sorted --partition month
+
+Generators write Items in completion order, spread over all dates, so a
+`pypgstac load` batch touches many of pgSTAC's time partitions. Items are
+sorted here by `(collection, datetime)` with an external merge sort:
+chunks of at most `--max-memory` are sorted in memory and written to
+temporary run files, which are then merged. The output is a
+`crawler.output.ShardedWriter` directory with one shard (or more, with
+`--shard-size`) per collection and `--partition` period, so every file
+loads into a single partition and files can be loaded concurrently:
+
+python -c "import json; print('\\n'.join(s['path'] for s in json.load(open('items-sorted/manifest.json'))['shards']))" \\
+    | xargs -P 4 -I{} pypgstac load items items-sorted/{} --dsn ... --method insert_ignore
+
+With `--spatial`, the Items of a period are ordered along a Z-order curve
+of their bbox center (then by datetime), for spatially clustered pages.
+"""
+
+import heapq
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import click
+
+from crawler import jsonio, metrics, output, pipeline
+from crawler.retransform import read_records
+
+PERIODS = {"none": 0, "year": 4, "month": 7}
+
+# maximum number of run files merged at once
+MAX_FANIN = 128
+
+
+def _datetime(properties: Dict) -> str:
+    """Item datetime (or start_datetime), as a sortable UTC string."""
+    value = properties.get("datetime") or properties.get("start_datetime")
+    if not value:
+        return ""
+
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+def _interleave(x: int) -> int:
+    x &= 0xFFFF
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    x = (x | (x << 1)) & 0x55555555
+    return x
+
+
+def zorder(bbox: Optional[List[float]]) -> int:
+    """32-bit Z-order (Morton) code of a bbox center, in lon/lat."""
+    if not bbox:
+        return 0
+
+    half = len(bbox) // 2
+    lon = (bbox[0] + bbox[half]) / 2
+    lat = (bbox[1] + bbox[half + 1]) / 2
+    x = int((min(max(lon, -180.0), 180.0) + 180) / 360 * 0xFFFF)
+    y = int((min(max(lat, -90.0), 90.0) + 90) / 180 * 0xFFFF)
+    return _interleave(x) | (_interleave(y) << 1)
+
+
+def sort_record(line: bytes, period: int = 7, spatial: bool = False) -> bytes:
+    """Prefix an NDJSON line with its sort key.
+
+    The key fields are separated by NUL bytes, which sort before any other
+    character and cannot appear in the JSON line, so records can be
+    compared as plain bytes.
+
+    """
+    item = jsonio.loads(line)
+    dt = _datetime(item.get("properties") or {})
+    key = [item.get("collection") or "", dt[:period] if period else ""]
+    if spatial:
+        key.append(f"{zorder(item.get('bbox')):08x}")
+    key.append(dt)
+    return "\0".join(key).encode() + b"\0" + line.rstrip(b"\r\n") + b"\n"
+
+
+def _write_run(records: List[bytes], directory: str) -> str:
+    with metrics.timer("sort"):
+        records.sort()
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with metrics.timer("write"), os.fdopen(fd, "wb", buffering=1024 * 1024) as f:
+        f.writelines(records)
+    return path
+
+
+def _merge(paths: List[str]) -> Iterator[bytes]:
+    files = [open(path, "rb", buffering=256 * 1024) for path in paths]
+    try:
+        yield from heapq.merge(*files)
+    finally:
+        for f in files:
+            f.close()
+
+
+def external_sort(records: Iterable[bytes], directory: str, max_memory: int = 512 * 1024 * 1024) -> Iterator[bytes]:
+    """Sort `records` (bytes lines), using run files in `directory` above `max_memory` bytes."""
+    runs: List[str] = []
+    chunk: List[bytes] = []
+    size = 0
+    for record in records:
+        chunk.append(record)
+        # payload, plus the list slot and bytes object overhead
+        size += len(record) + 41
+        if size >= max_memory:
+            runs.append(_write_run(chunk, directory))
+            chunk, size = [], 0
+            metrics.gauge("sort_runs", len(runs))
+
+    if not runs:
+        # everything fits in memory
+        chunk.sort()
+        yield from chunk
+        return
+
+    if chunk:
+        runs.append(_write_run(chunk, directory))
+        chunk = []
+
+    # merge passes, until the runs can be merged at once
+    while len(runs) > MAX_FANIN:
+        merged = []
+        for i in range(0, len(runs), MAX_FANIN):
+            group = runs[i:i + MAX_FANIN]
+            fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+            with os.fdopen(fd, "wb", buffering=1024 * 1024) as f:
+                f.writelines(_merge(group))
+            for run in group:
+                os.remove(run)
+            merged.append(path)
+        runs = merged
+
+    yield from _merge(runs)
+    for run in runs:
+        os.remove(run)
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True)
+@click.option("--output", "output_path", type=str, required=True, help="Output directory (a ShardedWriter directory with a manifest.json).")
+@click.option("--partition", type=click.Choice(list(PERIODS)), default="month", help="Start a new shard for every period of the Items datetime (match the pgSTAC partitioning of the Collections).")
+@click.option("--spatial", is_flag=True, help="Order the Items of a period by the Z-order of their bbox center, then by datetime.")
+@click.option("--shard-size", type=int, default=0, help="Also start a new shard every N Items.")
+@click.option("--compression", type=click.Choice(["gzip", "zstd"]), help="Compress the output shards.")
+@click.option("--max-memory", type=int, default=512, help="Memory used to sort runs in, in MB.")
+@click.option("--tmp-dir", type=str, help="Directory of the temporary run files (default to the system one).")
+@click.option("--processes", type=int, default=0, help="Number of worker processes parsing the Items (default to inline).")
+def main(inputs, output_path, partition, spatial, shard_size, compression, max_memory, tmp_dir, processes):
+    """Sort NDJSON Items (plain, .zip, .gz, .zst or shards) by collection and datetime."""
+    if os.path.exists(os.path.join(output_path, output.MANIFEST)):
+        raise click.UsageError(f"{output_path} already contains Items")
+
+    func = partial(sort_record, period=PERIODS[partition], spatial=spatial)
+
+    def _records() -> Iterator[bytes]:
+        for path in inputs:
+            click.echo(f"Reading {path}")
+            yield from pipeline.process(func, read_records(path), processes=processes, chunksize=1000, stage="parse")
+
+    t0 = time.perf_counter()
+    count = 0
+    workdir = tempfile.mkdtemp(prefix="stac-sort-", dir=tmp_dir)
+    try:
+        with output.ShardedWriter(output_path, max_items=shard_size, compression=compression) as writer:
+            for key, group in itertools.groupby(external_sort(_records(), workdir, max_memory * 1024 * 1024), key=lambda r: r.split(b"\0", 2)[:2]):
+                shard_key = "_".join(part.decode() for part in key if part) or "items"
+                for record in group:
+                    writer.write_line(record.rsplit(b"\0", 1)[1], shard_key)
+                    count += 1
+                # the Items of this partition are all written
+                writer.end(shard_key)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - t0
+    click.echo(f"{count} items sorted to {output_path} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} items/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Incremental sync using conditional requests."""
+
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import click
+
+from crawler import fetch, jsonio, metrics
+from crawler.cache import DocumentCache
+from crawler.checkpoint import summary
+
+
+class SyncState:
+    """SQLite store of the `ETag`/`Last-Modified` of every fetched document.
+
+    Items only keep their validators and a `summary` (see
+    `crawler.checkpoint.summary`) so unchanged Items still contribute to
+    their collection extent and `item_assets`. Catalogs and collections also
+    keep their body, which is needed to walk the catalog when the server
+    answers `304 Not Modified`.
+
+    Validators of an Item must only be saved once the Item has been written,
+    otherwise an interrupted run would never emit it.
+
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                collection TEXT,
+                summary TEXT,
+                body TEXT
+            );
+            CREATE INDEX IF NOT EXISTS documents_collection ON documents (collection);
+            """
+        )
+
+    def _get(self, url: str, column: str) -> Optional[Tuple]:
+        with self._lock:
+            return self.db.execute(
+                f"SELECT etag, last_modified, {column} FROM documents WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+    def _conditional_get(self, url: str, column: str) -> Tuple[Any, Optional[str], Dict]:
+        headers = {}
+        row = self._get(url, column)
+        if row:
+            etag, last_modified, _ = row
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        resp = fetch.get(url, headers=headers)
+        if resp.status_code == 304:
+            return resp, row[2], {}
+
+        validators = {
+            "etag": resp.headers.get("etag"),
+            "last_modified": resp.headers.get("last-modified"),
+        }
+        return resp, None, validators
+
+    def get_json(self, url: str) -> Tuple[Optional[Dict], Dict]:
+        """Fetch an Item unless it did not change since the last run.
+
+        Returns `(None, {})` for unchanged Items, `(item, validators)` otherwise.
+        """
+        resp, _, validators = self._conditional_get(url, "summary")
+        if resp.status_code == 304:
+            return None, {}
+
+        return resp.json(), validators
+
+    def get_text(self, url: str, cache: Optional[DocumentCache] = None) -> str:
+        """Fetch a catalog or collection, using the stored body when unchanged.
+
+        With a `cache`, documents it holds a fresh copy of are not
+        requested at all; the other ones are revalidated, then cached.
+        """
+        if cache is not None:
+            body = cache.get(url)
+            if body is not None:
+                metrics.incr("cache_hits_total")
+                return body
+            metrics.incr("cache_misses_total")
+
+        text = self._revalidate(url)
+        if cache is not None:
+            cache.put(url, text)
+        return text
+
+    def _revalidate(self, url: str) -> str:
+        resp, body, validators = self._conditional_get(url, "body")
+        if resp.status_code == 304 and body is not None:
+            return body
+
+        if resp.status_code == 304:
+            # we lost the body, fetch it again
+            resp = fetch.get(url)
+            validators = {
+                "etag": resp.headers.get("etag"),
+                "last_modified": resp.headers.get("last-modified"),
+            }
+
+        self.save(url, validators, body=resp.text)
+        return resp.text
+
+    def save(
+        self,
+        url: str,
+        validators: Dict,
+        item: Optional[Dict] = None,
+        body: Optional[str] = None,
+    ):
+        """Store the validators of a document (and the summary of an Item)."""
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO documents (url, etag, last_modified, collection, summary, body) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    validators.get("etag"),
+                    validators.get("last_modified"),
+                    item.get("collection") if item else None,
+                    jsonio.dumps(summary(item)) if item else None,
+                    body,
+                ),
+            )
+
+    def summaries(self, collection_id: str) -> Iterator[Dict]:
+        """Yield the summaries of all the known Items of a collection."""
+        cursor = self.db.cursor()
+        with self._lock:
+            cursor.execute(
+                "SELECT summary FROM documents WHERE collection = ?", (collection_id,)
+            )
+
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+
+            for (row,) in rows:
+                yield jsonio.loads(row)
+
+    def commit(self):
+        with self._lock:
+            self.db.commit()
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+def check_outputs(checkpoint: Any):
+    """Refuse to append an incremental run to the outputs of a finished run.
+
+    The Items (and Collections) already in them would be skipped instead of
+    revalidated, so changes would be missed. Interrupted runs can resume.
+    """
+    if checkpoint.finished:
+        raise click.UsageError(
+            "The Items output was written by a finished run: "
+            "use new --items/--collections outputs (or a new --checkpoint with --dsn) for each incremental run"
+        )
+
+
+class SyncStacIO(fetch.HttpxStacIO):
+    """pystac StacIO sending conditional requests for catalogs and collections.
+
+    Usage: `pystac.StacIO.set_default(lambda: SyncStacIO(state))`
+    """
+
+    def __init__(self, state: SyncState, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.state = state
+
+    def read_text_from_href(self, href: str) -> str:
+        if href.startswith(("http://", "https://")):
+            return self.state.get_text(href)
+
+        return super().read_text_from_href(href)
@@ -0,0 +1,109 @@
+"""Backoff and adaptive (AIMD) concurrency control for the HTTP requests."""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+
+import httpx
+
+# Status codes worth retrying: throttling, timeouts and transient server errors
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Status codes meaning "slow down" (S3 answers `503 SlowDown`)
+THROTTLE_STATUS = {429, 503}
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter, for the `attempt`-th retry (starting at 1)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def retry_after(resp: httpx.Response, cap: float = 60.0) -> Optional[float]:
+    """Seconds to wait according to the `Retry-After` header, if any."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+
+    return min(max(seconds, 0.0), cap)
+
+
+class AdaptiveLimiter:
+    """Per host concurrency limit, adjusted with AIMD.
+
+    The limit starts at `initial` and grows by one for every successful
+    request until the first throttling response (slow start), then by
+    `1 / limit` (about one more request in flight per round trip). A
+    throttling response multiplies it by `decrease`, unless the request
+    was sent before the previous decrease: a burst of concurrent 503 only
+    counts once. A `Retry-After` pauses every request to the host.
+
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial: Optional[int] = None,
+        min_limit: int = 1,
+        decrease: float = 0.5,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(min(max_limit, initial or max_limit))
+        self.decrease = decrease
+        self.in_flight = 0
+        self._slow_start = True
+        self._last_decrease = 0.0
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def success(self):
+        with self._cond:
+            increase = 1.0 if self._slow_start else 1.0 / self.limit
+            previous = int(self.limit)
+            self.limit = min(float(self.max_limit), self.limit + increase)
+            if int(self.limit) > previous:
+                self._cond.notify(int(self.limit) - previous)
+
+    def throttle(self, started: float, pause: Optional[float] = None):
+        """Register a throttling response to a request sent at `started` (`time.monotonic()`)."""
+        with self._cond:
+            now = time.monotonic()
+            if pause:
+                self._resume_at = max(self._resume_at, now + pause)
+
+            self._slow_start = False
+            if started >= self._last_decrease:
+                self.limit = max(float(self.min_limit), self.limit * self.decrease)
+                self._last_decrease = now
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args: Any):
+        self.release()
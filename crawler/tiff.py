@@ -0,0 +1,196 @@
+"""GeoTIFF header reader, using HTTP range requests.
+
+Only the first IFD and its GeoTIFF tags are read, which for a Cloud
+Optimized GeoTIFF means one (sometimes two) small requests per file,
+instead of opening it with GDAL.
+
+    header = tiff.read_header("https://copernicus-dem-30m.s3.amazonaws.com/...DEM.tif")
+    header.shape, header.transform, header.epsg, header.bbox
+"""
+
+import struct
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from crawler import fetch, metrics
+
+# TIFF tags
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+MODEL_TRANSFORMATION = 34264
+GEO_KEY_DIRECTORY = 34735
+
+# GeoTIFF keys
+GT_RASTER_TYPE = 1025
+GEOGRAPHIC_TYPE = 2048
+PROJECTED_CS_TYPE = 3072
+RASTER_PIXEL_IS_POINT = 2
+
+# type id: (struct format, size)
+_TYPES = {
+    1: ("B", 1),
+    2: ("s", 1),
+    3: ("H", 2),
+    4: ("I", 4),
+    5: ("II", 8),
+    6: ("b", 1),
+    7: ("B", 1),
+    8: ("h", 2),
+    9: ("i", 4),
+    10: ("ii", 8),
+    11: ("f", 4),
+    12: ("d", 8),
+    16: ("Q", 8),
+    17: ("q", 8),
+    18: ("Q", 8),
+}
+
+_TAGS = {IMAGE_WIDTH, IMAGE_LENGTH, MODEL_PIXEL_SCALE, MODEL_TIEPOINT, MODEL_TRANSFORMATION, GEO_KEY_DIRECTORY}
+
+
+class Header(NamedTuple):
+    """Size and georeferencing of the first image of a GeoTIFF."""
+
+    width: int
+    height: int
+    # GDAL order: (a, b, c, d, e, f), x = a * col + b * row + c
+    transform: Tuple[float, float, float, float, float, float]
+    epsg: Optional[int]
+
+    @property
+    def shape(self) -> List[int]:
+        return [self.height, self.width]
+
+    @property
+    def bbox(self) -> List[float]:
+        a, b, c, d, e, f = self.transform
+        xs = [c, c + a * self.width, c + b * self.height, c + a * self.width + b * self.height]
+        ys = [f, f + d * self.width, f + e * self.height, f + d * self.width + e * self.height]
+        return [min(xs), min(ys), max(xs), max(ys)]
+
+
+class RangeReader:
+    """Read byte ranges of a remote file, `block_size` aligned blocks at a time."""
+
+    def __init__(self, url: str, block_size: int = 16 * 1024):
+        self.url = url
+        self.block_size = block_size
+        self.requests = 0
+        self._blocks: Dict[int, bytes] = {}
+
+    def _fetch(self, first: int, last: int):
+        start, end = first * self.block_size, (last + 1) * self.block_size - 1
+        with metrics.timer("range_read"):
+            resp = fetch.request("GET", self.url, stream=True, headers={"Range": f"bytes={start}-{end}"})
+            try:
+                if resp.status_code != 206:
+                    # the server ignored the range: do not download the whole file
+                    raise ValueError(f"{self.url}: range requests are not supported (HTTP {resp.status_code})")
+                data = resp.read()
+            finally:
+                resp.close()
+        self.requests += 1
+        metrics.incr("range_bytes_total", len(data))
+
+        for i in range(start // self.block_size, (start + len(data) - 1) // self.block_size + 1):
+            offset = i * self.block_size - start
+            self._blocks[i] = data[offset:offset + self.block_size]
+
+    def read(self, offset: int, length: int) -> bytes:
+        first, last = offset // self.block_size, (offset + length - 1) // self.block_size
+        missing = [i for i in range(first, last + 1) if i not in self._blocks]
+        if missing:
+            self._fetch(missing[0], missing[-1])
+
+        data = b"".join(self._blocks.get(i, b"") for i in range(first, last + 1))
+        start = offset - first * self.block_size
+        chunk = data[start:start + length]
+        if len(chunk) < length:
+            raise ValueError(f"{self.url}: unexpected end of file at byte {offset + len(chunk)}")
+        return chunk
+
+
+def _read_ifd(read: Callable[[int, int], bytes]) -> Dict[int, Tuple]:
+    """Values of the tags we need, from the first IFD."""
+    head = read(0, 16)
+    order = {b"II": "<", b"MM": ">"}.get(head[:2])
+    if order is None:
+        raise ValueError("not a TIFF file")
+
+    version = struct.unpack(f"{order}H", head[2:4])[0]
+    if version == 42:
+        ifd_offset = struct.unpack(f"{order}I", head[4:8])[0]
+        count_fmt, entry_fmt, entry_size, inline = "H", "HHII", 12, 4
+    elif version == 43:
+        # BigTIFF
+        ifd_offset = struct.unpack(f"{order}Q", head[8:16])[0]
+        count_fmt, entry_fmt, entry_size, inline = "Q", "HHQQ", 20, 8
+    else:
+        raise ValueError(f"unknown TIFF version {version}")
+
+    count_size = struct.calcsize(count_fmt)
+    n = struct.unpack(f"{order}{count_fmt}", read(ifd_offset, count_size))[0]
+    entries = read(ifd_offset + count_size, n * entry_size)
+
+    tags: Dict[int, Tuple] = {}
+    for i in range(n):
+        tag, type_id, count, value = struct.unpack(
+            f"{order}{entry_fmt}", entries[i * entry_size:(i + 1) * entry_size]
+        )
+        if tag not in _TAGS or type_id not in _TYPES:
+            continue
+
+        fmt, size = _TYPES[type_id]
+        if size * count <= inline:
+            # the value is stored in the entry itself
+            raw = entries[i * entry_size + entry_size - inline:][: size * count]
+        else:
+            raw = read(value, size * count)
+        tags[tag] = struct.unpack(f"{order}{fmt * count}" if fmt != "s" else f"{count}s", raw)
+
+    return tags
+
+
+def _geo_keys(directory: Tuple) -> Dict[int, int]:
+    """Short (inline) values of the GeoKeyDirectory."""
+    keys = {}
+    for i in range(4, 4 + 4 * directory[3], 4):
+        key, location, _, value = directory[i:i + 4]
+        if location == 0:
+            keys[key] = value
+    return keys
+
+
+def parse_header(read: Callable[[int, int], bytes]) -> Header:
+    """Parse the first image header, `read(offset, length)` returning bytes of the file."""
+    tags = _read_ifd(read)
+    width, height = tags[IMAGE_WIDTH][0], tags[IMAGE_LENGTH][0]
+    keys = _geo_keys(tags[GEO_KEY_DIRECTORY]) if GEO_KEY_DIRECTORY in tags else {}
+
+    if MODEL_TRANSFORMATION in tags:
+        m = tags[MODEL_TRANSFORMATION]
+        a, b, c, d, e, f = m[0], m[1], m[3], m[4], m[5], m[7]
+    elif MODEL_TIEPOINT in tags and MODEL_PIXEL_SCALE in tags:
+        i, j, _, x, y, _ = tags[MODEL_TIEPOINT][:6]
+        sx, sy = tags[MODEL_PIXEL_SCALE][:2]
+        a, b, c, d, e, f = sx, 0.0, x - i * sx, 0.0, -sy, y + j * sy
+    else:
+        raise ValueError("no georeferencing tags")
+
+    if keys.get(GT_RASTER_TYPE) == RASTER_PIXEL_IS_POINT:
+        # the tie point is the center of the pixel: shift by half a pixel, as GDAL does
+        c -= 0.5 * a + 0.5 * b
+        f -= 0.5 * d + 0.5 * e
+
+    epsg = keys.get(PROJECTED_CS_TYPE) or keys.get(GEOGRAPHIC_TYPE)
+    if epsg == 32767:
+        # user defined
+        epsg = None
+
+    return Header(width, height, (a, b, c, d, e, f), epsg)
+
+
+def read_header(url: str, block_size: int = 16 * 1024) -> Header:
+    """Read the header of a remote GeoTIFF with range requests."""
+    return parse_header(RangeReader(url, block_size).read)
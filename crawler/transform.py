@@ -0,0 +1,191 @@
+"""Per-source Item rewrites.
+
+The functions are pure (a dict in, a dict out) and defined at module level
+so they can be pickled and run in a `ProcessPoolExecutor`. They are also
+idempotent and reversible: the original href of an already rewritten
+asset is taken from its `alternate.public` entry, so Items can be
+transformed again from a previous NDJSON output (see `crawler.retransform`).
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+
+ALTERNATE_ASSETS = "https://stac-extensions.github.io/alternate-assets/v1.1.0/schema.json"
+
+
+def _original_href(asset: Dict, https_prefix: str, s3_prefix: str) -> str:
+    public = asset.get("alternate", {}).get("public", {})
+    return public.get("href", asset["href"].replace(s3_prefix, https_prefix))
+
+
+def with_s3_assets(item: Dict, https_prefix: str, s3_prefix: str) -> Dict:
+    """Point the assets to S3, keeping the public URL as an alternate href."""
+    extensions = item.setdefault("stac_extensions", [])
+    if ALTERNATE_ASSETS not in extensions:
+        extensions.append(ALTERNATE_ASSETS)
+
+    for asset in item["assets"].values():
+        ori = _original_href(asset, https_prefix, s3_prefix)
+        asset["href"] = ori.replace(https_prefix, s3_prefix)
+        asset["alternate"] = {
+            "public": {
+                "title": "Public Access",
+                "href": ori,
+            }
+        }
+
+    return item
+
+
+def without_s3_assets(item: Dict, https_prefix: str, s3_prefix: str) -> Dict:
+    """Undo `with_s3_assets`, pointing the assets back to their public URL."""
+    for asset in item["assets"].values():
+        if asset["href"].startswith(s3_prefix):
+            asset["href"] = _original_href(asset, https_prefix, s3_prefix)
+            asset.get("alternate", {}).pop("public", None)
+            if "alternate" in asset and not asset["alternate"]:
+                del asset["alternate"]
+
+    if ALTERNATE_ASSETS in item.get("stac_extensions", []) and not any(
+        "alternate" in asset for asset in item["assets"].values()
+    ):
+        item["stac_extensions"].remove(ALTERNATE_ASSETS)
+
+    return item
+
+
+def _replace_prefix(item: Dict, old: str, new: str) -> Dict:
+    for asset in item["assets"].values():
+        asset["href"] = asset["href"].replace(old, new)
+
+    return item
+
+
+def maxar_item(item: Dict, collection_id: str, with_s3_urls: bool = False, url: Optional[str] = None) -> Dict:
+    """Maxar OpenData Item (with absolute asset hrefs)."""
+    item["links"] = []
+    item["collection"] = collection_id
+    item["id"] = item["id"].replace("/", "_")
+    if with_s3_urls:
+        with_s3_assets(item, "https://maxar-opendata.s3.amazonaws.com", "s3://maxar-opendata")
+    else:
+        without_s3_assets(item, "https://maxar-opendata.s3.amazonaws.com", "s3://maxar-opendata")
+
+    return item
+
+
+def umbra_item(item: Dict, collection_id: str, with_s3_urls: bool = False, url: Optional[str] = None) -> Dict:
+    """Umbra OpenData Item."""
+    item["links"] = []
+    item["collection"] = collection_id
+    item["id"] = item["id"].replace("/", "_")
+    item.setdefault("stac_extensions", [])
+    if with_s3_urls:
+        _replace_prefix(item, "http://", "https://")
+        with_s3_assets(
+            item,
+            "https://umbra-open-data-catalog.s3.amazonaws.com",
+            "s3://umbra-open-data-catalog",
+        )
+    else:
+        without_s3_assets(
+            item,
+            "https://umbra-open-data-catalog.s3.amazonaws.com",
+            "s3://umbra-open-data-catalog",
+        )
+
+    return item
+
+
+def linz_item(item: Dict, collection_id: str, with_s3_urls: bool = False, url: Optional[str] = None) -> Dict:
+    """LINZ imagery Item.
+
+    With `with_s3_urls`, the `./` asset hrefs are resolved against the Item `url`.
+    """
+    item_id = item["id"]
+    item["links"] = []
+    item["collection"] = collection_id
+    item["id"] = item_id.replace("/", "_")
+    if with_s3_urls:
+        if url:
+            root_path = url.replace(f"{item_id}.json", "")
+            for asset in item["assets"].values():
+                asset["href"] = asset["href"].replace("./", root_path)
+
+        with_s3_assets(
+            item,
+            "https://nz-imagery.s3-ap-southeast-2.amazonaws.com",
+            "s3://nz-imagery",
+        )
+    else:
+        without_s3_assets(
+            item,
+            "https://nz-imagery.s3-ap-southeast-2.amazonaws.com",
+            "s3://nz-imagery",
+        )
+
+    return item
+
+
+def sentinel2_item(item: Dict, collection_id: str, with_s3_urls: bool = False, url: Optional[str] = None) -> Dict:
+    """Earth Search Sentinel-2 L2A Item, without the JP2 assets and the `s2:`/`earthsearch:` properties."""
+    item["collection"] = collection_id
+    item["links"] = []
+
+    if "assets" in item:
+        item["assets"] = {k: v for k, v in item["assets"].items() if "jp2" not in v["href"]}
+
+    https_prefix = "https://sentinel-cogs.s3.us-west-2.amazonaws.com/sentinel-s2-l2a-cogs"
+    s3_prefix = "s3://sentinel-cogs/sentinel-s2-l2a-cogs"
+    if with_s3_urls:
+        _replace_prefix(item, https_prefix, s3_prefix)
+    else:
+        _replace_prefix(item, s3_prefix, https_prefix)
+
+    item["properties"] = {
+        k: v
+        for k, v in item["properties"].items()
+        if not k.startswith(("s2:", "earthsearch:"))
+    }
+
+    return item
+
+
+def copernicus_dem_item(item: Dict, collection_id: str, with_s3_urls: bool = False, url: Optional[str] = None) -> Dict:
+    """Copernicus DEM GLO-30 Item."""
+    item["collection"] = collection_id
+    https_prefix = "https://copernicus-dem-30m.s3.amazonaws.com"
+    s3_prefix = "s3://copernicus-dem-30m"
+    if with_s3_urls:
+        _replace_prefix(item, https_prefix, s3_prefix)
+    else:
+        _replace_prefix(item, s3_prefix, https_prefix)
+
+    return item
+
+
+sources: Dict[str, Callable[..., Dict]] = {
+    "maxar": maxar_item,
+    "umbra": umbra_item,
+    "linz": linz_item,
+    "sentinel-2": sentinel2_item,
+    "copernicus-dem": copernicus_dem_item,
+}
+
+
+class Transform:
+    """Picklable `(url, item, *extra)` record transform.
+
+    Records with no Item (e.g unchanged since the last incremental run)
+    are passed through.
+    """
+
+    def __init__(self, func: Callable[..., Dict], **kwargs: Any):
+        self.func = func
+        self.kwargs = kwargs
+
+    def __call__(self, record: Tuple, **kwargs: Any) -> Tuple:
+        url, item, *extra = record
+        if item is not None:
+            item = self.func(item, url=url, **self.kwargs, **kwargs)
+
+        return (url, item, *extra)
@@ -0,0 +1,102 @@
+"""Concurrent breadth-first traversal of static STAC catalogs."""
+
+from concurrent import futures
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+from urllib.parse import urljoin, urlparse
+
+import pystac
+
+from crawler import fetch, jsonio, metrics
+from crawler.cache import DocumentCache
+
+
+class Node(NamedTuple):
+    """A catalog (or collection) of the tree, with its resolved links."""
+
+    url: str
+    doc: Dict
+    depth: int
+    child_links: List[str]
+    item_links: List[str]
+
+    def to_pystac(self) -> pystac.STACObject:
+        """pystac Catalog/Collection, with its self href set."""
+        return pystac.read_dict(self.doc, href=self.url)
+
+
+def read_text(url: str, cache: Optional[DocumentCache] = None) -> str:
+    """Fetch a document, from the `cache` when it holds a fresh copy."""
+    if cache is not None:
+        body = cache.get(url)
+        if body is not None:
+            metrics.incr("cache_hits_total")
+            return body
+        metrics.incr("cache_misses_total")
+
+    if urlparse(url).scheme not in ("http", "https"):
+        with open(url, "r") as f:
+            return f.read()
+
+    body = fetch.get(url).text
+    if cache is not None:
+        cache.put(url, body)
+    return body
+
+
+def read_node(url: str, depth: int = 0, read: Callable[[str], str] = read_text) -> Node:
+    """Read a catalog and resolve its child and item links."""
+    doc = jsonio.loads(read(url))
+    links = doc.get("links", [])
+    return Node(
+        url,
+        doc,
+        depth,
+        [urljoin(url, link["href"]) for link in links if link.get("rel") == "child"],
+        [urljoin(url, link["href"]) for link in links if link.get("rel") == "item"],
+    )
+
+
+def children(node: Node, read: Callable[[str], str] = read_text, max_workers: int = 16) -> List[Node]:
+    """Read the children of `node` in parallel, in link order."""
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(
+            executor.map(lambda url: read_node(url, node.depth + 1, read), node.child_links)
+        )
+
+
+def walk(
+    root: Union[str, Node],
+    read: Callable[[str], str] = read_text,
+    max_workers: int = 16,
+    max_depth: Optional[int] = None,
+) -> Iterator[Node]:
+    """Yield every catalog of the tree under `root`, fetching siblings concurrently.
+
+    Nodes are yielded as soon as they are read (roughly breadth first),
+    their children being already queued. `read` returns the text of a
+    document, e.g. `partial(read_text, cache=cache)` or
+    `SyncState.get_text`.
+    """
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if isinstance(root, Node):
+            seen = {root.url}
+            pending = {executor.submit(lambda: root)}
+        else:
+            seen = {root}
+            pending = {executor.submit(read_node, root, 0, read)}
+        try:
+            while pending:
+                metrics.gauge("traverse_pending", len(pending))
+                done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for fut in done:
+                    node = fut.result()
+                    if max_depth is None or node.depth < max_depth:
+                        for child in node.child_links:
+                            if child not in seen:
+                                seen.add(child)
+                                pending.add(executor.submit(read_node, child, node.depth + 1, read))
+
+                    yield node
+
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,268 @@
+"""Validate NDJSON STAC Items (or Collections) against their JSON schemas.
+
+python -m crawler.validate Umbra/items.json.zip Copernicus-Dem/items.json.zip --processes 4
+
+Every object is checked against the core schema of its `stac_version` and
+the schemas listed in its `stac_extensions`. Schemas (and the documents
+they reference, e.g the GeoJSON ones) are read from a local directory
+mirroring their URLs (`~/.cache/stac-schemas/schemas.stacspec.org/...`),
+filled from the network on first use, and each schema is compiled once per
+worker process. With `--offline`, only that directory is used.
+
+Needs `fastjsonschema` (schemas compiled to Python code, faster) or
+`jsonschema` (>= 4.18). The command exits with an error when an
+object is invalid, so it can gate `pypgstac load`.
+"""
+
+import heapq
+import os
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+import click
+import httpx
+
+from crawler import fetch, jsonio, output, pipeline
+from crawler.retransform import read_numbered_records
+
+SCHEMAS_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stac-schemas")
+
+CORE_SCHEMAS = {
+    "Feature": "item-spec/json-schema/item.json",
+    "Collection": "collection-spec/json-schema/collection.json",
+    "Catalog": "catalog-spec/json-schema/catalog.json",
+}
+
+
+class SchemaCache:
+    """JSON schema documents, stored in `directory` under their URL."""
+
+    def __init__(self, directory: str = SCHEMAS_DIR, offline: bool = False):
+        self.directory = directory
+        self.offline = offline
+        self._documents: Dict[str, Any] = {}
+
+    def path(self, url: str) -> str:
+        parts = urlsplit(url)
+        return os.path.join(self.directory, parts.netloc, *parts.path.strip("/").split("/"))
+
+    def get(self, url: str) -> Any:
+        url = urldefrag(url)[0]
+        document = self._documents.get(url)
+        if document is not None:
+            return document
+
+        path = self.path(url)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                body = f.read()
+        elif self.offline:
+            raise LookupError(f"{url} is not in the schema cache ({path})")
+        else:
+            try:
+                body = fetch.get(url).content
+            except httpx.HTTPError as e:
+                raise LookupError(f"{url} could not be fetched: {e}") from None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written atomically, worker processes may fetch the same schema
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+
+        document = self._documents[url] = jsonio.loads(body)
+        return document
+
+
+def _refs(schema: Any) -> Iterator[str]:
+    """`$ref` values of a schema."""
+    if isinstance(schema, dict):
+        for key, value in schema.items():
+            if key == "$ref" and isinstance(value, str):
+                yield value
+            else:
+                yield from _refs(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            yield from _refs(value)
+
+
+class Validators:
+    """Validators of the core and extension schemas, compiled once per schema.
+
+    Schemas are compiled to Python code with `fastjsonschema` when it is
+    installed (reporting the first error of each schema), and otherwise
+    turned into `jsonschema` validators (reporting all errors), with their
+    references resolved once.
+
+    """
+
+    def __init__(self, schemas: SchemaCache, backend: Optional[str] = None):
+        if backend is None:
+            try:
+                import fastjsonschema  # noqa: F401
+
+                backend = "fastjsonschema"
+            except ImportError:
+                backend = "jsonschema"
+
+        if backend == "jsonschema":
+            try:
+                from jsonschema.validators import validator_for
+                from referencing import Registry, Resource
+            except ImportError:
+                raise ImportError("`fastjsonschema` or `jsonschema` (>= 4.18) is required to validate STAC objects") from None
+
+            self._validator_for = validator_for
+            self._resource = Resource.from_contents
+            self._registry = Registry()
+
+        self.schemas = schemas
+        self.backend = backend
+        self._validators: Dict[str, Callable[[Dict], List[Tuple[str, str]]]] = {}
+
+    def _add(self, url: str):
+        """Add a schema and the documents it references to the registry."""
+        pending = [url]
+        while pending:
+            url = pending.pop()
+            if url in self._registry:
+                continue
+
+            schema = self.schemas.get(url)
+            self._registry = self._registry.with_resource(url, self._resource(schema))
+            for ref in _refs(schema):
+                ref_url = urldefrag(urljoin(url, ref))[0]
+                if ref_url and ref_url not in self._registry:
+                    pending.append(ref_url)
+
+    def _compile(self, url: str) -> Callable[[Dict], List[Tuple[str, str]]]:
+        schema = self.schemas.get(url)
+
+        if self.backend == "fastjsonschema":
+            import fastjsonschema
+
+            func = fastjsonschema.compile(schema, handlers={"http": self.schemas.get, "https": self.schemas.get})
+
+            def _errors(obj: Dict) -> List[Tuple[str, str]]:
+                try:
+                    func(obj)
+                except fastjsonschema.JsonSchemaValueException as e:
+                    # e.path is ["data", ...]
+                    return [(e.message, "/".join(str(part) for part in e.path[1:]))]
+                return []
+
+            return _errors
+
+        # references are resolved once here, not for every object
+        self._add(url)
+        self._registry = self._registry.crawl()
+        validator = self._validator_for(schema)(schema, registry=self._registry)
+        return lambda obj: [
+            (error.message, "/".join(str(part) for part in error.absolute_path))
+            for error in validator.iter_errors(obj)
+        ]
+
+    def get(self, url: str) -> Callable[[Dict], List[Tuple[str, str]]]:
+        validator = self._validators.get(url)
+        if validator is None:
+            validator = self._validators[url] = self._compile(url)
+        return validator
+
+    def schema_urls(self, obj: Dict) -> List[str]:
+        core = CORE_SCHEMAS.get(obj.get("type", ""), CORE_SCHEMAS["Feature"])
+        version = obj.get("stac_version", "1.0.0")
+        return [f"https://schemas.stacspec.org/v{version}/{core}", *obj.get("stac_extensions", [])]
+
+    def errors(self, obj: Dict, max_length: int = 300) -> List[str]:
+        """Validation errors of a STAC object (empty when valid)."""
+        messages = []
+        for url in self.schema_urls(obj):
+            for message, location in self.get(url)(obj):
+                if len(message) > max_length:
+                    message = message[:max_length] + "..."
+                messages.append(f"{message} (at /{location}, {url})")
+        return messages
+
+
+# one set of compiled validators per (worker) process
+_validators: Dict[Tuple[str, bool], Validators] = {}
+
+
+def check_line(record: Tuple[int, bytes], directory: str = SCHEMAS_DIR, offline: bool = False) -> Optional[Tuple[int, str, List[str]]]:
+    """`(line number, id, errors)` of an invalid NDJSON line, None when valid."""
+    validators = _validators.get((directory, offline))
+    if validators is None:
+        validators = _validators[(directory, offline)] = Validators(SchemaCache(directory, offline))
+
+    lineno, line = record
+    try:
+        obj = jsonio.loads(line)
+    except ValueError as e:
+        return lineno, "", [f"invalid JSON: {e}"]
+
+    errors = validators.errors(obj)
+    return (lineno, obj.get("id", ""), errors) if errors else None
+
+
+def _paths(path: str) -> Iterator[str]:
+    """Input files, the shards of a sharded output being reported separately."""
+    if os.path.isdir(path):
+        with open(os.path.join(path, output.MANIFEST), "rb") as f:
+            manifest = jsonio.loads(f.read())
+        for shard in manifest["shards"]:
+            yield os.path.join(path, shard["path"])
+    else:
+        yield path
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True)
+@click.option("--schemas", "schemas_dir", type=str, default=SCHEMAS_DIR, show_default=True, help="Local schema cache directory.")
+@click.option("--offline", is_flag=True, help="Only use the schemas of the local cache.")
+@click.option("--processes", type=int, default=0, help="Number of worker processes (default to inline).")
+@click.option("--chunksize", type=int, default=500, help="Number of lines sent to a worker at once.")
+@click.option("--max-errors", type=int, default=100, help="Maximum number of invalid objects reported per input.")
+def main(inputs, schemas_dir, offline, processes, chunksize, max_errors):
+    """Validate NDJSON STAC objects (plain, .zip, .gz, .zst or shards)."""
+    func = partial(check_line, directory=schemas_dir, offline=offline)
+
+    t0 = time.perf_counter()
+    count = invalid = 0
+    try:
+        for path in (p for i in inputs for p in _paths(i)):
+            # the first `max_errors` invalid lines, as (-line number, result)
+            failures: List[Tuple[int, Tuple[int, str, List[str]]]] = []
+            records = pipeline.process(
+                func,
+                read_numbered_records(path),
+                processes=processes,
+                chunksize=chunksize,
+                stage="validate",
+            )
+            for result in records:
+                count += 1
+                if result is not None:
+                    invalid += 1
+                    # results come in completion order
+                    if len(failures) < max_errors:
+                        heapq.heappush(failures, (-result[0], result))
+                    elif failures and result[0] < -failures[0][0]:
+                        heapq.heapreplace(failures, (-result[0], result))
+
+            for _, (lineno, obj_id, errors) in sorted(failures, reverse=True):
+                for error in errors:
+                    click.echo(f"{path}:{lineno}: {obj_id}: {error}")
+    except LookupError as e:
+        raise click.ClickException(str(e)) from None
+
+    elapsed = time.perf_counter() - t0
+    click.echo(f"{count} objects validated in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} objects/s), {invalid} invalid")
+    if invalid:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+# benchmarks/mock_server.py
+sys.path.append(str(ROOT / "benchmarks"))
+
+from mock_server import Catalogs, MockServer  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def catalogs():
+    # more than 1000 S3 keys per bucket: listings are paginated
+    return Catalogs(collections=2, items=600, assets=2, page_size=100)
+
+
+@pytest.fixture(scope="module")
+def server(catalogs):
+    with MockServer(catalogs) as server:
+        yield server
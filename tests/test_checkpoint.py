@@ -0,0 +1,125 @@
+import gzip
+import os
+import subprocess
+import sys
+import textwrap
+
+from crawler import jsonio
+from crawler.checkpoint import Checkpoint
+from crawler.output import MANIFEST, NdjsonWriter, ShardedWriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _item(n: int, collection: str = "a"):
+    return {"id": f"item-{n}", "collection": collection, "bbox": [0, 0, 1, 1], "properties": {"datetime": "2024-01-01T00:00:00Z"}}
+
+
+def _read(directory: str):
+    """Manifest and Item ids of a ShardedWriter directory."""
+    with open(os.path.join(directory, MANIFEST), "rb") as f:
+        manifest = jsonio.loads(f.read())
+
+    ids = []
+    for shard in manifest["shards"]:
+        path = os.path.join(directory, shard["path"])
+        with (gzip.open(path) if path.endswith(".gz") else open(path, "rb")) as f:
+            ids.extend(jsonio.loads(line)["id"] for line in f)
+    return manifest, ids
+
+
+def test_ndjson_truncated_to_last_commit(tmp_path):
+    items_path, db = str(tmp_path / "items.json"), str(tmp_path / "items.checkpoint")
+    with NdjsonWriter(items_path) as f_itm:
+        checkpoint = Checkpoint(db, f_itm)
+        for n in range(3):
+            f_itm.write(_item(n))
+            checkpoint.add(f"key-{n}", _item(n))
+        checkpoint.commit()
+        # written, not committed
+        f_itm.write(_item(3))
+        f_itm.flush()
+        checkpoint.db.close()
+
+    with NdjsonWriter(items_path) as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        assert len(checkpoint) == 3
+        assert "key-3" not in checkpoint
+        f_itm.write(_item(3))
+        checkpoint.add("key-3", _item(3))
+
+    with open(items_path, "rb") as f:
+        assert [jsonio.loads(line)["id"] for line in f] == [f"item-{n}" for n in range(4)]
+
+
+def test_sharded_killed_between_flush_and_commit(tmp_path):
+    """The manifest is written by the flush, the process dies before the journal commit."""
+    items_path, db = str(tmp_path / "items"), str(tmp_path / "items.checkpoint")
+    script = textwrap.dedent(
+        f"""
+        import os, sys
+        sys.path.append({ROOT!r})
+        from crawler.checkpoint import Checkpoint
+        from crawler.output import ShardedWriter
+
+        f_itm = ShardedWriter({items_path!r}, compression="gzip", writers=2)
+        checkpoint = Checkpoint({db!r}, f_itm)
+        for n in range(5):
+            item = {{"id": f"item-{{n}}", "collection": "ab"[n % 2]}}
+            f_itm.write(item)
+            checkpoint.add(f"key-{{n}}", item)
+        checkpoint.commit()
+
+        for n in range(5, 8):
+            item = {{"id": f"item-{{n}}", "collection": "ab"[n % 2]}}
+            f_itm.write(item)
+            checkpoint.add(f"key-{{n}}", item)
+        f_itm.flush()
+        os._exit(1)
+        """
+    )
+    assert subprocess.run([sys.executable, "-c", script]).returncode == 1
+
+    manifest, _ = _read(items_path)
+    # the manifest on disk is ahead of the journal
+    assert sum(shard["items"] for shard in manifest["shards"]) == 8
+
+    with ShardedWriter(items_path, compression="gzip") as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        assert len(checkpoint) == 5
+        for n in range(8):
+            if f"key-{n}" not in checkpoint:
+                item = {"id": f"item-{n}", "collection": "ab"[n % 2]}
+                f_itm.write(item)
+                checkpoint.add(f"key-{n}", item)
+
+    manifest, ids = _read(items_path)
+    assert sum(shard["items"] for shard in manifest["shards"]) == 8
+    assert sorted(ids) == [f"item-{n}" for n in range(8)]
+
+
+def test_sharded_unknown_shards_removed(tmp_path):
+    items_path, db = str(tmp_path / "items"), str(tmp_path / "items.checkpoint")
+    with ShardedWriter(items_path) as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        f_itm.write(_item(0, "a"))
+        checkpoint.add("key-0", _item(0, "a"))
+
+    # a shard started after the last commit
+    with open(os.path.join(items_path, "b-00000.ndjson"), "wb") as f:
+        f.write(b'{"id": "item-1"}\n')
+
+    with ShardedWriter(items_path) as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        assert len(checkpoint) == 1
+
+    assert sorted(os.listdir(items_path)) == ["a-00000.ndjson", MANIFEST]
+
+
+def test_sharded_other_journal_starts_over(tmp_path):
+    db = str(tmp_path / "items.checkpoint")
+    with ShardedWriter(str(tmp_path / "a")) as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        f_itm.write(_item(0))
+        checkpoint.add("key-0", _item(0))
+
+    # the journal of `a`, with an empty directory
+    with ShardedWriter(str(tmp_path / "b")) as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        assert len(checkpoint) == 0
+
+    assert os.listdir(tmp_path / "b") == [MANIFEST]
@@ -0,0 +1,55 @@
+from crawler import discover
+
+
+def test_parse():
+    assert discover.parse("s3://maxar-opendata/events/") == (
+        "https://maxar-opendata.s3.amazonaws.com", "maxar-opendata", "events/", True,
+    )
+    assert discover.parse("https://nz-imagery.s3-ap-southeast-2.amazonaws.com/catalog.json") == (
+        "https://nz-imagery.s3-ap-southeast-2.amazonaws.com", "nz-imagery", "catalog.json", True,
+    )
+    assert discover.parse("http://127.0.0.1:8000/maxar/event-0/") == (
+        "http://127.0.0.1:8000/maxar", "maxar", "event-0/", False,
+    )
+
+
+def test_http_url():
+    assert discover.http_url("s3://umbra-open-data-catalog/a b.json") == "https://umbra-open-data-catalog.s3.amazonaws.com/a%20b.json"
+    assert discover.http_url("https://example.com/a.json") == "https://example.com/a.json"
+
+
+def test_list_objects_pagination(server, catalogs):
+    pages = list(discover.list_objects(discover.parse(f"{server.url}/maxar/")))
+    # 1000 keys per page
+    assert len(pages) == 2
+    keys = [key for keys, _ in pages for key in keys]
+    assert keys == catalogs._keys("maxar")
+
+
+def test_list_objects_delimiter(server, catalogs):
+    pages = list(discover.list_objects(discover.parse(f"{server.url}/maxar/"), delimiter="/"))
+    assert [key for keys, _ in pages for key in keys] == ["catalog.json"]
+    assert [prefix for _, prefixes in pages for prefix in prefixes] == [f"event-{c}/" for c in range(catalogs.collections)]
+
+
+def test_list_keys(server, catalogs):
+    expected = [key for key in catalogs._keys("maxar") if not key.endswith(("catalog.json", "collection.json"))]
+    for depth in (0, 1):
+        keys = list(discover.list_keys(f"{server.url}/maxar/", depth=depth))
+        assert sorted(keys) == sorted(expected)
+
+
+def test_list_urls(server, catalogs):
+    urls = list(discover.list_urls(f"{server.url}/maxar/event-1/"))
+    assert len(urls) == catalogs.items
+    assert urls[0].startswith(f"{server.url}/maxar/event-1/")
+
+
+def test_list_keys_prefixes(server, catalogs):
+    url = f"{server.url}/copernicus-dem-30m/"
+    expected = list(discover.list_keys(url, suffix=".tif", depth=0))
+    assert len(expected) == catalogs.collections * catalogs.items
+
+    # one listing per latitude band, in parallel
+    prefixes = [f"Copernicus_DSM_COG_10_{hemisphere}{lat:02d}_" for hemisphere in "NS" for lat in range(91)]
+    assert sorted(discover.list_keys(url, suffix=".tif", prefixes=prefixes)) == sorted(expected)
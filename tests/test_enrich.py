@@ -0,0 +1,95 @@
+import hashlib
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from click.testing import CliRunner
+
+from crawler import enrich, fetch
+
+
+@pytest.fixture
+def assets():
+    """HEAD only file server: `/data/{n}.tif` files, anything else is missing."""
+    requests = Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            requests[self.path] += 1
+            if not self.path.startswith("/data/"):
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(self.path) * 1000))
+            self.send_header("ETag", f'"{hashlib.md5(self.path.encode()).hexdigest()}"')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", requests
+    httpd.shutdown()
+    fetch.configure()
+
+
+def _item(url: str, n: int):
+    return {
+        "type": "Feature",
+        "id": f"item-{n}",
+        "collection": "a",
+        "stac_extensions": [],
+        "assets": {
+            "data": {"href": f"{url}/data/{n}.tif"},
+            "thumbnail": {"href": "./thumbnail.png"},
+            **({"missing": {"href": f"{url}/missing/{n}.tif"}} if n % 10 == 0 else {}),
+        },
+    }
+
+
+def test_enrich(assets, tmp_path):
+    url, requests = assets
+    with open(tmp_path / "items.json", "w") as f:
+        for n in range(50):
+            f.write(json.dumps(_item(url, n)) + "\n")
+        f.write(json.dumps({"type": "Feature", "id": "no-assets", "assets": {}}) + "\n")
+
+    def run():
+        return CliRunner().invoke(enrich.main, [
+            str(tmp_path / "items.json"),
+            f"--output={tmp_path / 'enriched.json'}",
+            f"--unreachable={tmp_path / 'unreachable.json'}",
+            f"--cache={tmp_path / 'assets.db'}",
+            "--concurrency=8",
+        ])
+
+    result = run()
+    assert result.exit_code == 0, result.output
+
+    with open(tmp_path / "enriched.json") as f:
+        items = {item["id"]: item for item in map(json.loads, f)}
+    assert len(items) == 51
+
+    asset = items["item-3"]["assets"]["data"]
+    assert asset["file:size"] == len("/data/3.tif") * 1000
+    assert asset["file:checksum"] == "d510" + hashlib.md5(b"/data/3.tif").hexdigest()
+    assert items["item-3"]["stac_extensions"] == [enrich.FILE_EXTENSION]
+    # not checked, or unreachable
+    assert items["item-3"]["assets"]["thumbnail"] == {"href": "./thumbnail.png"}
+    assert items["item-0"]["assets"]["missing"] == {"href": f"{url}/missing/0.tif"}
+
+    with open(tmp_path / "unreachable.json") as f:
+        report = [json.loads(line) for line in f]
+    assert sorted(row["item"] for row in report) == [f"item-{n}" for n in range(0, 50, 10)]
+    assert {row["asset"] for row in report} == {"missing"}
+
+    # only the unreachable assets are checked again
+    requests.clear()
+    assert run().exit_code == 0
+    assert sorted(requests) == sorted(f"/missing/{n}.tif" for n in range(0, 50, 10))
@@ -0,0 +1,140 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from crawler import geoparquet  # noqa: E402
+from crawler.checkpoint import Checkpoint  # noqa: E402
+from crawler.output import NdjsonWriter, TeeWriter  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _item(n: int, collection: str = "a", **properties):
+    return {
+        "type": "Feature",
+        "id": f"item-{n}",
+        "collection": collection,
+        "geometry": {"type": "Point", "coordinates": [n, 0]},
+        "bbox": [n, 0, n, 0],
+        "properties": {"datetime": "2024-01-01T00:00:00Z", **properties},
+        "assets": {"data": {"href": f"{n}.tif", "roles": ["data"]}},
+    }
+
+
+def _files(directory):
+    return sorted(name for name in os.listdir(directory) if not name.startswith("_"))
+
+
+def _ids(directory):
+    return sorted(
+        row["id"]
+        for name in _files(directory)
+        for row in pq.read_table(os.path.join(directory, name)).to_pylist()
+    )
+
+
+def test_wkb():
+    assert geoparquet.wkb({"type": "Point", "coordinates": [1.0, 2.0]}) == bytes.fromhex(
+        "0101000000000000000000f03f0000000000000040"
+    )
+
+
+def test_one_file_per_partition(tmp_path):
+    with geoparquet.GeoparquetWriter(str(tmp_path), row_group_size=2) as writer:
+        writer.write(_item(0))
+        writer.write(_item(1, cloud_cover=1))
+        # optional properties and assets, in other row groups
+        writer.write(_item(2, cloud_cover=1.5, platform="x"))
+        item = _item(3)
+        item["assets"]["thumbnail"] = {"href": "3.png", "type": "image/png"}
+        writer.write(item)
+        writer.write(_item(4, collection="b/c"))
+
+    assert sorted(os.listdir(tmp_path)) == ["collection=a", "collection=b_c"]
+    assert _files(tmp_path / "collection=a") == ["part-00000.parquet"]
+
+    table = pq.read_table(tmp_path / "collection=a" / "part-00000.parquet")
+    assert table.num_rows == 4
+    assert table.schema.field("cloud_cover").type == pa.float64()
+    assert [row["platform"] for row in table.to_pylist()] == [None, None, "x", None]
+
+    geo = json.loads(table.schema.metadata[b"geo"])
+    # OGC:CRS84 by default
+    assert "crs" not in geo["columns"]["geometry"]
+
+
+def test_incompatible_types(tmp_path):
+    with geoparquet.GeoparquetWriter(str(tmp_path), row_group_size=1) as writer:
+        writer.write(_item(0, platform=1))
+        writer.write(_item(1, platform=2))
+        writer.write(_item(2, platform="x"))
+
+    assert _files(tmp_path / "collection=a") == ["part-00000.parquet", "part-00001.parquet"]
+    assert _ids(tmp_path / "collection=a") == ["item-0", "item-1", "item-2"]
+
+
+def test_resumed_with_checkpoint(tmp_path):
+    items_path, db, directory = str(tmp_path / "items.json"), str(tmp_path / "items.checkpoint"), str(tmp_path / "parquet")
+    script = textwrap.dedent(
+        f"""
+        import os, sys
+        sys.path.append({ROOT!r})
+        sys.path.append({os.path.dirname(__file__)!r})
+        from test_geoparquet import _item
+        from crawler.checkpoint import Checkpoint
+        from crawler.geoparquet import GeoparquetWriter
+        from crawler.output import NdjsonWriter, TeeWriter
+
+        f_itm = TeeWriter(NdjsonWriter({items_path!r}), GeoparquetWriter({directory!r}))
+        checkpoint = Checkpoint({db!r}, f_itm)
+        for n in range(5):
+            f_itm.write(_item(n, "ab"[n % 2]))
+            checkpoint.add(f"key-{{n}}", _item(n, "ab"[n % 2]))
+        checkpoint.commit()
+
+        # written and flushed, not committed
+        for n in range(5, 8):
+            f_itm.write(_item(n, "ab"[n % 2]))
+        f_itm.flush()
+        os._exit(1)
+        """
+    )
+    assert subprocess.run([sys.executable, "-c", script]).returncode == 1
+
+    with TeeWriter(NdjsonWriter(items_path), geoparquet.GeoparquetWriter(directory)) as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        assert len(checkpoint) == 5
+        for n in range(10):
+            if f"key-{n}" not in checkpoint:
+                f_itm.write(_item(n, "ab"[n % 2]))
+                checkpoint.add(f"key-{n}", _item(n, "ab"[n % 2]))
+
+    assert _ids(os.path.join(directory, "collection=a")) == sorted(f"item-{n}" for n in range(0, 10, 2))
+    assert _ids(os.path.join(directory, "collection=b")) == sorted(f"item-{n}" for n in range(1, 10, 2))
+
+    # a later run with the same checkpoint keeps them, and adds new files
+    with TeeWriter(NdjsonWriter(items_path), geoparquet.GeoparquetWriter(directory)) as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        assert len(checkpoint) == 10
+        f_itm.write(_item(10))
+        checkpoint.add("key-10", _item(10))
+
+    assert _files(os.path.join(directory, "collection=a")) == ["part-00000.parquet", "part-00001.parquet"]
+    assert len(_ids(os.path.join(directory, "collection=a"))) == 6
+
+
+def test_other_directory_refused(tmp_path):
+    items_path, db = str(tmp_path / "items.json"), str(tmp_path / "items.checkpoint")
+    with NdjsonWriter(items_path) as f_itm, Checkpoint(db, f_itm) as checkpoint:
+        f_itm.write(_item(0))
+        checkpoint.add("key-0", _item(0))
+
+    # --geoparquet added when resuming: the Items already written would be missing
+    with pytest.raises(ValueError, match="does not hold the Items of the checkpoint"):
+        with TeeWriter(NdjsonWriter(items_path), geoparquet.GeoparquetWriter(str(tmp_path / "parquet"))) as f_itm:
+            Checkpoint(db, f_itm)
@@ -0,0 +1,102 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+from crawler.index import IdIndex
+
+
+def _item(n: int, collection: str = "a"):
+    return {"id": f"item-{n}", "collection": collection}
+
+
+def test_collision_reported(tmp_path):
+    with IdIndex(str(tmp_path / "ids.idx")) as index:
+        assert index.add("a/item-1.json", _item(1))
+        # same source again (incremental update)
+        assert index.add("a/item-1.json", _item(1))
+        assert not index.add("b/item-1.json", _item(1))
+        assert index.add("b/item-1.json", _item(1, "b"))
+        assert index.collisions == [("a", "item-1", "b/item-1.json")]
+
+
+def test_save_appends_to_log(tmp_path):
+    path = str(tmp_path / "ids.idx")
+    index = IdIndex(path)
+    for n in range(1000):
+        index.add(f"key-{n}", _item(n))
+    # first save: written in full
+    index.save()
+    assert not os.path.exists(f"{path}.log")
+
+    index.add("key-1000", _item(1000))
+    index.save()
+    assert os.path.getsize(f"{path}.log") > 0
+
+    # killed before close: the log is read back
+    resumed = IdIndex(path)
+    assert "key-1000" in resumed and "key-0" in resumed
+    assert len(resumed) == 1001
+
+    resumed.close()
+    assert not os.path.exists(f"{path}.log")
+    assert len(IdIndex(path)) == 1001
+
+
+def test_truncated_log_record_ignored(tmp_path):
+    path = str(tmp_path / "ids.idx")
+    index = IdIndex(path)
+    for n in range(1000):
+        index.add(f"key-{n}", _item(n))
+    index.save()
+    index.add("key-1000", _item(1000))
+    index.save()
+    index.add("key-1001", _item(1001))
+    index.save()
+
+    with open(f"{path}.log", "r+b") as f:
+        f.truncate(os.path.getsize(f"{path}.log") - 8)
+
+    resumed = IdIndex(path)
+    assert "key-1000" in resumed
+    assert "key-1001" not in resumed
+
+
+def test_summaries_kept(tmp_path):
+    path = str(tmp_path / "ids.idx")
+    with IdIndex(path) as index:
+        index.add("a/1", dict(_item(1), bbox=[0, 0, 1, 1], properties={"datetime": "2020-01-01T00:00:00Z"}))
+        index.add("a/2", dict(_item(2), bbox=[1, 1, 2, 2], properties={"datetime": "2021-01-01T00:00:00Z"}))
+        index.save()
+
+    # the extent of the Items a rerun skips
+    with IdIndex(path) as index:
+        (summary,) = index.summaries("a")
+        assert summary["bbox"] == [0, 0, 2, 2]
+        assert summary["properties"] == {"start_datetime": "2020-01-01T00:00:00Z", "end_datetime": "2021-01-01T00:00:00Z"}
+        assert list(index.summaries("b")) == []
+
+
+def test_indexed_collections_written(server, tmp_path):
+    def generate(run):
+        subprocess.run(
+            [
+                sys.executable, str(ROOT / "Umbra" / "generate.py"),
+                f"--catalog={server.url}/umbra/catalog.json",
+                f"--collections={tmp_path / f'collections-{run}.json'}",
+                f"--items={tmp_path / f'items-{run}.json'}",
+                f"--index={tmp_path / 'ids.idx'}",
+                "--concurrency=4",
+            ],
+            check=True,
+            capture_output=True,
+        )
+        with open(tmp_path / f"collections-{run}.json") as f:
+            return {c["id"]: c["extent"] for c in map(json.loads, f)}
+
+    first = generate(0)
+    # every Item is in the index: none is written, the Collections still are
+    assert generate(1) == first
+    assert os.path.getsize(tmp_path / "items-1.json") == 0
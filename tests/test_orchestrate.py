@@ -0,0 +1,73 @@
+import json
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from crawler import orchestrate
+from crawler.orchestrate import Job, Source
+
+# a generator writing 3 Items and its options
+SCRIPT = """
+import json, sys, time
+
+args = dict(arg.lstrip("-").split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+time.sleep(0.2)
+with open(args["items"], "w") as f:
+    for n in range(3):
+        f.write(json.dumps({"id": str(n), "concurrency": args["concurrency"]}) + "\\n")
+sys.exit(int(args.get("exit", 0)))
+"""
+
+
+@pytest.fixture
+def script(tmp_path):
+    path = tmp_path / "generate.py"
+    path.write_text(SCRIPT)
+    return str(path)
+
+
+def test_shares_within_budget():
+    selected = [Source("a", "a.py", concurrency=50), Source("b", "b.py", concurrency=8), Source("c", "c.py", concurrency=100)]
+    for budget in range(3, 200):
+        concurrency = orchestrate.shares(selected, budget)
+        assert sum(concurrency.values()) == min(budget, 158)
+        assert all(1 <= concurrency[source.name] <= source.concurrency for source in selected)
+
+    assert orchestrate.shares(selected, 79) == {"a": 25, "b": 4, "c": 50}
+    assert orchestrate.shares(selected, 1000) == {"a": 50, "b": 8, "c": 100}
+
+
+def test_shares_below_sources():
+    with pytest.raises(click.UsageError, match="below the number of sources"):
+        orchestrate.shares([Source("a", "a.py"), Source("b", "b.py")], 1)
+
+
+def test_memory_budget(script, tmp_path):
+    jobs = [Job(Source(name, script, metrics=False, memory=300), tmp_path / name, 10, []) for name in ("a", "b")]
+    orchestrate.run(jobs, max_memory=400, interval=0.05)
+
+    # one at a time
+    assert jobs[1].started >= jobs[0].ended
+    assert [job.result()["items"] for job in jobs] == [3, 3]
+
+    jobs = [Job(Source(name, script, metrics=False, memory=100), tmp_path / name, 10, []) for name in ("c", "d")]
+    orchestrate.run(jobs, max_memory=400, interval=0.05)
+    assert jobs[1].started < jobs[0].ended
+
+
+def test_failed_source(script, tmp_path, monkeypatch):
+    monkeypatch.setattr(orchestrate, "sources", {})
+    orchestrate.register(Source("ok", script, metrics=False, concurrency=30))
+    orchestrate.register(Source("failing", script, metrics=False, concurrency=10))
+
+    result = CliRunner().invoke(orchestrate.main, [f"--output={tmp_path}", "--max-concurrency=20", "--arg=failing:--exit=3"])
+    assert result.exit_code == 1
+    assert "Failed sources: failing" in result.output
+
+    with open(tmp_path / "summary.json") as f:
+        summary = json.load(f)
+    # the other source still ran, with its share of the budget
+    assert summary["ok"]["status"] == "ok" and summary["ok"]["items"] == 3
+    assert summary["failing"]["returncode"] == 3
+    assert summary["ok"]["concurrency"] + summary["failing"]["concurrency"] == 20
@@ -0,0 +1,86 @@
+import random
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from crawler import pipeline
+from crawler.pipeline import JobEnd
+
+
+def _slow(task):
+    # completion order differs from submission order
+    time.sleep(random.random() / 1000)
+    return task
+
+
+def _check_order(records, jobs):
+    """Every job ends once, after all its results."""
+    seen = Counter()
+    ended = set()
+    for key, value in records:
+        assert key not in ended
+        if isinstance(value, JobEnd):
+            assert value.total == seen[key] == len(jobs[key])
+            ended.add(key)
+        else:
+            assert value in jobs[key]
+            seen[key] += 1
+    assert ended == set(jobs)
+
+
+def test_schedule_ends_jobs_after_their_results():
+    jobs = {f"job-{n}": [f"job-{n}/{i}" for i in range(n * 7 % 30)] for n in range(40)}
+    records = list(pipeline.schedule(_slow, iter(jobs.items()), max_workers=8, active_jobs=4))
+    _check_order(records, jobs)
+
+
+def test_schedule_interleaves_jobs():
+    jobs = {"large": list(range(100)), "small": list(range(100, 102))}
+    records = list(pipeline.schedule(lambda task: task, iter(jobs.items()), max_workers=1, active_jobs=2))
+    # the small job does not wait for the large one
+    assert records.index(("small", JobEnd(2))) < 10
+
+
+def test_track_reordered():
+    jobs = {"a": [1, 2, 3], "b": [4], "c": []}
+    records = [("a", 1), ("b", JobEnd(1)), ("c", JobEnd(0)), ("a", JobEnd(3)), ("a", 3), ("b", 4), ("a", 2)]
+    _check_order(pipeline.track(records), jobs)
+
+
+def test_stream_bounded():
+    in_flight = []
+    lock = threading.Lock()
+    pending = [0]
+
+    def _produce():
+        for n in range(200):
+            with lock:
+                pending[0] += 1
+                in_flight.append(pending[0])
+            yield n
+
+    results = []
+    for result in pipeline.stream(_slow, _produce(), max_workers=4, max_pending=8):
+        with lock:
+            pending[0] -= 1
+        results.append(result)
+
+    assert sorted(results) == list(range(200))
+    # max_pending, the result being consumed and the object waiting for a slot
+    assert max(in_flight) <= 8 + 2
+
+
+def test_stream_producer_error():
+    def _produce():
+        yield 1
+        raise ValueError("listing failed")
+
+    with pytest.raises(ValueError, match="listing failed"):
+        list(pipeline.stream(_slow, _produce(), max_workers=2))
+
+
+def test_process_workers():
+    results = list(pipeline.process(abs, range(-500, 0), processes=2, chunksize=16))
+    assert sorted(results) == list(range(1, 501))
@@ -0,0 +1,49 @@
+import json
+import subprocess
+import sys
+import time
+
+from conftest import ROOT
+from mock_server import Catalogs, MockServer
+
+
+def _ids(path):
+    with open(path) as f:
+        return [json.loads(line)["id"] for line in f]
+
+
+def _generate(catalog_url, tmp_path):
+    return subprocess.Popen(
+        [
+            sys.executable, str(ROOT / "Maxar" / "generate.py"),
+            f"--catalog={catalog_url}",
+            f"--collections={tmp_path / 'collections.json'}",
+            f"--items={tmp_path / 'items.json'}",
+            "--concurrency=4",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def test_generator_resumed_without_duplicates(tmp_path):
+    with MockServer(Catalogs(collections=2, items=200), latency=0.02) as server:
+        catalog_url = f"{server.url}/maxar/catalog.json"
+
+        # killed after the first Items are written
+        proc = _generate(catalog_url, tmp_path)
+        items_path = tmp_path / "items.json"
+        deadline = time.monotonic() + 30
+        while proc.poll() is None and time.monotonic() < deadline:
+            if items_path.exists() and items_path.stat().st_size:
+                break
+            time.sleep(0.05)
+        proc.kill()
+        proc.wait()
+
+        proc = _generate(catalog_url, tmp_path)
+        assert proc.wait(timeout=120) == 0
+
+    ids = _ids(items_path)
+    assert len(ids) == len(set(ids)) == 400
+    assert sorted(_ids(tmp_path / "collections.json")) == ["MAXAR_event_0", "MAXAR_event_1"]
@@ -0,0 +1,77 @@
+import copy
+import gzip
+import json
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+from crawler import retransform, transform
+
+BUCKET = "https://umbra-open-data-catalog.s3.amazonaws.com"
+
+
+def _item(n: int):
+    return {
+        "type": "Feature",
+        "id": f"sar/{n}",
+        "collection": "UMBRA_a",
+        "links": [{"rel": "self", "href": f"{BUCKET}/stac/{n}.json"}],
+        "properties": {"datetime": "2023-01-01T00:00:00Z"},
+        "assets": {"GEC": {"href": f"http://umbra-open-data-catalog.s3.amazonaws.com/sar/{n}/GEC.tif"}},
+    }
+
+
+@pytest.mark.parametrize("source", list(transform.sources))
+def test_idempotent(source):
+    item = transform.sources[source](_item(1), "col")
+    assert transform.sources[source](copy.deepcopy(item), "col") == item
+
+
+def test_reversible():
+    item = transform.umbra_item(_item(1), "UMBRA_a", with_s3_urls=True)
+    assert item["assets"]["GEC"]["href"] == "s3://umbra-open-data-catalog/sar/1/GEC.tif"
+    assert item["assets"]["GEC"]["alternate"]["public"]["href"] == f"{BUCKET}/sar/1/GEC.tif"
+
+    item = transform.umbra_item(item, "UMBRA_a", with_s3_urls=False)
+    assert item["assets"]["GEC"] == {"href": f"{BUCKET}/sar/1/GEC.tif"}
+    assert transform.ALTERNATE_ASSETS not in item["stac_extensions"]
+
+
+def test_read_records(tmp_path):
+    lines = [json.dumps(_item(n)).encode() for n in range(3)]
+    content = lines[0] + b"\n\n" + lines[1] + b"\n" + lines[2]
+
+    with gzip.open(tmp_path / "items.json.gz", "wb") as f:
+        f.write(content)
+    with zipfile.ZipFile(tmp_path / "items.json.zip", "w") as zf:
+        zf.writestr("items.json", content)
+
+    for name in ("items.json.gz", "items.json.zip"):
+        records = list(retransform.read_numbered_records(str(tmp_path / name)))
+        # blank lines are skipped, but counted
+        assert [lineno for lineno, _ in records] == [1, 3, 4]
+        assert [json.loads(line)["id"] for _, line in records] == ["sar/0", "sar/1", "sar/2"]
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_main(tmp_path, processes):
+    with zipfile.ZipFile(tmp_path / "items.json.zip", "w") as zf:
+        zf.writestr("items.json", "\n".join(json.dumps(transform.umbra_item(_item(n), "UMBRA_a", with_s3_urls=True)) for n in range(50)))
+
+    result = CliRunner().invoke(retransform.main, [
+        str(tmp_path / "items.json.zip"),
+        "--source=umbra",
+        "--without-s3-url",
+        "--collection-id=UMBRA_b",
+        f"--output={tmp_path / 'out.json'}",
+        f"--processes={processes}",
+        "--chunksize=7",
+    ])
+    assert result.exit_code == 0, result.output
+
+    with open(tmp_path / "out.json") as f:
+        items = [json.loads(line) for line in f]
+    assert sorted(item["id"] for item in items) == sorted(f"sar_{n}" for n in range(50))
+    assert {item["collection"] for item in items} == {"UMBRA_b"}
+    assert all(item["assets"]["GEC"]["href"].startswith(BUCKET) for item in items)
@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+import httpx
+import pytest
+from conftest import ROOT
+from mock_server import Catalogs, MockServer
+
+from crawler import search
+
+INTERVAL = "2023-01-01T00:00:00Z/2023-12-31T23:59:59Z"
+
+
+def _ids(items):
+    ids = Counter(item["id"] for item in items)
+    assert not [id for id, count in ids.items() if count > 1]
+    return set(ids)
+
+
+def test_search_pagination(server, catalogs):
+    # 100 Items per page
+    ids = _ids(search.search(f"{server.url}/earth-search/search", {"limit": 100}))
+    assert len(ids) == catalogs.search_total
+
+
+def test_time_windows():
+    windows = search.time_windows("2023-01-15T00:00:00Z/2023-03-01T00:00:00Z", "month")
+    assert windows == [
+        ("2023-01-15T00:00:00.000000Z", "2023-02-14T23:59:59.999999Z"),
+        ("2023-02-15T00:00:00.000000Z", "2023-03-01T00:00:00.000000Z"),
+    ]
+
+
+@pytest.mark.parametrize("split", [None, "month", "week"])
+def test_search_windows(server, catalogs, split):
+    failed = []
+    items = search.search_windows(
+        f"{server.url}/earth-search/search",
+        {"datetime": INTERVAL, "limit": 100},
+        split=split,
+        max_pending=10,
+        failed=failed,
+    )
+    assert len(_ids(items)) == catalogs.search_total
+    assert not failed
+
+
+def test_search_windows_failed(server):
+    failed = []
+    items = list(search.search_windows(
+        f"{server.url}/earth-search/missing",
+        {"datetime": INTERVAL},
+        split="month",
+        failed=failed,
+    ))
+    assert not items
+    assert sorted(window for window, _ in failed) == ["/".join(window) for window in search.time_windows(INTERVAL, "month")]
+    assert all(isinstance(e, httpx.HTTPStatusError) for _, e in failed)
+
+
+def test_search_windows_raise(server):
+    with pytest.raises(httpx.HTTPStatusError):
+        list(search.search_windows(f"{server.url}/earth-search/missing", {"datetime": INTERVAL}, split="month"))
+
+
+class _Failing(Catalogs):
+    """Catalogs whose search fails for February, until `fail` is cleared."""
+
+    fail = True
+
+    def search(self, body):
+        if self.fail and body.get("datetime", "").startswith("2023-02"):
+            return None
+        return super().search(body)
+
+
+def test_failed_windows_completed(tmp_path):
+    def generate():
+        return subprocess.run(
+            [
+                sys.executable, str(ROOT / "Sentinel-2-Iceland" / "generate.py"),
+                f"--api={server.url}/earth-search",
+                f"--collections={tmp_path / 'collections.json'}",
+                f"--items={tmp_path / 'items.json'}",
+                "--split=month",
+            ],
+            capture_output=True,
+            text=True,
+        )
+
+    catalogs = _Failing(items=50)
+    with MockServer(catalogs) as server:
+        result = generate()
+        assert result.returncode == 1
+        assert "1 search windows failed" in result.stderr
+        # no Collection until all its Items are written
+        assert os.path.getsize(tmp_path / "collections.json") == 0
+
+        catalogs.fail = False
+        assert generate().returncode == 0
+
+    with open(tmp_path / "collections.json") as f:
+        assert [json.loads(line)["id"] for line in f] == ["sentinel-2-iceland"]
+    with open(tmp_path / "items.json") as f:
+        assert len(_ids(map(json.loads, f))) == catalogs.search_total
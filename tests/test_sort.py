@@ -0,0 +1,65 @@
+import gzip
+import json
+import os
+import random
+
+from click.testing import CliRunner
+
+from crawler import output, sort
+from crawler.retransform import read_records
+
+
+def _item(n: int, collection: str, dt: str):
+    return {"type": "Feature", "id": f"{collection}-{n}", "collection": collection, "bbox": [n % 90, 0, n % 90 + 1, 1], "properties": {"datetime": dt}}
+
+
+def _items(count: int):
+    rng = random.Random(0)
+    for n in range(count):
+        month, day, hour = rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23)
+        yield _item(n, f"col-{n % 3}", f"2023-{month:02d}-{day:02d}T{hour:02d}:00:00Z")
+
+
+def test_external_sort_runs(tmp_path, monkeypatch):
+    # several merge passes
+    monkeypatch.setattr(sort, "MAX_FANIN", 4)
+    records = [sort.sort_record(json.dumps(item).encode()) for item in _items(2000)]
+    result = list(sort.external_sort(iter(records), str(tmp_path), max_memory=10_000))
+    assert result == sorted(records)
+    # the run files are removed
+    assert os.listdir(tmp_path) == []
+
+
+def test_datetime_utc():
+    assert sort._datetime({"datetime": "2023-01-01T01:00:00+02:00"}) < sort._datetime({"datetime": "2023-01-01T00:00:00Z"})
+    assert sort._datetime({"start_datetime": "2023-01-01T00:00:00Z", "datetime": None}) == "2023-01-01T00:00:00.000000"
+
+
+def test_sort_partitions(tmp_path):
+    items = list(_items(600))
+    path = tmp_path / "items.json.gz"
+    with gzip.open(path, "wb") as f:
+        for item in items:
+            f.write(json.dumps(item).encode() + b"\n")
+
+    result = CliRunner().invoke(sort.main, [str(path), f"--output={tmp_path / 'sorted'}", "--partition=month"])
+    assert result.exit_code == 0, result.output
+
+    with open(tmp_path / "sorted" / output.MANIFEST) as f:
+        shards = json.load(f)["shards"]
+    # one shard per collection and month
+    assert len(shards) == 3 * 12
+
+    ids = []
+    for shard in shards:
+        shard_items = [json.loads(line) for line in read_records(str(tmp_path / "sorted" / shard["path"]))]
+        assert len({(item["collection"], item["properties"]["datetime"][:7]) for item in shard_items}) == 1
+        datetimes = [item["properties"]["datetime"] for item in shard_items]
+        assert datetimes == sorted(datetimes)
+        ids.extend(item["id"] for item in shard_items)
+
+    assert sorted(ids) == sorted(item["id"] for item in items)
+
+    # the output is not sorted into twice
+    result = CliRunner().invoke(sort.main, [str(path), f"--output={tmp_path / 'sorted'}"])
+    assert result.exit_code == 2
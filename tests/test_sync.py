@@ -0,0 +1,108 @@
+import json
+import subprocess
+import sys
+
+import click
+import pytest
+from conftest import ROOT
+from mock_server import Catalogs, MockServer
+
+from crawler import fetch
+from crawler.checkpoint import Checkpoint
+from crawler.output import NdjsonWriter
+from crawler.sync import SyncState, check_outputs
+
+
+class _Changed(Catalogs):
+    """Catalogs where some Items changed upstream."""
+
+    changed = set()
+
+    def get(self, path):
+        doc = super().get(path)
+        if path in self.changed:
+            doc["properties"]["updated"] = "2025-01-01T00:00:00Z"
+        return doc
+
+
+def _generate(server, tmp_path, run):
+    return subprocess.run(
+        [
+            sys.executable, str(ROOT / "Maxar" / "generate.py"),
+            f"--catalog={server.url}/maxar/catalog.json",
+            f"--collections={tmp_path / f'collections-{run}.json'}",
+            f"--items={tmp_path / f'items-{run}.json'}",
+            f"--incremental={tmp_path / 'sync.db'}",
+            "--concurrency=4",
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+
+def _ids(path):
+    with open(path) as f:
+        return sorted(json.loads(line)["id"] for line in f)
+
+
+def test_conditional_requests(tmp_path):
+    with MockServer(Catalogs(collections=1, items=2)) as server, SyncState(str(tmp_path / "sync.db")) as state:
+        url = f"{server.url}/maxar/event-0/0.json"
+        item, validators = state.get_json(url)
+        assert validators["etag"]
+        state.save(url, validators, item)
+
+        # 304 Not Modified
+        assert state.get_json(url) == (None, {})
+
+        # catalogs keep their body
+        catalog_url = f"{server.url}/maxar/catalog.json"
+        assert state.get_text(catalog_url) == state.get_text(catalog_url)
+        assert server.stats()["requests"] == 4
+
+
+def test_only_changed_items_written(tmp_path):
+    catalogs = _Changed(collections=2, items=20)
+    with MockServer(catalogs) as server:
+        assert _generate(server, tmp_path, 0).returncode == 0
+        assert len(_ids(tmp_path / "items-0.json")) == 40
+
+        # nothing changed: no Item, no Collection
+        assert _generate(server, tmp_path, 1).returncode == 0
+        assert _ids(tmp_path / "items-1.json") == []
+        assert _ids(tmp_path / "collections-1.json") == []
+
+        catalogs.changed = {"/maxar/event-1/3.json"}
+        assert _generate(server, tmp_path, 2).returncode == 0
+        assert _ids(tmp_path / "items-2.json") == ["1_3"]
+        assert _ids(tmp_path / "collections-2.json") == ["MAXAR_event_1"]
+
+
+def test_finished_outputs_refused(tmp_path):
+    with MockServer(Catalogs(collections=1, items=5)) as server:
+        assert _generate(server, tmp_path, 0).returncode == 0
+
+        # the Items of the same outputs would not be revalidated
+        result = _generate(server, tmp_path, 0)
+        assert result.returncode == 2
+        assert "use new --items/--collections outputs" in result.stderr
+
+
+def test_interrupted_outputs_resumed(tmp_path):
+    path = str(tmp_path / "items.json")
+    with NdjsonWriter(path) as f_itm:
+        # not closed: interrupted
+        Checkpoint(f"{path}.checkpoint", f_itm).commit()
+
+    with NdjsonWriter(path) as f_itm, Checkpoint(f"{path}.checkpoint", f_itm) as checkpoint:
+        check_outputs(checkpoint)
+
+    with NdjsonWriter(path) as f_itm, Checkpoint(f"{path}.checkpoint", f_itm) as checkpoint:
+        with pytest.raises(click.UsageError, match="finished run"):
+            check_outputs(checkpoint)
+
+
+@pytest.fixture(autouse=True)
+def _pool():
+    yield
+    fetch.configure()
@@ -0,0 +1,85 @@
+import time
+from concurrent import futures
+
+import pytest
+from mock_server import Catalogs, MockServer
+
+from crawler import fetch, throttle
+
+
+def _throttle(limiter):
+    limiter.throttle(time.monotonic())
+
+
+def test_slow_start():
+    limiter = throttle.AdaptiveLimiter(16, initial=2)
+    for _ in range(4):
+        limiter.success()
+    assert limiter.limit == 6
+
+    # up to the maximum
+    for _ in range(20):
+        limiter.success()
+    assert limiter.limit == 16
+
+
+def test_decrease():
+    limiter = throttle.AdaptiveLimiter(16)
+    _throttle(limiter)
+    assert limiter.limit == 8
+
+    # then grows by 1 / limit
+    limiter.success()
+    assert limiter.limit == pytest.approx(8.125)
+
+
+def test_burst_counted_once():
+    limiter = throttle.AdaptiveLimiter(16)
+    started = time.monotonic()
+    # concurrent requests, all sent before the first decrease
+    for _ in range(8):
+        limiter.throttle(started)
+    assert limiter.limit == 8
+
+    _throttle(limiter)
+    assert limiter.limit == 4
+
+
+def test_min_limit():
+    limiter = throttle.AdaptiveLimiter(16, min_limit=2)
+    for _ in range(10):
+        _throttle(limiter)
+    assert limiter.limit == 2
+
+
+def test_retry_after_pauses():
+    limiter = throttle.AdaptiveLimiter(4)
+    limiter.throttle(time.monotonic(), pause=0.2)
+    t0 = time.monotonic()
+    with limiter:
+        pass
+    assert time.monotonic() - t0 >= 0.15
+
+
+def test_backoff():
+    for attempt in range(1, 10):
+        assert 0 <= throttle.backoff(attempt, base=0.5, cap=4) <= min(4, 0.5 * 2 ** (attempt - 1))
+
+
+@pytest.fixture
+def pool():
+    pool = fetch.configure(max_connections=16, initial_concurrency=16)
+    yield pool
+    fetch.configure()
+
+
+def test_adapts_to_server(pool):
+    # the server answers `503 SlowDown` above 4 requests in flight
+    with MockServer(Catalogs(collections=1, items=100), latency=0.01, max_concurrency=4) as server:
+        urls = [f"{server.url}/maxar/event-0/{i}.json" for i in range(100)]
+        with futures.ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = list(executor.map(lambda url: fetch.request("GET", url).status_code, urls))
+
+        assert statuses == [200] * 100
+        assert server.stats()["throttled"]
+        assert pool.limiter(server.url).limit < 16
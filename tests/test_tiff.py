@@ -0,0 +1,133 @@
+import json
+import struct
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from conftest import ROOT
+from mock_server import _dem_tile
+
+from crawler import tiff
+
+
+def _tiff(order: str, bigtiff: bool) -> bytes:
+    """A 100x50 image in UTM zone 33N, as TIFF or BigTIFF, the tag values after the IFD."""
+    tags = [
+        (256, 3, [100]),
+        (257, 3, [50]),
+        (33550, 12, [10.0, 10.0, 0.0]),
+        (33922, 12, [0.0, 0.0, 0.0, 500000.0, 4000000.0, 0.0]),
+        (34735, 3, [1, 1, 0, 2, 1024, 0, 1, 1, 3072, 0, 1, 32633]),
+    ]
+    formats = {3: "H", 12: "d"}
+    byte_order = b"II" if order == "<" else b"MM"
+    if bigtiff:
+        head = byte_order + struct.pack(f"{order}HHHQ", 43, 8, 0, 16)
+        count_fmt, entry_fmt, offset_fmt, inline = "Q", "HHQ", "Q", 8
+    else:
+        head = byte_order + struct.pack(f"{order}HI", 42, 8)
+        count_fmt, entry_fmt, offset_fmt, inline = "H", "HHI", "I", 4
+
+    entry_size = struct.calcsize(f"{order}{entry_fmt}") + inline
+    data_offset = len(head) + struct.calcsize(count_fmt) + len(tags) * entry_size + inline
+    entries, data = [], b""
+    for tag, type_id, values in tags:
+        raw = struct.pack(f"{order}{len(values)}{formats[type_id]}", *values)
+        entry = struct.pack(f"{order}{entry_fmt}", tag, type_id, len(values))
+        if len(raw) <= inline:
+            entries.append(entry + raw.ljust(inline, b"\0"))
+        else:
+            entries.append(entry + struct.pack(f"{order}{offset_fmt}", data_offset + len(data)))
+            data += raw
+
+    return head + struct.pack(f"{order}{count_fmt}", len(tags)) + b"".join(entries) + b"\0" * inline + data
+
+
+def _reader(data: bytes):
+    return lambda offset, length: data[offset:offset + length]
+
+
+def test_parse_dem_tile():
+    header = tiff.parse_header(_reader(_dem_tile(45, -2)))
+    assert header.shape == [3600, 3600]
+    assert header.epsg == 4326
+    # pixel-is-point: shifted by half a pixel up and left
+    half = 0.5 / 3600
+    assert header.bbox == pytest.approx([-2 - half, 45 + half, -1 - half, 46 + half])
+
+
+@pytest.mark.parametrize("order", ["<", ">"])
+@pytest.mark.parametrize("bigtiff", [False, True])
+def test_parse_header(order, bigtiff):
+    header = tiff.parse_header(_reader(_tiff(order, bigtiff)))
+    assert header.shape == [50, 100]
+    assert header.epsg == 32633
+    assert header.transform == (10.0, 0.0, 500000.0, 0.0, -10.0, 4000000.0)
+    assert header.bbox == [500000.0, 3999500.0, 501000.0, 4000000.0]
+
+
+def test_not_a_tiff():
+    with pytest.raises(ValueError, match="not a TIFF file"):
+        tiff.parse_header(_reader(b"\0" * 16))
+
+
+def test_read_header(server, catalogs):
+    name = catalogs._dem_names[0]
+    reader = tiff.RangeReader(f"{server.url}/copernicus-dem-30m/{name}/{name}.tif")
+    header = tiff.parse_header(reader.read)
+    assert header.shape == [3600, 3600]
+    assert header.epsg == 4326
+    # the whole header is in the first block
+    assert reader.requests == 1
+
+
+def test_read_header_small_blocks(server, catalogs):
+    name = catalogs._dem_names[0]
+    url = f"{server.url}/copernicus-dem-30m/{name}/{name}.tif"
+    assert tiff.read_header(url, block_size=16) == tiff.read_header(url)
+
+
+def test_range_ignored():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(1 << 20))
+            self.end_headers()
+            try:
+                self.wfile.write(b"\0" * (1 << 20))
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(ValueError, match="range requests are not supported"):
+            tiff.read_header(f"http://127.0.0.1:{httpd.server_address[1]}/dem.tif")
+    finally:
+        httpd.shutdown()
+
+
+def test_dem_collection(server, tmp_path):
+    subprocess.run(
+        [
+            sys.executable, str(ROOT / "Copernicus-Dem" / "generate.py"),
+            f"--prefix={server.url}/copernicus-dem-30m/",
+            f"--collections={tmp_path / 'collections.json'}",
+            f"--items={tmp_path / 'items.json'}",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    with open(tmp_path / "collections.json") as f:
+        (collection,) = map(json.loads, f)
+
+    # the published end date is kept
+    (interval,) = collection["extent"]["temporal"]["interval"]
+    assert [dt[:10] for dt in interval] == ["2022-05-09", "2022-05-10"]
+    (bbox,) = collection["extent"]["spatial"]["bbox"]
+    assert bbox[0] < -179 and bbox[3] > 89
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from crawler import validate
+
+# a local stand-in for the core Item schema
+ITEM_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "type": "object",
+    "required": ["id", "type"],
+    "properties": {"id": {"type": "string"}},
+}
+
+
+@pytest.fixture
+def schemas(tmp_path):
+    path = tmp_path / "schemas" / "schemas.stacspec.org" / "v1.0.0" / "item-spec" / "json-schema" / "item.json"
+    path.parent.mkdir(parents=True)
+    path.write_text(json.dumps(ITEM_SCHEMA))
+    return str(tmp_path / "schemas")
+
+
+@pytest.fixture
+def items(tmp_path):
+    lines = []
+    for n in range(200):
+        item = {"type": "Feature", "stac_version": "1.0.0", "id": f"item-{n}"}
+        if n % 50 == 10:
+            del item["type"]
+        lines.append(json.dumps(item))
+        if n == 5:
+            lines.append("")
+
+    path = tmp_path / "items.json"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("backend", ["fastjsonschema", "jsonschema"])
+def test_errors(schemas, backend):
+    validators = validate.Validators(validate.SchemaCache(schemas, offline=True), backend=backend)
+    assert validators.errors({"type": "Feature", "id": "a"}) == []
+    (error,) = validators.errors({"type": "Feature", "id": 1})
+    assert "schemas.stacspec.org/v1.0.0/item-spec/json-schema/item.json" in error
+
+
+def test_offline_missing_schema(tmp_path):
+    validators = validate.Validators(validate.SchemaCache(str(tmp_path), offline=True))
+    with pytest.raises(LookupError, match="not in the schema cache"):
+        validators.errors({"type": "Feature", "id": "a"})
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_report(schemas, items, processes):
+    result = CliRunner().invoke(validate.main, [items, f"--schemas={schemas}", "--offline", f"--processes={processes}", "--chunksize=7"])
+    assert result.exit_code == 1
+
+    # the line numbers count the blank line
+    reported = [line.split(":")[1] for line in result.output.splitlines() if line.startswith(items)]
+    assert reported == ["12", "62", "112", "162"]
+    assert "200 objects validated" in result.output and "4 invalid" in result.output
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_max_errors(schemas, items, processes):
+    result = CliRunner().invoke(validate.main, [items, f"--schemas={schemas}", "--offline", f"--processes={processes}", "--chunksize=1", "--max-errors=2"])
+
+    # the first invalid lines, whatever the completion order
+    reported = [line.split(":")[1] for line in result.output.splitlines() if line.startswith(items)]
+    assert reported == ["12", "62"]
+    assert "4 invalid" in result.output